@@ -8,4 +8,8 @@ Author: Lukas Krahbichler
 
 from ._client_connection import ClientConnection
 from ._server_connection import ServerConnection
-from ._client_handler import ClientHandler
+from ._client_handler import ClientHandler, AdmissionStats
+from ._client_handler_pool import ClientHandlerPool
+from ._send_queue import SendQueue, SendQueueFull
+from ._event_loop import EventLoopService
+from ._timer_wheel import TimerWheel, WheelTimer
@@ -10,30 +10,106 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, Executor
 from typing import Callable, Any, Literal
-from datetime import datetime, timedelta
-from time import sleep
+from threading import Condition
+from collections import deque
+from itertools import count
+from time import monotonic
+import warnings
+import asyncio
 import socket
-import select
 
 from ..encryption import CryptionService, CryptionMethod, CRYPTION_METHODS
-from ..protocol import BulkDict, ProtocolInterface, Protocol
-from ..protocol import CommunicationProtocol
+from ..protocol import BulkDict, ProtocolInterface, Protocol, StreamFramer, RAW_MESSAGE
+from ..protocol import CommunicationProtocol, SubscriptionRegistry, CODECS, MessageToLongError
+from ._send_queue import SendQueue, SendQueueFull
+from ._timer_wheel import WheelTimer
+from ._event_loop import EventLoopService
 
 
 ##################################################
 #                     Code                       #
 ##################################################
 
+class _ConnectionProtocol(asyncio.BufferedProtocol):
+    """
+    Forward asyncio transport events to the owning connection
+    The transport receives directly into the buffer provided by the connection (recv_into)
+    """
+    __made_callback: Callable[[asyncio.Transport], Any]
+    __buffer_callback: Callable[[int], memoryview]
+    __received_callback: Callable[[int], Any]
+    __lost_callback: Callable[[Exception | None], Any]
+    __writing_callback: Callable[[bool], Any]
+
+    def __init__(
+            self,
+            made_callback: Callable[[asyncio.Transport], Any],
+            buffer_callback: Callable[[int], memoryview],
+            received_callback: Callable[[int], Any],
+            lost_callback: Callable[[Exception | None], Any],
+            writing_callback: Callable[[bool], Any]
+    ) -> None:
+        """
+        Create transport protocol
+        :param made_callback: Callback when the transport is ready
+        :param buffer_callback: Callback to get the buffer to receive into
+        :param received_callback: Callback with the number of bytes written into the buffer
+        :param lost_callback: Callback when the transport is closed
+        :param writing_callback: Callback when the transport buffer is full (False) or drained (True)
+        """
+        self.__made_callback = made_callback
+        self.__buffer_callback = buffer_callback
+        self.__received_callback = received_callback
+        self.__lost_callback = lost_callback
+        self.__writing_callback = writing_callback
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.__made_callback(transport)
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.__buffer_callback(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        self.__received_callback(nbytes)
+
+    def connection_lost(self, exc: Exception | None) -> None:
+        self.__lost_callback(exc)
+
+    def pause_writing(self) -> None:
+        self.__writing_callback(False)
+
+    def resume_writing(self) -> None:
+        self.__writing_callback(True)
+
+
 class BaseConnection:
     """
     This represents a connection between server and client
+    All connections share one event loop (see EventLoopService), the public methods are thread-safe wrappers
     """
+    WRITE_BATCH_SIZE: int = 262144
+
     __socket: socket.socket
     __timeout: int
-    __start_time: datetime
-    __lease_time: datetime
+    __lease_time: float
+    __next_alive: float
+
+    __loop: asyncio.AbstractEventLoop
+    __transport: asyncio.Transport | None
+    __timer: WheelTimer | None
+    __wakeup_pending: bool
+    __framer: StreamFramer
+    __writable: bool
+    __reading: bool
+    __handshake_executor: Executor | None
+    __slow_consumer_timeout: float
+    __slow_consumer_timer: asyncio.TimerHandle | None
+
+    __batch_window: float | None
+    __batch_timer: asyncio.TimerHandle | None
+    __batch_pending: bool
 
     _thread_pool: ThreadPoolExecutor
     _protocol: ProtocolInterface
@@ -41,13 +117,19 @@ class BaseConnection:
     _cryption: CryptionMethod
     _new_cryption: CryptionMethod | None
 
-    _send_data: list[str]
+    _send_data: SendQueue
     _send_communication: list[Literal["key"] | CRYPTION_METHODS]
-    _respond_communication: str | None
+    _respond_communication: RAW_MESSAGE | None
 
     __STATES = Literal["open", "paused", "prewait", "waiting", "afterwait", "closed"]
     __state: __STATES | Literal["all"]
-    __state_callbacks: dict[int, tuple[__STATES, Callable[[], Any]]]
+    __state_callbacks: dict[int, tuple[__STATES | Literal["all"], Callable[[], Any]]]
+    __state_callback_ids: count
+    __state_callback_queue: deque[list[Callable[[], Any]]]
+    __state_callbacks_running: bool
+    __state_condition: Condition
+    __state_counts: dict[__STATES, int]
+    __state_waiters: list[tuple[__STATES, asyncio.Future]]
 
     def __init__(
             self,
@@ -57,7 +139,21 @@ class BaseConnection:
             add_sub_callback: ProtocolInterface.ADD_RELATED_SUB_CALLBACK_TYPE | None = None,
             del_sub_callback: ProtocolInterface.DELETE_RELATED_SUB_CALLBACK_TYPE | None = None,
             timeout: int = 10,
-            packet_size: int = 1,
+            packet_size: int = 65536,
+            batch_window: float | None = None,
+            batch_max_count: int | None = None,
+            batch_max_bytes: int | None = None,
+            request_executor: Executor | None = None,
+            stream_responses: bool = False,
+            subscription_registry: SubscriptionRegistry | None = None,
+            client_cache: bool = False,
+            cache_refresh: float | None = None,
+            delta_updates: int | None = None,
+            send_high_watermark: int = 4194304,
+            send_low_watermark: int | None = None,
+            handshake_executor: Executor | None = None,
+            max_in_flight: int | None = None,
+            slow_consumer_timeout: float | None = None
     ) -> None:
         """
         Create connection
@@ -67,6 +163,28 @@ class BaseConnection:
         :param add_sub_callback: Callback when an add subscription request comes in
         :param del_sub_callback: Callback when a delete subscription request comes in
         :param timeout: Connection leasetime if no response on ping
+        :param packet_size: Initial size of the preallocated receive buffer
+        :param batch_window: Send all data requests added within this many seconds as one bulk (None to disable)
+        :param batch_max_count: Send the batch early when it contains this many requests
+        :param batch_max_bytes: Send the batch early when its requests are approximately this big
+        :param request_executor: Run data request callbacks concurrently on this executor and answer
+                                 every request as soon as it's done (None to answer inline in the event loop)
+        :param stream_responses: Answer every data request on its own as soon as it's ready
+                                 (uses the shared callback ThreadPool if no request_executor is given)
+        :param subscription_registry: Server-wide registry the subscriptions of the other side are indexed in
+        :param client_cache: Answer data requests for subscribed request dictonaries from memory
+                             (values are fetched on subscribe and after the other side invalidates them)
+        :param cache_refresh: Seconds after which a cached value is still used but refetched in the background
+        :param delta_updates: Only send changed keys of subscription values,
+                              every delta_updates-th update is a full snapshot (None to always send full values)
+        :param send_high_watermark: Queued outgoing bytes at which send blocks and no more messages are read,
+                                    responses and subscription updates produced outside the event loop wait as well
+        :param send_low_watermark: Queued outgoing bytes at which sending and reading continue (half of high if None)
+        :param handshake_executor: Answer key exchanges (RSA key generation) on this executor
+                                   instead of inside the event loop (None to answer inline)
+        :param max_in_flight: Maximum number of data requests waiting for their response (InFlightLimitError beyond)
+        :param slow_consumer_timeout: Seconds the send queue may stay full before the other side is considered
+                                      a slow consumer and the connection is closed (timeout if None)
         """
         if timeout < 2:
             timeout = 2
@@ -75,19 +193,40 @@ class BaseConnection:
         self.__packet_size = packet_size
 
         self.__socket = conn
-        self.__socket.settimeout(0.1)
-
-        self.__start_time = datetime.now()
-        self.__lease_time = self.__start_time + timedelta(seconds=self.__timeout)
+        self.__socket.setblocking(False)
+
+        self.__loop = EventLoopService.get_loop()
+        self.__transport = None
+        self.__timer = None
+        self.__wakeup_pending = False
+        self.__framer = StreamFramer(self.__packet_size)
+        self.__writable = True
+        self.__reading = True
+        self.__handshake_executor = handshake_executor
+        self.__slow_consumer_timeout = slow_consumer_timeout if slow_consumer_timeout is not None else timeout
+        self.__slow_consumer_timer = None
+
+        self.__batch_window = batch_window
+        self.__batch_timer = None
+        self.__batch_pending = False
+
+        self.__lease_time = self.__loop.time() + self.__timeout
+        self.__next_alive = self.__loop.time() + self.__timeout / 2
 
         self.__state = "open"
         self.__state_callbacks = {}
-
-        self._send_data = []
+        self.__state_callback_ids = count()
+        self.__state_callback_queue = deque()
+        self.__state_callbacks_running = False
+        self.__state_condition = Condition()
+        self.__state_counts = {"open": 1}
+        self.__state_waiters = []
+
+        self._send_data = SendQueue(send_high_watermark, send_low_watermark)
         self._send_communication = []
         self._respond_communication = None
 
-        self._thread_pool = ThreadPoolExecutor(max_workers=2)
+        self._thread_pool = EventLoopService.get_thread_pool()
         self._cryption = CryptionService.new_cryption()
         self._new_cryption = None
 
@@ -106,10 +245,36 @@ class BaseConnection:
             thread_pool=self._thread_pool,
             add_related_sub_callback=add_sub_callback,
             delete_related_sub_callback=del_sub_callback,
-            send_sub_callback=self.send
+            send_sub_callback=self.__queue_response,
+            send_data_callback=self.__queue_response,
+            request_executor=request_executor,
+            stream_responses=stream_responses,
+            schedule_callback=self.__schedule,
+            subscription_registry=subscription_registry,
+            client_cache=client_cache,
+            cache_refresh=cache_refresh,
+            delta_updates=delta_updates,
+            batch_callback=self.__batch_request if batch_window is not None else None,
+            batch_max_count=batch_max_count,
+            batch_max_bytes=batch_max_bytes,
+            max_in_flight=max_in_flight
         )
 
-        self._thread_pool.submit(self.__loop)
+        asyncio.run_coroutine_threadsafe(self.__connect(), self.__loop)
+
+    async def __connect(self) -> None:
+        """
+        Attach the socket to the shared event loop
+        """
+        if self.__state == "closed":
+            self.__socket.close()
+            return
+
+        await self.__loop.connect_accepted_socket(
+            lambda: _ConnectionProtocol(self.__connection_made, self.__get_buffer,
+                                        self.__data_received, self.__connection_lost, self.__set_writable),
+            sock=self.__socket
+        )
 
     def __confirm_control(self) -> None:
         """
@@ -149,157 +314,438 @@ class BaseConnection:
         """
         Callback when ping request gets a response
         """
-        self.__lease_time = datetime.now() + timedelta(seconds=self.__timeout)
+        self.__lease_time = self.__loop.time() + self.__timeout
 
-    def __loop(self) -> None:
-        next_alive: datetime = datetime.now()
+    def __connection_made(self, transport: asyncio.Transport) -> None:
+        """
+        Transport is ready, start timers and flush everything queued so far
+        :param transport: Connected transport
+        """
+        if self.__state == "closed":
+            transport.close()
+            return
 
-        while True:
-            if self.__state == "open":
-                # Request ping
-                if datetime.now() > next_alive:
-                    self._send_data.append(self._protocol.control.request_alive())
-                    next_alive = datetime.now() + timedelta(seconds=self.__timeout)
-
-                # Close connection if leased
-                if datetime.now() > self.__lease_time + timedelta(seconds=2):
-                    self.__socket.close()
-                    return
+        self.__transport = transport
+        self.__arm_timer()
+        self.__process()
+
+    def __connection_lost(self, _exc: Exception | None) -> None:
+        """
+        Transport was closed by either side
+        """
+        self.__transport = None
+        if self.__timer:
+            self.__timer.cancel()
+            self.__timer = None
+
+        if self.__state != "closed":
+            self._set_state("closed")
+
+    def __set_writable(self, writable: bool) -> None:
+        """
+        The transport buffer is full or drained again, stop or continue moving messages from the send queue into it
+        :param writable: Whether the transport accepts more data
+        """
+        self.__writable = writable
+        if writable:
+            self.__process()
+
+    def __get_buffer(self, size_hint: int) -> memoryview:
+        """
+        :param size_hint: Number of bytes the transport would like to receive
+        :return: Free space in the framer for the transport to receive into
+        """
+        return self.__framer.get_buffer(size_hint)
+
+    def __data_received(self, nbytes: int) -> None:
+        """
+        Decrypt and process every complete frame as soon as it's received
+        :param nbytes: Number of bytes received into the buffer
+        """
+        self.__framer.buffer_updated(nbytes)
+
+        for frame in self.__framer.frames():
+            # Decrypt frame by frame, processing a message can change the cryption for the following ones
+            self.__process_message(self._protocol.decapsulate(self._cryption.decrypt(frame)))
+
+        self.__process()
+
+    def __process_message(self, message: BulkDict) -> None:
+        """
+        Hand a received message to its protocol
+        :param message: Decoded message
+        """
+        match message["direction"]:
+            case "request":
+                match message["kind"]:
+                    case "data":
+                        response: RAW_MESSAGE | None = self._protocol.data.process_request(message)
+                        if response is not None:
+                            self.__queue_response(response)
+                    case "sub":
+                        self._protocol.subscription.process_request(message)
+                    case "com":
+                        submitted: bool = False
+                        if self.__handshake_executor is not None:
+                            try:
+                                self.__handshake_executor.submit(self.__process_communication, message)
+                                submitted = True
+                            except RuntimeError:  # executor is shut down already (server stopped accepting)
+                                ...
+
+                        if not submitted:
+                            self._respond_communication = self._protocol.communication.process_request(message)
+                    case "con":
+                        con_res = self._protocol.control.process_request(message)
+                        if con_res:
+                            self.__queue_control(con_res)
+
+            case "response":
+                match message["kind"]:
+                    case "data":
+                        self._protocol.data.process_response(message)
+                    case "sub":
+                        self._protocol.subscription.process_response(message)
+                    case "con":
+                        self._protocol.control.process_response(message)
+                    case "com":
+                        self._protocol.communication.process_response(message)
+
+    def __process_communication(self, message: BulkDict) -> None:
+        """
+        Answer a communication request outside the event loop
+        The other side waits for the answer, so nothing else is processed for this connection meanwhile
+        :param message: Decoded communication request
+        """
+        self._respond_communication = self._protocol.communication.process_request(message)
+        self.__wakeup()
+
+    def __batch_request(self, full: bool) -> None:
+        """
+        A data request was added to the batch (called from any thread)
+        :param full: Whether the batch should be sent without waiting for the window
+        """
+        if full:
+            EventLoopService.call_soon(self.__flush_batch)
+
+        elif not self.__batch_pending:
+            self.__batch_pending = True
+            EventLoopService.call_soon(self.__arm_batch_timer)
+
+    def __arm_batch_timer(self) -> None:
+        """
+        Send the current batch when the batching window is over
+        """
+        if self.__batch_timer is None:
+            self.__batch_timer = self.__loop.call_later(self.__batch_window, self.__flush_batch)
+
+    def __flush_batch(self) -> None:
+        """
+        Send all batched data requests as one bulk
+        """
+        self.__batch_pending = False
+        if self.__batch_timer:
+            self.__batch_timer.cancel()
+            self.__batch_timer = None
+
+        message: RAW_MESSAGE | None = self._protocol.data.request_get()
+        if message is not None and self.__state != "closed":
+            self._send_data.put(message, force=True)
+            self.__process()
+
+    def _flush_requests(self) -> None:
+        """
+        Send all queued data requests as soon as possible (thread-safe)
+        Requests added until the event loop gets to it are sent in the same bulk
+        """
+        EventLoopService.call_soon(self.__flush_batch)
+
+    def __arm_timer(self) -> None:
+        """
+        (Re)schedule the next heartbeat or lease check on the shared TimerWheel
+        """
+        if self.__timer:
+            self.__timer.cancel()
+            self.__timer = None
+
+        if self.__transport is not None and self.__state == "open":
+            self.__timer = EventLoopService.get_timer_wheel().schedule(
+                min(self.__next_alive, self.__lease_time + 2), self.__on_timer
+            )
 
-            # Sending
-            to_send: list[str] = []
+    def __on_timer(self) -> None:
+        """
+        Send heartbeat and close connection if leased
+        """
+        self.__timer = None
+        if self.__state != "open":
+            return
 
-            # Pause other side
-            if self.__state == "open" and self._send_communication:
+        now: float = self.__loop.time()
+
+        # Close connection if leased
+        if now > self.__lease_time + 2:
+            self.close()
+            return
+
+        # Request ping (twice per leasetime so the other side never depends on the grace period)
+        if now >= self.__next_alive:
+            self._send_data.put(self._protocol.control.request_alive(), force=True)
+            self.__next_alive = now + self.__timeout / 2
+            self.__process()
+
+        self.__arm_timer()
+
+    def __wakeup(self) -> None:
+        """
+        Schedule a send pass in the event loop (thread-safe, coalesces multiple calls)
+        """
+        if not self.__wakeup_pending:
+            self.__wakeup_pending = True
+            EventLoopService.call_soon(self.__process)
+
+    def __process(self) -> None:
+        """
+        Run the connection state machine and send everything that is ready
+        """
+        self.__wakeup_pending = False
+        if self.__transport is None:
+            return
+
+        to_send: list[RAW_MESSAGE] = []
+
+        # Pause other side
+        if self.__state == "open" and self._send_communication:
+            self._set_state("waiting")
+            to_send = [self._protocol.communication.request_pause()]
+
+        if self.__state == "prewait" and not self._send_communication:
+            self._set_state("afterwait")
+            to_send = [self._protocol.communication.request_resume()]
+
+        # Choose what to send
+        match self.__state:
+            case "prewait":
+                send = self._send_communication.pop(0)
+                match send:
+                    case "key":
+                        to_send = [self._protocol.communication.request_key_exchange()]
+
+                    case "private_public" | "fernet" | "hybrid":
+                        self._new_cryption = CryptionService.new_cryption(send)
+                        to_send = [
+                            self._protocol.communication.request_crpytion(
+                                send,
+                                self._new_cryption.new_key()
+                            )
+                        ]
                 self._set_state("waiting")
-                to_send = [self._protocol.communication.request_pause()]
-
-            if self.__state == "prewait" and not self._send_communication:
-                self._set_state("afterwait")
-                to_send = [self._protocol.communication.request_resume()]
-
-            # Choose what to send
-            match self.__state:
-                case "prewait":
-                    send = self._send_communication.pop(0)
-                    match send:
-                        case "key":
-                            to_send = [self._protocol.communication.request_key_exchange()]
-
-                        case "private_public" | "fernet":
-                            self._new_cryption = CryptionService.new_cryption(send)
-                            to_send = [
-                                self._protocol.communication.request_crpytion(
-                                    send,
-                                    self._new_cryption.new_key()
-                                )
-                            ]
-                    self._set_state("waiting")
-
-                case "waiting" | "afterwait":
-                    ...
 
-                case "paused" | "open":
-                    if self._respond_communication:
-                        to_send.append(self._respond_communication)
-                        self._respond_communication = None
+            case "waiting" | "afterwait":
+                ...
 
-                    if self.__state == "open":
-                        to_send += self._send_data.copy()
-                        self._send_data = []
+            case "paused" | "open":
+                if self._respond_communication:
+                    to_send.append(self._respond_communication)
+                    self._respond_communication = None
 
-            # Sending
+        # Sending (every message is encrypted on its own and framed with the length of its ciphertext)
+        frames: list[bytes] = []
+        try:
             for send in to_send:
-                size_send: bytes = len(send).to_bytes(length=Protocol.max_bytes, byteorder="big")
-                self.__socket.send(self._cryption.encrypt(size_send + send.encode("UTF-8")))
-
-            if self._new_cryption:
-                self._cryption = self._new_cryption
-                self._new_cryption = None
-
-            # Receiving
-            encrypted_buffer: bytes = bytes()
-            while True:
-                ready_to_read, _, _ = select.select([self.__socket], [], [], 0)
-                if ready_to_read:
-                    recv: bytes = self.__socket.recv(self.__packet_size)
-                    if not recv:
-                        break
-                    encrypted_buffer += recv
-                else:
-                    break
-
-            # Work out inividual messages
-            message_buffer: bytes = self._cryption.decrypt(encrypted_buffer)
-            recv_messages: list[BulkDict] = []
-
-            while message_buffer != b'':
-                size_recv: int = int.from_bytes(bytes=message_buffer[:Protocol.max_bytes], byteorder="big")
-
-                message_bytes = message_buffer[Protocol.max_bytes:Protocol.max_bytes + size_recv]
-                recv_messages.append(self._protocol.decapsulate(message_bytes))
-
-                message_buffer = message_buffer[Protocol.max_bytes + size_recv:]
-
-            # Process received messages
-            for message in recv_messages:
-                match message["direction"]:
-                    case "request":
-                        match message["kind"]:
-                            case "data":
-                                self._send_data.append(self._protocol.data.process_request(message))
-                            case "sub":
-                                self._protocol.subscription.process_request(message)
-                            case "com":
-                                self._respond_communication = self._protocol.communication.process_request(message)
-                            case "con":
-                                con_res = self._protocol.control.process_request(message)
-                                if con_res:
-                                    self._send_data.append(con_res)
-
-                    case "response":
-                        match message["kind"]:
-                            case "data":
-                                self._protocol.data.process_response(message)
-                            case "sub":
-                                self._protocol.subscription.process_response(message)
-                            case "con":
-                                self._protocol.control.process_response(message)
-                            case "com":
-                                self._protocol.communication.process_response(message)
-
-            sleep(0.05)
+                self.__frame(send, frames)
+            self.__write(frames)
+
+            # Queued messages are only moved into the transport while it isn't full (pause_writing),
+            # up to WRITE_BATCH_SIZE bytes per write so a pause is noticed between the writes
+            while self.__state == "open" and self.__writable and len(self._send_data):
+                frames = []
+                batch_size: int = 0
+                while len(self._send_data) and batch_size < self.WRITE_BATCH_SIZE:
+                    batch_size += self.__frame(self._send_data.popleft(), frames)
+                self.__write(frames)
+
+        except MessageToLongError:
+            # The ciphertext of a message doesn't fit into the frame header (encryption overhead),
+            # it can't be sent without breaking the stream, so the frames before it are still written
+            # and the connection is closed (which fails all pending requests)
+            self.__write(frames)
+            self.close()
+            return
+
+        if self._new_cryption:
+            self._cryption = self._new_cryption
+            self._new_cryption = None
+
+        # Stop reading (no new requests that need responses) while the send queue is full,
+        # a key exchange has to be read though, otherwise the queue would never be drained again
+        reading: bool = not (self._send_data.full and self.__state == "open")
+        if reading != self.__reading and self.__transport is not None:
+            self.__reading = reading
+            if self.__reading:
+                self.__transport.resume_reading()
+            else:
+                self.__transport.pause_reading()
+
+        # The queue is drained below the low watermark quickly while the other side reads,
+        # if it stays full the other side doesn't read (anymore)
+        if self._send_data.full and self.__state == "open":
+            if self.__slow_consumer_timer is None:
+                self.__slow_consumer_timer = self.__loop.call_later(self.__slow_consumer_timeout,
+                                                                    self.__slow_consumer)
+        elif self.__slow_consumer_timer is not None:
+            self.__slow_consumer_timer.cancel()
+            self.__slow_consumer_timer = None
+
+    def __slow_consumer(self) -> None:
+        """
+        Close the connection if the send queue stayed full for slow_consumer_timeout seconds
+        """
+        self.__slow_consumer_timer = None
+        if self._send_data.full and self.__state == "open":
+            self.close()
+
+    def __frame(self, message: RAW_MESSAGE, frames: list[bytes]) -> int:
+        """
+        Encrypt a message and add its length header and ciphertext to the frames to write
+        :param message: Encoded message
+        :param frames: Buffers of the next write
+        :return: Number of bytes added
+        :raises MessageToLongError: If the ciphertext is too long for the frame header
+        """
+        encrypted: bytes = self._cryption.encrypt(message.encode("UTF-8") if isinstance(message, str) else message)
+        frames.append(StreamFramer.header(len(encrypted)))
+        frames.append(encrypted)
+        return Protocol.max_bytes + len(encrypted)
+
+    def __write(self, frames: list[bytes]) -> None:
+        """
+        Write all frames at once (the transport uses scatter-gather I/O where available and keeps
+        everything that wasn't written by a short write buffered until the socket is writable again)
+        :param frames: Headers and ciphertexts
+        """
+        if frames:
+            self.__transport.writelines(frames)
+
+    def __shutdown(self) -> None:
+        """
+        Stop timers and close the transport inside the event loop
+        """
+        if self.__timer:
+            self.__timer.cancel()
+            self.__timer = None
+
+        if self.__batch_timer:
+            self.__batch_timer.cancel()
+            self.__batch_timer = None
+
+        if self.__slow_consumer_timer:
+            self.__slow_consumer_timer.cancel()
+            self.__slow_consumer_timer = None
+
+        if self.__transport is not None:
+            self.__transport.close()
 
     def close(self) -> None:
         """
         Close connection
         """
         self._set_state("closed")
-        self._thread_pool.shutdown(wait=False, cancel_futures=True)
-        self.__socket.close()
+        EventLoopService.call_soon(self.__shutdown)
 
-    def send(self, message: str) -> None:
+    def send(self, message: RAW_MESSAGE, block: bool = True, timeout: float | None = None) -> None:
         """
         Send a message
-        :param message: Raw string message
+        Messages sent while the connection is paused (e.g. during a key exchange) are held back until it's open again
+        If the send queue is full the call waits until it's drained below the low watermark
+        (never inside the event loop thread, it would wait for itself)
+        :param message: Encoded message
+        :param block: Wait if the send queue is full (raise SendQueueFull otherwise)
+        :param timeout: Maximum seconds to wait (None to wait forever)
+        :raises SendQueueFull: If the send queue is full and block is False or the timeout passed
+        :raises ConnectionError: If the connection is closed
         """
-        if self.__state == "open":
-            self._send_data.append(message)
-            return
+        if self.__state == "closed":
+            raise ConnectionError("Connection is closed.")
 
-        raise ConnectionError("Connection is not in state 'open'.")
+        self._send_data.put(message, block, timeout, force=EventLoopService.in_loop_thread())
+        self.__wakeup()
+
+    async def asend(self, message: RAW_MESSAGE) -> None:
+        """
+        Send a message, awaiting (instead of blocking) while the send queue is full
+        :param message: Encoded message
+        :raises ConnectionError: If the connection is closed
+        """
+        if self.__state == "closed":
+            raise ConnectionError("Connection is closed.")
+
+        await self._send_data.aput(message)
+        self.__wakeup()
+
+    def __schedule(self, delay: float, callback: Callable[[], Any]) -> None:
+        """
+        Call a function in the event loop after a delay (thread-safe)
+        :param delay: Delay in seconds
+        :param callback: Function to call
+        """
+        EventLoopService.call_soon(self.__loop.call_later, delay, callback)
+
+    def __queue_response(self, message: RAW_MESSAGE) -> None:
+        """
+        Send a message that is produced without a caller that handles errors (responses, subscription updates)
+        Outside the event loop it waits while the send queue is full like send, so executor workers and publishers
+        are held back instead of buffering without limit. The event loop can't wait for itself, its messages are
+        always queued and reading is paused instead (no new requests) until the queue is drained.
+        The message is dropped if the connection is closed meanwhile,
+        the connection is closed if the queue stays full for slow_consumer_timeout seconds
+        :param message: Encoded message
+        """
+        if self.__state != "closed":
+            try:
+                if EventLoopService.in_loop_thread():
+                    self._send_data.put(message, force=True)
+                else:
+                    self._send_data.put(message, timeout=self.__slow_consumer_timeout)
+            except SendQueueFull:  # the other side didn't read for slow_consumer_timeout seconds
+                self.close()
+                return
+            except ConnectionError:
+                return
+            self.__wakeup()
+
+    def __queue_control(self, message: RAW_MESSAGE) -> None:
+        """
+        Send a control message (always queued, even if the send queue is full)
+        :param message: Encoded message
+        """
+        if self.__state != "closed":
+            try:
+                self._send_data.put(message, force=True)
+            except ConnectionError:
+                return
+            self.__wakeup()
 
     def send_key_exchange(self) -> None:
         """
         Send key exchange message
         """
         self._send_communication.append("key")
+        self.__wakeup()
+
+    def send_codec_change(self, codec: CODECS) -> None:
+        """
+        Ask the other side to encode messages with another codec (json is kept if it's not supported there)
+        :param codec: Name of the codec
+        """
+        self.send(self._protocol.communication.request_codec(codec))
 
     def send_cryption_change(self, cryption: CRYPTION_METHODS) -> None:
         """
         Send cryption change message
         """
         self._send_communication.append(cryption)
+        self.__wakeup()
 
     @property
     def state(self) -> Literal["init", "open", "closed"]:
@@ -310,47 +756,145 @@ class BaseConnection:
 
     def _set_state(self, value: __STATES) -> None:
         """
-        Set current state and go through callbacks
+        Set current state, wake up everyone waiting for it and go through callbacks
+        The callbacks run on the callback ThreadPool (in order of registration), not on the thread that changed the state.
+        They run one state change after another, so callbacks of a later state never run before or during earlier ones
+        A closed connection stays closed, later changes (e.g. a second close) are ignored
         :param value: Value to set to
         """
-        self.__state = value
+        with self.__state_condition:
+            if self.__state == "closed":
+                return
+
+            self.__state = value
+            self.__state_counts[value] = self.__state_counts.get(value, 0) + 1
+            self.__state_condition.notify_all()
+
+            callbacks: list[Callable[[], Any]] = [
+                callback for state, callback in self.__state_callbacks.values() if state in (value, "all")
+            ]
+            reached: list[asyncio.Future] = [waiter for state, waiter in self.__state_waiters if state == value]
+            self.__state_waiters = [entry for entry in self.__state_waiters if entry[0] != value]
+
+            start: bool = False
+            if callbacks:
+                self.__state_callback_queue.append(callbacks)
+                start = not self.__state_callbacks_running
+                self.__state_callbacks_running = True
+
+        for waiter in reached:
+            waiter.get_loop().call_soon_threadsafe(lambda done=waiter: done.done() or done.set_result(None))
+
+        if start:
+            try:
+                self._thread_pool.submit(self.__run_callbacks)
+            except RuntimeError:  # interpreter is shutting down
+                self.__run_callbacks()
+
+        if value == "closed":
+            self._protocol.subscription.clear()
+            self._protocol.data.fail_pending(ConnectionError("Connection is closed."))
+            self._send_data.close()
+
+        if value == "open":
+            self.__lease_time = self.__loop.time() + self.__timeout + 1
+            EventLoopService.call_soon(self.__arm_timer)
+
+    def __run_callbacks(self) -> None:
+        """
+        Run the callbacks of all queued state changes one after another (one task per connection)
+        """
+        while True:
+            with self.__state_condition:
+                if not self.__state_callback_queue:
+                    self.__state_callbacks_running = False
+                    return
+                callbacks: list[Callable[[], Any]] = self.__state_callback_queue.popleft()
 
-        for cb_id, (state, callback) in self.__state_callbacks.items():
-            if state == self.__state:
-                callback()
+            for callback in callbacks:
+                try:
+                    callback()
+                except Exception:  # a failing callback doesn't hold back the others
+                    ...
+
+    def wait_for_state(self, state: __STATES, timeout: float | None = None) -> bool:
+        """
+        Wait until certain state is reached (also returns if the state was only passed through meanwhile)
+        :param state: State to wait for
+        :param timeout: Maximum seconds to wait (None to wait forever)
+        :return: Whether the state was reached
+        """
+        deadline: float | None = None if timeout is None else monotonic() + timeout
 
-        if self.__state == "open":
-            self.__lease_time = datetime.now() + timedelta(seconds=self.__timeout+1)
+        with self.__state_condition:
+            reached: int = self.__state_counts.get(state, 0)
 
-    def join_state(self, state: __STATES, _time_delta: float | None = 0.1) -> None:
+            while self.__state != state and self.__state_counts.get(state, 0) == reached:
+                remaining: float | None = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.__state_condition.wait(remaining)
+
+            return True
+
+    async def await_state(self, state: __STATES, timeout: float | None = None) -> bool:
+        """
+        Await until certain state is reached without blocking the running event loop
+        :param state: State to wait for
+        :param timeout: Maximum seconds to wait (None to wait forever)
+        :return: Whether the state was reached
         """
-        Wait until certain state is reached
+        with self.__state_condition:
+            if self.__state == state:
+                return True
+
+            waiter: asyncio.Future = asyncio.get_running_loop().create_future()
+            entry: tuple[str, asyncio.Future] = (state, waiter)
+            self.__state_waiters.append(entry)
+
+        try:
+            await asyncio.wait_for(waiter, timeout)
+            return True
+        except asyncio.TimeoutError:
+            with self.__state_condition:
+                if entry in self.__state_waiters:
+                    self.__state_waiters.remove(entry)
+            return False
+
+    def join_state(self, state: __STATES, _time_delta: float | None = None) -> None:
+        """
+        Wait until certain state is reached (see wait_for_state to wait with a timeout)
         :param state: State to wait for
-        :param _time_delta: Time interval for checking
+        :param _time_delta: Deprecated and ignored (the state change wakes the waiting thread up directly)
         """
-        while self.__state != state:
-            sleep(_time_delta)
+        if _time_delta is not None:
+            warnings.warn("join_state's _time_delta is deprecated and ignored", DeprecationWarning, stacklevel=2)
+
+        self.wait_for_state(state)
 
     def callback_state(self, state: __STATES | Literal["all"], callback: Callable[[], Any]) -> int:
         """
         Get a callback when certain state is reached
-        :param state: On what state
-        :param callback: Function to call
+        :param state: On what state ("all" for every state change)
+        :param callback: Function to call (on the callback ThreadPool)
         :return: Callback ID
         """
-        num: int = max(self.__state_callbacks.keys()) if self.__state_callbacks else 0
-        self.__state_callbacks[num] = (state, callback)
-        return num
+        with self.__state_condition:
+            num: int = next(self.__state_callback_ids)
+            self.__state_callbacks[num] = (state, callback)
+            return num
 
     def remove_callback_state(self, callback_id: int) -> None:
         """
         Remove certain state callback
         :param callback_id: ID of the callback
         """
-        self.__state_callbacks.pop(callback_id)
+        with self.__state_condition:
+            self.__state_callbacks.pop(callback_id)
 
     def remove_all_callbacks(self) -> None:
         """
         Removes all current callbacks
         """
-        self.__state_callbacks = {}
+        with self.__state_condition:
+            self.__state_callbacks = {}
@@ -10,11 +10,15 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
-from typing import Callable, Any
+from typing import Iterable, Callable, Any
+from concurrent.futures import Future
+import asyncio
 import socket
 
 from ._base_connection import BaseConnection
-from ..protocol import ProtocolInterface
+from ._send_queue import SendQueueFull
+from ._event_loop import EventLoopService
+from ..protocol import ProtocolInterface, DATAUNIT
 
 
 ##################################################
@@ -25,12 +29,22 @@ class ClientConnection(BaseConnection):
     """
     Connection from the client to the server
     """
+    __batched: bool
+
     def __init__(
             self,
             ip: str,
             port: int,
             request_callback: ProtocolInterface.REQUEST_CALLBACK_TYPE,
-            rework_callback: ProtocolInterface.REWORK_CALLBACK_TYPE
+            rework_callback: ProtocolInterface.REWORK_CALLBACK_TYPE,
+            client_cache: bool = False,
+            cache_refresh: float | None = None,
+            send_high_watermark: int = 4194304,
+            send_low_watermark: int | None = None,
+            batch_window: float | None = None,
+            batch_max_count: int | None = None,
+            batch_max_bytes: int | None = None,
+            max_in_flight: int | None = None
     ) -> None:
         """
         Connect to server
@@ -38,28 +52,136 @@ class ClientConnection(BaseConnection):
         :param port: Port to connect
         :param request_callback: Callback to get information for data requests
         :param rework_callback: Callback to rework result before setting to future
+        :param client_cache: Answer data requests for subscribed request dictonaries from memory
+        :param cache_refresh: Seconds after which a cached value is refetched in the background
+        :param send_high_watermark: Queued outgoing bytes at which send blocks and reading is paused
+        :param send_low_watermark: Queued outgoing bytes at which both continue (half of high if None)
+        :param batch_window: Collect requests for this many seconds before sending them as one bulk
+                             (None to send them as soon as the event loop gets to it)
+        :param batch_max_count: Send the batch early when it contains this many requests
+        :param batch_max_bytes: Send the batch early when its requests are approximately this big
+        :param max_in_flight: Maximum number of requests waiting for their response (no practical limit if None)
         """
+        self.__batched = batch_window is not None
+
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.connect((ip, port))
 
-        super().__init__(conn=sock, request_callback=request_callback, rework_callback=rework_callback)
+        super().__init__(conn=sock, request_callback=request_callback, rework_callback=rework_callback,
+                         client_cache=client_cache, cache_refresh=cache_refresh,
+                         send_high_watermark=send_high_watermark, send_low_watermark=send_low_watermark,
+                         batch_window=batch_window, batch_max_count=batch_max_count, batch_max_bytes=batch_max_bytes,
+                         max_in_flight=max_in_flight)
 
         self._state = "open"
         self.send_key_exchange()
         self.send_key_exchange()
 
+    def request(
+            self,
+            message: DATAUNIT,
+            timeout: float | None = None,
+            block: bool = True,
+            block_timeout: float | None = None
+    ) -> Future:
+        """
+        Send a data request without waiting for the answer
+        Any number of requests can be in flight at the same time, requests issued close together are sent as one bulk
+        If the send queue is full the call waits until it's drained below the low watermark (like send)
+        :param message: Request
+        :param timeout: Seconds until the request fails with DeadlineExceededError (None for no deadline)
+        :param block: Wait if the send queue is full (raise SendQueueFull otherwise)
+        :param block_timeout: Maximum seconds to wait for the send queue (None to wait forever)
+        :return: Future to receive the (reworked) result, RequestError if the other side failed
+        :raises InFlightLimitError: If max_in_flight requests are already waiting for their response
+        :raises SendQueueFull: If the send queue is full and block is False or the block_timeout passed
+        :raises ConnectionError: If the connection is closed
+        """
+        return self.request_many([message], timeout, block, block_timeout)[0]
+
+    def request_many(
+            self,
+            messages: Iterable[DATAUNIT],
+            timeout: float | None = None,
+            block: bool = True,
+            block_timeout: float | None = None
+    ) -> list[Future]:
+        """
+        Send several data requests in one bulk without waiting for the answers
+        Either all requests are sent or none (if they don't fit into max_in_flight)
+        :param messages: Requests
+        :param timeout: Seconds until each request fails with DeadlineExceededError (None for no deadline)
+        :param block: Wait if the send queue is full (raise SendQueueFull otherwise)
+        :param block_timeout: Maximum seconds to wait for the send queue (None to wait forever)
+        :return: Futures to receive the results in the same order
+        :raises InFlightLimitError: If the requests don't fit into max_in_flight anymore
+        :raises SendQueueFull: If the send queue is full and block is False or the block_timeout passed
+        :raises ConnectionError: If the connection is closed
+        """
+        if self.state == "closed":
+            raise ConnectionError("Connection is closed.")
+
+        messages = list(messages)
+
+        # inside the event loop the queue can't be drained while waiting
+        if not EventLoopService.in_loop_thread():
+            self._send_data.wait_space(block, block_timeout)
+
+        futures: list[Future] = self._protocol.data.request_add_many(messages, timeout)
+        if not self.__batched:
+            self._flush_requests()
+        return futures
+
+    async def arequest(self, message: DATAUNIT, timeout: float | None = None) -> Any:
+        """
+        Send a data request and await the answer (awaits instead of blocking while the send queue is full)
+        :param message: Request
+        :param timeout: Seconds until the request fails with DeadlineExceededError (None for no deadline)
+        :return: (Reworked) result
+        :raises RequestError: If the other side failed to answer the request
+        :raises ConnectionError: If the connection is closed
+        """
+        while True:
+            await self._send_data.await_space()
+            try:
+                future: Future = self.request(message, timeout, block=False)
+                break
+            except SendQueueFull:
+                continue
+
+        return await asyncio.wrap_future(future)
+
+    @property
+    def max_in_flight(self) -> int:
+        """
+        :return: Maximum number of requests waiting for their response at the same time
+        """
+        return self._protocol.data.max_in_flight
+
+    @property
+    def in_flight(self) -> int:
+        """
+        :return: Number of requests waiting for their response
+        """
+        return self._protocol.data.in_flight
+
     def add_subscription(
             self,
             callback: Callable[[Any], Any],
-            request_dict: dict[str | int | float | bool | None, any]
+            request_dict: dict[str | int | float | bool | None, any],
+            max_rate: float | None = None,
+            window: float | None = None
     ) -> int:
         """
         Send add subscription request
         :param callback: Callback when value is updated
         :param request_dict: Same dictonary as a normal request to use
+        :param max_rate: Maximum number of updates per second, the server only sends the newest value
+        :param window: Only get the newest value at the end of a window of this many seconds
         :return: ID of the subscripton
         """
-        sub_id, message = self._protocol.subscription.add_subscription(callback, request_dict)
+        sub_id, message = self._protocol.subscription.add_subscription(callback, request_dict,
+                                                                       max_rate=max_rate, window=window)
         self.send(message)
 
         return sub_id
@@ -10,28 +10,59 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
-from concurrent.futures import ThreadPoolExecutor
-from time import sleep
+from concurrent.futures import ThreadPoolExecutor, Executor
+from typing import TypedDict
+from threading import Lock
+from itertools import count
+import asyncio
+import struct
 import socket
 
-from ..protocol import ProtocolInterface, DATAUNIT
+from ..protocol import ProtocolInterface, SubscriptionRegistry, BroadcastStats, DATAUNIT
 from ._server_connection import ServerConnection
+from ._event_loop import EventLoopService
 
 
 ##################################################
 #                     Code                       #
 ##################################################
 
+class AdmissionStats(TypedDict):
+    accepted: int
+    rejected: int
+    handshaking: int
+    clients: int
+
+
 class ClientHandler(socket.socket):
     """
     Serverside ClientHandler
     """
-    __clients: list[ServerConnection]
+    __clients: dict[int, ServerConnection]
+    __peers: dict[tuple[str, int], int]
+    __client_ids: count
+    __registry: SubscriptionRegistry
 
     __request_callback: ProtocolInterface.REQUEST_CALLBACK_TYPE
     __rework_callback: ProtocolInterface.REWORK_CALLBACK_TYPE
     __add_sub_callback: ProtocolInterface.ADD_RELATED_SUB_CALLBACK_TYPE
     __del_sub_callback: ProtocolInterface.DELETE_RELATED_SUB_CALLBACK_TYPE
+    __request_executor: Executor | None
+    __stream_responses: bool
+    __delta_updates: int | None
+    __send_watermarks: tuple[int, int | None]
+    __slow_consumer_timeout: float | None
+
+    __handshake_executor: Executor
+    __own_handshake_executor: bool
+    __max_handshakes: int | None
+    __handshake_timeout: float | None
+    __handshaking: int
+    __accepted: int
+    __rejected: int
+    __lock: Lock
+
+    __loop: asyncio.AbstractEventLoop
 
     def __init__(
             self,
@@ -40,6 +71,17 @@ class ClientHandler(socket.socket):
             add_sub_callback: ProtocolInterface.ADD_RELATED_SUB_CALLBACK_TYPE,
             del_sub_callback: ProtocolInterface.DELETE_RELATED_SUB_CALLBACK_TYPE,
             port: int | None = 4205,
+            request_executor: Executor | None = None,
+            stream_responses: bool = False,
+            delta_updates: int | None = None,
+            send_high_watermark: int = 4194304,
+            send_low_watermark: int | None = None,
+            reuse_port: bool = False,
+            backlog: int = 128,
+            max_handshakes: int | None = 64,
+            handshake_executor: Executor | None = None,
+            slow_consumer_timeout: float | None = None,
+            handshake_timeout: float | None = 30.0
     ) -> None:
         """
         Create server with client accept handler
@@ -47,43 +89,233 @@ class ClientHandler(socket.socket):
         :param add_sub_callback: Callback when an add subscription request comes in
         :param del_sub_callback: Callback when a delete subscription request comes in
         :param port: Port to open the server on
+        :param request_executor: Executor shared by all clients to run request callbacks concurrently
+                                 (ThreadPoolExecutor for blocking I/O, ProcessPoolExecutor for CPU-bound work)
+        :param stream_responses: Answer every request as soon as it's ready instead of one response per bulk
+        :param delta_updates: Send only changed keys of subscription values (dictonaries),
+                              every delta_updates-th update is a full snapshot (None to always send full values)
+        :param send_high_watermark: Queued outgoing bytes per client at which sending blocks and reading is paused,
+                                    responses and updates wait for the queue beyond it
+        :param send_low_watermark: Queued outgoing bytes at which both continue (half of high if None)
+        :param reuse_port: Let several handlers (processes) listen on the same port, the kernel spreads
+                           new connections over them (SO_REUSEPORT)
+        :param backlog: Number of connections the OS queues until they are accepted
+        :param max_handshakes: Maximum number of clients in their first key exchange at the same time,
+                               more clients are rejected right away (None for no limit)
+        :param handshake_executor: Executor to set up clients and answer their key exchanges on
+                                   (a ThreadPool of 4 workers that is shut down by close if None)
+        :param slow_consumer_timeout: Seconds the send queue of a client may stay full before it's disconnected
+                                      (connection timeout if None)
+        :param handshake_timeout: Seconds a client has to finish its first key exchange, it's disconnected
+                                  and its handshake slot is freed otherwise (None for no limit)
+        :raises OSError: If reuse_port is set and the platform doesn't support SO_REUSEPORT
         """
         super().__init__(socket.AF_INET, socket.SOCK_STREAM)
+        if reuse_port:
+            if not hasattr(socket, "SO_REUSEPORT"):
+                super().close()
+                raise OSError("SO_REUSEPORT is not supported on this platform")
+            self.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
         self.bind(("0.0.0.0", port))
-        self.listen()
+        self.listen(backlog)
+        self.setblocking(False)
 
         self.__request_callback = request_callback
         self.__rework_callback = rework_callback
         self.__add_sub_callback = add_sub_callback
         self.__del_sub_callback = del_sub_callback
+        self.__request_executor = request_executor
+        self.__stream_responses = stream_responses
+        self.__delta_updates = delta_updates
+        self.__send_watermarks = (send_high_watermark, send_low_watermark)
+        self.__slow_consumer_timeout = slow_consumer_timeout
 
-        self.__clients = []
-        self.__threadpool = ThreadPoolExecutor(max_workers=1)
+        self.__own_handshake_executor = handshake_executor is None
+        if handshake_executor is None:
+            handshake_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="fridex-handshake")
+        self.__handshake_executor = handshake_executor
+        self.__max_handshakes = max_handshakes
+        self.__handshake_timeout = handshake_timeout
+        self.__handshaking = 0
+        self.__accepted = 0
+        self.__rejected = 0
+        self.__lock = Lock()
 
-        self.__threadpool.submit(self.__accept_clients)
+        self.__clients = {}
+        self.__peers = {}
+        self.__client_ids = count()
+        self.__registry = SubscriptionRegistry()
 
-    __threadpool: ThreadPoolExecutor
+        self.__loop = EventLoopService.get_loop()
+        EventLoopService.call_soon(self.__loop.add_reader, self.fileno(), self.__accept_clients)
 
     def __accept_clients(self) -> None:
         """
-        Loop accept client connections
+        Accept all pending client connections (called by the event loop when the socket is readable)
         """
         while True:
-            sock, address = self.accept()
+            try:
+                sock, address = self.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+
+            with self.__lock:
+                admitted: bool = self.__max_handshakes is None or self.__handshaking < self.__max_handshakes
+                if admitted:
+                    self.__handshaking += 1
+                    self.__accepted += 1
+                else:
+                    self.__rejected += 1
+
+            if not admitted:
+                # reset instead of a normal close, the client fails immediately and nothing lingers in TIME_WAIT
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                sock.close()
+                continue
+
+            self.__handshake_executor.submit(self.__add_client, sock, address)
+
+    def __add_client(self, sock: socket.socket, address: tuple[str, int]) -> None:
+        """
+        Set up the connection of an accepted client (runs on the handshake executor)
+        The client is registered until its connection is closed
+        :param sock: Accepted socket
+        :param address: Address of the client
+        """
+        try:
+            client: ServerConnection = ServerConnection(sock,
+                                                        request_callback=self.__request_callback,
+                                                        rework_callback=self.__rework_callback,
+                                                        add_sub_callback=self.__add_sub_callback,
+                                                        del_sub_callback=self.__del_sub_callback,
+                                                        request_executor=self.__request_executor,
+                                                        stream_responses=self.__stream_responses,
+                                                        subscription_registry=self.__registry,
+                                                        delta_updates=self.__delta_updates,
+                                                        send_high_watermark=self.__send_watermarks[0],
+                                                        send_low_watermark=self.__send_watermarks[1],
+                                                        handshake_executor=self.__handshake_executor,
+                                                        handshake_callback=self.__handshake_done,
+                                                        slow_consumer_timeout=self.__slow_consumer_timeout,
+                                                        handshake_timeout=self.__handshake_timeout)
+        except Exception:
+            sock.close()
+            self.__handshake_done()
+            raise
+
+        client_id: int = next(self.__client_ids)
+        with self.__lock:
+            self.__clients[client_id] = client
+            self.__peers[address] = client_id
 
-            self.__clients.append(ServerConnection(sock,
-                                                   request_callback=self.__request_callback,
-                                                   rework_callback=self.__rework_callback,
-                                                   add_sub_callback=self.__add_sub_callback,
-                                                   del_sub_callback=self.__del_sub_callback))
-            sleep(0.1)
+        client.callback_state("closed", lambda: self.__remove_client(client_id, address))
+        if client.state == "closed":
+            self.__remove_client(client_id, address)
 
-    def provide_data(self, req_dict: DATAUNIT, value: DATAUNIT) -> None:
+    def __remove_client(self, client_id: int, address: tuple[str, int]) -> None:
+        """
+        Forget a closed client
+        :param client_id: ID of the client
+        :param address: Address of the client
+        """
+        with self.__lock:
+            self.__clients.pop(client_id, None)
+            if self.__peers.get(address) == client_id:
+                self.__peers.pop(address)
+
+    def __handshake_done(self) -> None:
+        """
+        A client finished its first key exchange (or closed before), free its handshake slot
+        """
+        with self.__lock:
+            self.__handshaking -= 1
+
+    def __close_server(self) -> None:
+        """
+        Stop accepting, close the listening socket and shut the own handshake executor down inside the event loop
+        (connected clients answer their key exchanges in the event loop from now on)
+        """
+        self.__loop.remove_reader(self.fileno())
+        super().close()
+
+        if self.__own_handshake_executor:
+            self.__handshake_executor.shutdown(wait=False)
+
+    def close(self) -> None:
+        """
+        Stop accepting new clients and close the server socket
+        """
+        if self.fileno() != -1:
+            EventLoopService.call_soon(self.__close_server)
+
+    def provide_data(self, req_dict: DATAUNIT, value: DATAUNIT) -> BroadcastStats:
         """
         Provide data for subscription to all clients
+        Only clients that subscribed the request dictonary are touched and the value is serialized only once
         :param req_dict: Same dictonary as a normal request to use
         :param value: New value
+        :return: Reached clients and subscriptions, number of serializations and how long the fan-out took
+        """
+        return self.__registry.publish(req_dict, value)
+
+    def invalidate(self, req_dict: DATAUNIT) -> BroadcastStats:
+        """
+        Tell all clients that subscribed the request dictonary that their cached value is outdated
+        (clients with client cache fetch it again in the background)
+        :param req_dict: Same dictonary as a normal request to use
+        :return: Reached clients and subscriptions and how long the fan-out took
+        """
+        return self.__registry.invalidate(req_dict)
+
+    def stats(self) -> AdmissionStats:
+        """
+        :return: Accepted and rejected clients since start, clients in their handshake and connected clients
+        """
+        with self.__lock:
+            return {
+                "accepted": self.__accepted,
+                "rejected": self.__rejected,
+                "handshaking": self.__handshaking,
+                "clients": len(self.__clients)
+            }
+
+    def get_client(self, client_id: int) -> ServerConnection | None:
+        """
+        :param client_id: ID of the client (in order of acceptance)
+        :return: Connection of the client if it's still open
+        """
+        with self.__lock:
+            return self.__clients.get(client_id)
+
+    def get_client_by_peer(self, address: tuple[str, int]) -> ServerConnection | None:
+        """
+        :param address: IP and port of the client
+        :return: Connection of the client if it's still open
+        """
+        with self.__lock:
+            client_id: int | None = self.__peers.get(address)
+            return None if client_id is None else self.__clients.get(client_id)
+
+    @property
+    def clients(self) -> dict[int, ServerConnection]:
+        """
+        :return: Connections of all open clients by their ID
+        """
+        with self.__lock:
+            return dict(self.__clients)
+
+    @property
+    def client_count(self) -> int:
+        """
+        :return: Number of open clients
+        """
+        return len(self.__clients)
+
+    @property
+    def subscriptions(self) -> SubscriptionRegistry:
+        """
+        :return: Registry of the subscriptions of all clients
         """
-        for client in self.__clients:
-            client.provide_data(req_dict, value)
+        return self.__registry
 
@@ -0,0 +1,233 @@
+"""
+fridex/connection/communication/_client_handler_pool.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from multiprocessing.connection import Connection
+from multiprocessing.process import BaseProcess
+from typing import TypedDict, Any
+from threading import Lock
+import multiprocessing
+import os
+
+from ..protocol import ProtocolInterface, DATAUNIT
+from ._client_handler import ClientHandler
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class HandlerOptions(TypedDict):
+    stream_responses: bool
+    delta_updates: int | None
+    send_high_watermark: int
+    send_low_watermark: int | None
+    backlog: int
+    max_handshakes: int | None
+    slow_consumer_timeout: float | None
+    handshake_timeout: float | None
+
+
+def _run_worker(
+        request_callback: ProtocolInterface.REQUEST_CALLBACK_TYPE,
+        rework_callback: ProtocolInterface.REWORK_CALLBACK_TYPE,
+        add_sub_callback: ProtocolInterface.ADD_RELATED_SUB_CALLBACK_TYPE,
+        del_sub_callback: ProtocolInterface.DELETE_RELATED_SUB_CALLBACK_TYPE,
+        port: int,
+        options: HandlerOptions,
+        commands: Connection
+) -> None:
+    """
+    Worker process target, serves its share of the clients until the pool is closed
+    The subscriptions of the clients are kept in the ClientHandler of the worker,
+    broadcasts of the pool come in over the command pipe
+    :param request_callback: Callback to get information for data requests
+    :param rework_callback: Callback to rework result before setting to future
+    :param add_sub_callback: Callback when an add subscription request comes in
+    :param del_sub_callback: Callback when a delete subscription request comes in
+    :param port: Port shared by all workers
+    :param options: Options for the ClientHandler
+    :param commands: Pipe to the pool (gets None or the startup error once the handler listens)
+    """
+    try:
+        handler: ClientHandler = ClientHandler(request_callback, rework_callback, add_sub_callback,
+                                               del_sub_callback, port=port, reuse_port=True, **options)
+    except Exception as error:
+        commands.send(error)
+        return
+
+    commands.send(None)
+
+    while True:
+        try:
+            command, args = commands.recv()
+        except (EOFError, OSError):
+            break
+
+        match command:
+            case "provide":
+                handler.provide_data(*args)
+            case "invalidate":
+                handler.invalidate(*args)
+            case "close":
+                break
+
+    handler.close()
+
+
+class ClientHandlerPool:
+    """
+    Serverside ClientHandler running in several worker processes to use all cores
+    All workers listen on the same port (SO_REUSEPORT) and every client is served by one of them,
+    so callbacks have to be picklable (module level functions) and run in the worker processes.
+    Broadcasts (provide_data, invalidate) are relayed to all workers, each one only reaches its own subscribers.
+    Scripts using the pool need an if __name__ == "__main__" guard because the workers are spawned.
+    """
+    __processes: list[BaseProcess]
+    __commands: list[Connection]
+    __lock: Lock
+
+    def __init__(
+            self,
+            request_callback: ProtocolInterface.REQUEST_CALLBACK_TYPE,
+            rework_callback: ProtocolInterface.REWORK_CALLBACK_TYPE,
+            add_sub_callback: ProtocolInterface.ADD_RELATED_SUB_CALLBACK_TYPE,
+            del_sub_callback: ProtocolInterface.DELETE_RELATED_SUB_CALLBACK_TYPE,
+            port: int = 4205,
+            workers: int | None = None,
+            stream_responses: bool = False,
+            delta_updates: int | None = None,
+            send_high_watermark: int = 4194304,
+            send_low_watermark: int | None = None,
+            backlog: int = 128,
+            max_handshakes: int | None = 64,
+            slow_consumer_timeout: float | None = None,
+            handshake_timeout: float | None = 30.0,
+            start_timeout: float = 30.0
+    ) -> None:
+        """
+        Start worker processes and wait until all of them listen
+        :param request_callback: Callback to get information for data requests
+        :param rework_callback: Callback to rework result before setting to future
+        :param add_sub_callback: Callback when an add subscription request comes in
+        :param del_sub_callback: Callback when a delete subscription request comes in
+        :param port: Port to open the server on
+        :param workers: Number of worker processes (number of cores if None)
+        :param stream_responses: Answer every request as soon as it's ready instead of one response per bulk
+        :param delta_updates: Send only changed keys of subscription values (dictonaries),
+                              every delta_updates-th update is a full snapshot (None to always send full values)
+        :param send_high_watermark: Queued outgoing bytes per client at which sending blocks and reading is paused,
+                                    responses and updates wait for the queue beyond it
+        :param send_low_watermark: Queued outgoing bytes at which both continue (half of high if None)
+        :param backlog: Number of connections the OS queues per worker until they are accepted
+        :param max_handshakes: Maximum number of clients per worker in their first key exchange at the same time
+        :param slow_consumer_timeout: Seconds the send queue of a client may stay full before it's disconnected
+                                      (connection timeout if None)
+        :param handshake_timeout: Seconds a client has to finish its first key exchange (None for no limit)
+        :param start_timeout: Seconds to wait for every worker to listen
+        :raises OSError: If a worker couldn't open the port (e.g. SO_REUSEPORT isn't supported)
+        :raises TimeoutError: If a worker didn't start in time
+        """
+        options: HandlerOptions = {
+            "stream_responses": stream_responses,
+            "delta_updates": delta_updates,
+            "send_high_watermark": send_high_watermark,
+            "send_low_watermark": send_low_watermark,
+            "backlog": backlog,
+            "max_handshakes": max_handshakes,
+            "slow_consumer_timeout": slow_consumer_timeout,
+            "handshake_timeout": handshake_timeout
+        }
+
+        context = multiprocessing.get_context("spawn")
+        self.__processes = []
+        self.__commands = []
+        self.__lock = Lock()
+
+        for _ in range(workers or os.cpu_count() or 1):
+            parent, child = context.Pipe()
+            process: BaseProcess = context.Process(
+                target=_run_worker,
+                args=(request_callback, rework_callback, add_sub_callback, del_sub_callback, port, options, child),
+                name="fridex-worker",
+                daemon=True
+            )
+            process.start()
+            child.close()
+
+            self.__processes.append(process)
+            self.__commands.append(parent)
+
+        for commands in self.__commands:
+            if not commands.poll(start_timeout):
+                self.close()
+                raise TimeoutError("Worker didn't start in time")
+
+            error: Exception | None = commands.recv()
+            if error is not None:
+                self.close()
+                raise error
+
+    def __relay(self, command: str, *args: Any) -> None:
+        """
+        Send a command to all running workers
+        :param command: Name of the command
+        :param args: Arguments of the command
+        """
+        with self.__lock:
+            for commands in self.__commands:
+                try:
+                    commands.send((command, args))
+                except (BrokenPipeError, OSError):
+                    continue
+
+    def provide_data(self, req_dict: DATAUNIT, value: DATAUNIT) -> None:
+        """
+        Provide data for subscription to the clients of all workers
+        Returns once the value is handed to the workers, every worker serializes it once for its clients
+        :param req_dict: Same dictonary as a normal request to use
+        :param value: New value
+        """
+        self.__relay("provide", req_dict, value)
+
+    def invalidate(self, req_dict: DATAUNIT) -> None:
+        """
+        Tell the clients of all workers that subscribed the request dictonary that their cached value is outdated
+        :param req_dict: Same dictonary as a normal request to use
+        """
+        self.__relay("invalidate", req_dict)
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        """
+        Stop all workers (they stop accepting and exit, which closes their connections)
+        :param timeout: Seconds to wait for every worker before it's terminated
+        """
+        self.__relay("close")
+
+        with self.__lock:
+            for process in self.__processes:
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+            for commands in self.__commands:
+                commands.close()
+
+            self.__processes = []
+            self.__commands = []
+
+    @property
+    def workers(self) -> int:
+        """
+        :return: Number of running worker processes
+        """
+        return sum(process.is_alive() for process in self.__processes)
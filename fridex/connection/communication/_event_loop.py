@@ -0,0 +1,103 @@
+"""
+fridex/connection/communication/_event_loop.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Lock, get_ident
+from typing import Callable, Any
+import asyncio
+
+from ._timer_wheel import TimerWheel
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class EventLoopService:
+    """
+    Process-wide asyncio event loop that drives all connections
+    The loop runs in a single daemon thread and wakes only on socket readiness, timers or queued work
+    """
+    __loop: asyncio.AbstractEventLoop | None = None
+    __thread: Thread | None = None
+    __thread_pool: ThreadPoolExecutor | None = None
+    __timer_wheel: TimerWheel | None = None
+    __lock: Lock = Lock()
+
+    @classmethod
+    def get_loop(cls) -> asyncio.AbstractEventLoop:
+        """
+        Get the shared event loop and start it if it's not running yet
+        :return: Running event loop
+        """
+        with cls.__lock:
+            if cls.__loop is None or cls.__loop.is_closed():
+                cls.__loop = asyncio.new_event_loop()
+                cls.__thread = Thread(target=cls.__run, args=(cls.__loop,), name="fridex-event-loop", daemon=True)
+                cls.__thread.start()
+
+            return cls.__loop
+
+    @classmethod
+    def get_thread_pool(cls) -> ThreadPoolExecutor:
+        """
+        Get the shared ThreadPool to execute user callbacks outside the event loop
+        :return: ThreadPool instance
+        """
+        with cls.__lock:
+            if cls.__thread_pool is None:
+                cls.__thread_pool = ThreadPoolExecutor(thread_name_prefix="fridex-callback")
+
+            return cls.__thread_pool
+
+    @classmethod
+    def get_timer_wheel(cls) -> TimerWheel:
+        """
+        Get the shared TimerWheel for heartbeats and lease checks of all connections
+        (only use it inside the event loop thread)
+        :return: TimerWheel of the running event loop
+        """
+        loop = cls.get_loop()
+        with cls.__lock:
+            if cls.__timer_wheel is None or cls.__timer_wheel.loop is not loop:
+                cls.__timer_wheel = TimerWheel(loop)
+
+            return cls.__timer_wheel
+
+    @classmethod
+    def in_loop_thread(cls) -> bool:
+        """
+        :return: Whether the caller is running inside the event loop thread
+        """
+        return cls.__thread is not None and cls.__thread.ident == get_ident()
+
+    @classmethod
+    def call_soon(cls, callback: Callable[..., Any], *args: Any) -> None:
+        """
+        Schedule a callback in the event loop from any thread
+        :param callback: Function to call
+        :param args: Arguments for the callback
+        """
+        loop = cls.get_loop()
+        if cls.in_loop_thread():
+            loop.call_soon(callback, *args)
+        else:
+            loop.call_soon_threadsafe(callback, *args)
+
+    @staticmethod
+    def __run(loop: asyncio.AbstractEventLoop) -> None:
+        """
+        Thread target running the loop forever
+        :param loop: Loop to run
+        """
+        asyncio.set_event_loop(loop)
+        loop.run_forever()
@@ -0,0 +1,215 @@
+"""
+fridex/connection/communication/_send_queue.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from concurrent.futures import Future
+from threading import Condition
+from collections import deque
+from time import monotonic
+import asyncio
+
+from ..protocol import RAW_MESSAGE
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class SendQueueFull(Exception):
+    """
+    The send queue is above its high watermark
+    """
+    ...
+
+
+class SendQueue:
+    """
+    Bounded queue of outgoing messages with high and low watermark (in bytes)
+    When the queued messages reach the high watermark producers are held back
+    until the queue is drained below the low watermark again
+    """
+    __messages: deque[RAW_MESSAGE]
+    __size: int
+    __high_watermark: int
+    __low_watermark: int
+    __full: bool
+    __closed: bool
+
+    __condition: Condition
+    __waiters: list[Future]
+
+    def __init__(self, high_watermark: int = 4194304, low_watermark: int | None = None) -> None:
+        """
+        Create empty queue
+        :param high_watermark: Queued bytes at which producers are held back
+        :param low_watermark: Queued bytes at which producers may continue (half of the high watermark if None)
+        """
+        self.__high_watermark = high_watermark
+        self.__low_watermark = low_watermark if low_watermark is not None else high_watermark // 2
+
+        self.__messages = deque()
+        self.__size = 0
+        self.__full = False
+        self.__closed = False
+
+        self.__condition = Condition()
+        self.__waiters = []
+
+    @property
+    def size(self) -> int:
+        """
+        :return: Number of queued bytes (characters for text messages)
+        """
+        return self.__size
+
+    @property
+    def full(self) -> bool:
+        """
+        :return: Whether the high watermark was reached and the low watermark wasn't reached again yet
+        """
+        return self.__full
+
+    def __len__(self) -> int:
+        """
+        :return: Number of queued messages
+        """
+        return len(self.__messages)
+
+    def __append(self, message: RAW_MESSAGE) -> None:
+        """
+        Add a message (condition has to be held)
+        :param message: Message to add
+        """
+        self.__messages.append(message)
+        self.__size += len(message)
+        if self.__size >= self.__high_watermark:
+            self.__full = True
+
+    def __wait(self, block: bool, timeout: float | None) -> None:
+        """
+        Wait until the queue isn't full anymore (condition has to be held)
+        :param block: Wait if the queue is full
+        :param timeout: Maximum seconds to wait (None to wait forever)
+        :raises SendQueueFull: If the queue is full and block is False or the timeout passed
+        :raises ConnectionError: If the queue is closed
+        """
+        if self.__full:
+            if not block:
+                raise SendQueueFull("Send queue is full")
+
+            deadline: float | None = None if timeout is None else monotonic() + timeout
+            while self.__full and not self.__closed:
+                remaining: float | None = None if deadline is None else deadline - monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise SendQueueFull("Send queue stayed full")
+                self.__condition.wait(remaining)
+
+        if self.__closed:
+            raise ConnectionError("Connection is closed.")
+
+    def put(self, message: RAW_MESSAGE, block: bool = True, timeout: float | None = None, force: bool = False) -> None:
+        """
+        Queue a message
+        :param message: Encoded message
+        :param block: Wait until the queue is below the low watermark if it's full
+        :param timeout: Maximum seconds to wait (None to wait forever)
+        :param force: Queue the message even if the queue is full (for messages that must not wait)
+        :raises SendQueueFull: If the queue is full and block is False or the timeout passed
+        :raises ConnectionError: If the queue is closed
+        """
+        with self.__condition:
+            if force:
+                if self.__closed:
+                    raise ConnectionError("Connection is closed.")
+            else:
+                self.__wait(block, timeout)
+
+            self.__append(message)
+
+    def wait_space(self, block: bool = True, timeout: float | None = None) -> None:
+        """
+        Wait until the queue isn't full (for producers that queue their messages in another way)
+        :param block: Wait until the queue is below the low watermark if it's full
+        :param timeout: Maximum seconds to wait (None to wait forever)
+        :raises SendQueueFull: If the queue is full and block is False or the timeout passed
+        :raises ConnectionError: If the queue is closed
+        """
+        with self.__condition:
+            self.__wait(block, timeout)
+
+    async def aput(self, message: RAW_MESSAGE) -> None:
+        """
+        Queue a message, awaiting (instead of blocking) until the queue isn't full anymore
+        :param message: Encoded message
+        :raises ConnectionError: If the queue is closed
+        """
+        while True:
+            await self.await_space()
+
+            with self.__condition:
+                if not self.__full and not self.__closed:
+                    self.__append(message)
+                    return
+
+    async def await_space(self) -> None:
+        """
+        Await (instead of blocking) until the queue isn't full
+        :raises ConnectionError: If the queue is closed
+        """
+        while True:
+            with self.__condition:
+                if self.__closed:
+                    raise ConnectionError("Connection is closed.")
+
+                if not self.__full:
+                    return
+
+                waiter: Future = Future()
+                self.__waiters.append(waiter)
+
+            await asyncio.wrap_future(waiter)
+
+    def popleft(self) -> RAW_MESSAGE:
+        """
+        Take the oldest message
+        :return: Encoded message
+        :raises IndexError: If the queue is empty
+        """
+        with self.__condition:
+            message: RAW_MESSAGE = self.__messages.popleft()
+            self.__size -= len(message)
+
+            if self.__full and self.__size <= self.__low_watermark:
+                self.__release()
+
+            return message
+
+    def close(self) -> None:
+        """
+        Drop all messages and release all waiting producers (they get a ConnectionError)
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__messages.clear()
+            self.__size = 0
+            self.__release()
+
+    def __release(self) -> None:
+        """
+        Let waiting producers continue (condition has to be held)
+        """
+        self.__full = False
+        self.__condition.notify_all()
+
+        for waiter in self.__waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self.__waiters = []
@@ -10,10 +10,15 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
+from concurrent.futures import Executor
+from typing import Callable, Any
+from threading import Lock
 import socket
 
-from ..protocol import ProtocolInterface, DATAUNIT
+from ..protocol import ProtocolInterface, SubscriptionRegistry, DATAUNIT
 from ._base_connection import BaseConnection
+from ._event_loop import EventLoopService
+from ._timer_wheel import WheelTimer
 
 
 ##################################################
@@ -24,6 +29,11 @@ class ServerConnection(BaseConnection):
     """
     Connection from the server to the client
     """
+    __handshake_callback: Callable[[], Any] | None
+    __handshake_lock: Lock
+    __handshake_done: bool
+    __handshake_timer: WheelTimer | None
+
     def __init__(
             self,
             conn: socket.socket,
@@ -31,6 +41,16 @@ class ServerConnection(BaseConnection):
             rework_callback: ProtocolInterface.REWORK_CALLBACK_TYPE,
             add_sub_callback: ProtocolInterface.ADD_RELATED_SUB_CALLBACK_TYPE,
             del_sub_callback: ProtocolInterface.DELETE_RELATED_SUB_CALLBACK_TYPE,
+            request_executor: Executor | None = None,
+            stream_responses: bool = False,
+            subscription_registry: SubscriptionRegistry | None = None,
+            delta_updates: int | None = None,
+            send_high_watermark: int = 4194304,
+            send_low_watermark: int | None = None,
+            handshake_executor: Executor | None = None,
+            handshake_callback: Callable[[], Any] | None = None,
+            slow_consumer_timeout: float | None = None,
+            handshake_timeout: float | None = None
     ) -> None:
         """
         Create connection
@@ -39,12 +59,87 @@ class ServerConnection(BaseConnection):
         :param rework_callback: Callback to rework result before setting to future
         :param add_sub_callback: Callback when an add subscription request comes in
         :param del_sub_callback: Callback when a delete subscription request comes in
+        :param request_executor: Executor to run request callbacks concurrently (None to run them inline)
+        :param stream_responses: Answer every request as soon as it's ready instead of one response per bulk
+        :param subscription_registry: Server-wide registry to index the subscriptions of this client in
+        :param delta_updates: Send only changed keys of subscription values with a full snapshot every n-th update
+        :param send_high_watermark: Queued outgoing bytes at which sending blocks and reading is paused,
+                                    responses and updates wait for the queue beyond it
+        :param send_low_watermark: Queued outgoing bytes at which both continue (half of high if None)
+        :param handshake_executor: Executor to answer key exchanges on (None to answer them in the event loop)
+        :param handshake_callback: Called once when the first key exchange is done or the connection closed before
+        :param slow_consumer_timeout: Seconds the send queue may stay full before the client is disconnected
+                                      (connection timeout if None)
+        :param handshake_timeout: Seconds the client has to finish its first key exchange,
+                                  the connection is closed otherwise (None for no limit)
         """
+        self.__handshake_callback = handshake_callback
+        self.__handshake_lock = Lock()
+        self.__handshake_done = False
+        self.__handshake_timer = None
+
         super().__init__(conn,
                          request_callback=request_callback,
                          rework_callback=rework_callback,
                          add_sub_callback=add_sub_callback,
-                         del_sub_callback=del_sub_callback)
+                         del_sub_callback=del_sub_callback,
+                         request_executor=request_executor,
+                         stream_responses=stream_responses,
+                         subscription_registry=subscription_registry,
+                         delta_updates=delta_updates,
+                         send_high_watermark=send_high_watermark,
+                         send_low_watermark=send_low_watermark,
+                         handshake_executor=handshake_executor,
+                         slow_consumer_timeout=slow_consumer_timeout)
+
+        if handshake_timeout is not None:
+            EventLoopService.call_soon(self.__arm_handshake_timer, handshake_timeout)
+
+    def __arm_handshake_timer(self, handshake_timeout: float) -> None:
+        """
+        Close the connection if the first key exchange isn't done in time (runs in the event loop)
+        :param handshake_timeout: Seconds from now
+        """
+        with self.__handshake_lock:
+            if self.__handshake_done:
+                return
+
+        self.__handshake_timer = EventLoopService.get_timer_wheel().schedule(
+            EventLoopService.get_loop().time() + handshake_timeout, self.__handshake_expired
+        )
+
+    def __handshake_expired(self) -> None:
+        """
+        The client didn't finish its first key exchange in time
+        """
+        self.__handshake_timer = None
+        self.close()
+
+    def __cancel_handshake_timer(self) -> None:
+        """
+        Stop waiting for the first key exchange (runs in the event loop)
+        """
+        if self.__handshake_timer is not None:
+            self.__handshake_timer.cancel()
+            self.__handshake_timer = None
+
+    def _set_state(self, value: str) -> None:
+        """
+        Set current state and report the end of the handshake
+        :param value: Value to set to
+        """
+        super()._set_state(value)
+
+        if value in ("open", "closed"):
+            # close() on another thread can race with the open transition in the event loop
+            with self.__handshake_lock:
+                callback, self.__handshake_callback = self.__handshake_callback, None
+                first, self.__handshake_done = not self.__handshake_done, True
+
+            if callback is not None:
+                callback()
+            if first:
+                EventLoopService.call_soon(self.__cancel_handshake_timer)
 
     def provide_data(self, req_dict: DATAUNIT, value: DATAUNIT) -> None:
         """
@@ -53,3 +148,10 @@ class ServerConnection(BaseConnection):
         :param value: New value
         """
         self._protocol.subscription.provide_data(req_dict, value)
+
+    def invalidate(self, req_dict: DATAUNIT) -> None:
+        """
+        Tell the client its cached value of a subscription is outdated
+        :param req_dict: Same dictonary as a normal request to use
+        """
+        self._protocol.subscription.invalidate(req_dict)
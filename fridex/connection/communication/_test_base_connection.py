@@ -11,15 +11,19 @@ Author: Lukas Krahbichler
 ##################################################
 
 
-from concurrent.futures import Future
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Timer, Event, get_ident
 from time import sleep, time
+from unittest.mock import patch
 from typing import Literal
-from json import dumps
+from json import dumps, loads
 import unittest
+import asyncio
 import socket
 
 from ._base_connection import BaseConnection, ProtocolInterface
-from ..protocol import MessageToLongError
+from ..protocol import MessageToLongError, CodecService, BulkDict, RAW_MESSAGE, RequestError
+from ..protocol import DeadlineExceededError, SubscriptionProtocol, StreamFramer
 
 
 ##################################################
@@ -30,11 +34,13 @@ server: socket.socket | None = None
 
 
 def get_socket_pair(
-        port: int = 12345
+        port: int = 12345,
+        buffer_size: int | None = None
 ) -> tuple[socket.socket, socket.socket, socket.socket]:
     """
     Get a connected socket pair
     :param port: Port to use
+    :param buffer_size: Kernel receive buffer of the client and send buffer of the ServerConnection (None for default)
     :return: Server, ServerConnection, Client
     """
     global server
@@ -44,9 +50,13 @@ def get_socket_pair(
         server.listen()
 
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if buffer_size is not None:
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, buffer_size)
     client.connect(("127.0.0.1", port))
 
     sock, add = server.accept()
+    if buffer_size is not None:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, buffer_size)
     return server, sock, client
 
 
@@ -154,6 +164,430 @@ class BaseConnectionTest(unittest.TestCase):
 
         self.hold_connection()
 
+    def test_cryption_data(self) -> None:
+        """
+        Test data bursts after cryption change (several encrypted frames per read)
+        """
+        self.conn_client.send_cryption_change("fernet")
+        self.conn_client.send_key_exchange()
+
+        self.test_unencrypted_data()
+
+    def test_codec(self) -> None:
+        """
+        Test codec negotiation and data traffic with the negotiated codec
+        """
+        expected: str = "msgpack" if "msgpack" in CodecService.available() else "json"
+        self.conn_client.send_codec_change("msgpack")
+
+        self.test_unencrypted_data()
+
+        self.assertEqual(self.conn_client.protocol.codec.name, expected)
+        self.assertEqual(self.conn_server.protocol.codec.name, expected)
+
+    def test_state_callback_order(self) -> None:
+        """
+        Test that state callbacks of a connection run one state change after another in order
+        """
+        called: list[str] = []
+        running: list[int] = [0, 0]
+
+        def record(state: str) -> None:
+            running[0] += 1
+            running[1] = max(running)
+            sleep(0.01)
+            called.append(state)
+            running[0] -= 1
+
+        self.conn_client.callback_state("paused", lambda: record("paused"))
+        self.conn_client.callback_state("open", lambda: record("open"))
+        self.conn_client.callback_state("closed", lambda: record("closed"))
+
+        for _ in range(10):
+            self.conn_client.set_state("paused")
+            self.conn_client.set_state("open")
+        self.conn_client.close()
+
+        deadline: float = time() + 5
+        while len(called) < 21 and time() < deadline:
+            sleep(0.05)
+        self.assertEqual(called, ["paused", "open"] * 10 + ["closed"])
+        self.assertEqual(running[1], 1)
+
+    def test_state_waits(self) -> None:
+        """
+        Test waiting for states and state callbacks
+        """
+        called: list[tuple[str, int]] = []
+        ids: list[int] = [
+            self.conn_client.callback_state("closed", lambda: called.append(("closed", get_ident()))),
+            self.conn_client.callback_state("all", lambda: called.append(("all", get_ident())))
+        ]
+        self.assertEqual(len(set(ids)), 2)
+
+        self.assertFalse(self.conn_client.wait_for_state("closed", timeout=0.05))
+        Timer(0.1, self.conn_client.close).start()
+
+        start: float = time()
+        self.assertTrue(self.conn_client.wait_for_state("closed", timeout=2))
+        self.assertLess(time() - start, 0.5)
+        self.assertTrue(asyncio.run(self.conn_client.await_state("closed", timeout=0.1)))
+
+        # closed is final, a second close doesn't go through the callbacks again
+        self.conn_client.close()
+        self.conn_client.set_state("open")
+        self.assertEqual(self.conn_client.state, "closed")
+        with self.assertWarns(DeprecationWarning):
+            self.conn_client.join_state("closed", 0.1)
+
+        sleep(0.1)
+        self.assertEqual(sorted(name for name, _ in called), ["all", "closed"])
+        self.assertNotIn(get_ident(), [ident for _, ident in called])
+
+    async def await_open(self) -> bool:
+        """
+        Pause the server connection and await it to be opened again
+        :return: Whether open was reached
+        """
+        self.conn_server.set_state("paused")
+        Timer(0.05, self.conn_server.set_state, ("open",)).start()
+
+        return await self.conn_server.await_state("open", timeout=1)
+
+    def test_await_state(self) -> None:
+        """
+        Test awaiting a state
+        """
+        self.assertTrue(asyncio.run(self.await_open()))
+
+    def test_batching(self) -> None:
+        """
+        Test automatic batching of data requests
+        """
+        _, handler_sock, client_sock = get_socket_pair()
+        server = BaseConnectionModified(handler_sock, lambda a: a, lambda a: a, timeout=1)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1,
+                                        batch_window=0.05, batch_max_count=20)
+
+        bulks: list[BulkDict] = []
+        process_request = server.protocol.data.process_request
+
+        def count_bulks(message: BulkDict) -> RAW_MESSAGE:
+            bulks.append(message)
+            return process_request(message)
+
+        server.protocol.data.process_request = count_bulks
+
+        try:
+            futures: list[Future] = [client.protocol.data.request_add(dumps({"test": i})) for i in range(50)]
+
+            for i, future in enumerate(futures):
+                self.assertEqual(future.result(timeout=5)["test"], i)
+
+            self.assertLessEqual(len(bulks), 3)
+            self.assertEqual(sum(len(bulk["data"]) for bulk in bulks), 50)
+        finally:
+            client.close()
+            server.close()
+
+    def test_concurrent_requests(self) -> None:
+        """
+        Test request callbacks running on an executor (responses out of order, errors per request)
+        """
+        def handle(request: str) -> str:
+            if loads(request)["test"] == "fail":
+                raise ValueError("failed")
+            sleep(loads(request)["test"])
+            return request
+
+        _, handler_sock, client_sock = get_socket_pair()
+        executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=4)
+        server = BaseConnectionModified(handler_sock, handle, lambda a: a, timeout=1, request_executor=executor)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1)
+
+        try:
+            client.protocol.data.request_start()
+            slow: Future = client.protocol.data.request_add(dumps({"test": 1}))
+            fast: Future = client.protocol.data.request_add(dumps({"test": 0}))
+            failing: Future = client.protocol.data.request_add(dumps({"test": "fail"}))
+            client.send(client.protocol.data.request_get())
+
+            self.assertEqual(fast.result(timeout=0.8)["test"], 0)
+            self.assertFalse(slow.done())
+            self.assertRaises(RequestError, lambda: failing.result(timeout=5))
+            self.assertEqual(slow.result(timeout=5)["test"], 1)
+        finally:
+            client.close()
+            server.close()
+            executor.shutdown()
+
+    def test_many_frames(self) -> None:
+        """
+        Test that frames written together (more than one write batch) arrive complete and in order
+        """
+        _, handler_sock, client_sock = get_socket_pair()
+        server = BaseConnectionModified(handler_sock, lambda request: request, lambda a: a, timeout=1)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1)
+
+        try:
+            futures: list[Future] = []
+            for i in range(100):
+                client.protocol.data.request_start()
+                futures.append(client.protocol.data.request_add(dumps({"test": i, "pad": "x" * 20000})))
+                client.send(client.protocol.data.request_get())
+
+            self.assertEqual([future.result(timeout=5)["test"] for future in futures], list(range(100)))
+        finally:
+            client.close()
+            server.close()
+
+    def test_slow_consumer(self) -> None:
+        """
+        Test that subscription updates to a peer that doesn't read stay within the send queue watermark
+        and the peer is disconnected after the slow consumer timeout
+        """
+        _, handler_sock, client_sock = get_socket_pair(buffer_size=4096)
+        server = BaseConnectionModified(handler_sock, lambda a: a, lambda a: a, timeout=10,
+                                        send_high_watermark=65536, slow_consumer_timeout=0.5)
+        subscriber: SubscriptionProtocol = SubscriptionProtocol(range(3000, 3999), ThreadPoolExecutor(max_workers=1),
+                                                                None, None, None)
+
+        try:
+            request: RAW_MESSAGE = subscriber.add_subscription(lambda _: None, {"room": 1})[1]
+            request = request.encode("UTF-8") if isinstance(request, str) else request
+            client_sock.sendall(StreamFramer.header(len(request)) + request)
+
+            queued: list[int] = []
+            deadline: float = time() + 5
+            while server.state == "open" and time() < deadline:
+                server.protocol.subscription.provide_data({"room": 1}, {"pad": "x" * 10000})
+                queued.append(server._send_data.size)
+                sleep(0.001)
+
+            self.assertEqual(server.state, "closed")
+            self.assertLess(max(queued), 65536 + 20000)
+        finally:
+            client_sock.close()
+            server.close()
+
+    def test_large_streamed_responses(self) -> None:
+        """
+        Test that streamed responses beyond the send queue watermark wait for the queue instead of
+        disconnecting a client that reads them
+        """
+        def handle(request: str) -> str:
+            return dumps({"test": loads(request)["test"], "pad": "x" * 200000})
+
+        _, handler_sock, client_sock = get_socket_pair()
+        server = BaseConnectionModified(handler_sock, handle, lambda a: a, timeout=5, stream_responses=True,
+                                        request_executor=ThreadPoolExecutor(max_workers=8),
+                                        send_high_watermark=1048576)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=5)
+
+        try:
+            client.protocol.data.request_start()
+            futures: list[Future] = [client.protocol.data.request_add(dumps({"test": i})) for i in range(200)]
+            client.send(client.protocol.data.request_get())
+
+            self.assertEqual([future.result(timeout=20)["test"] for future in futures], list(range(200)))
+            self.assertEqual(server.state, "open")
+        finally:
+            client.close()
+            server.close()
+
+    def test_frame_too_long(self) -> None:
+        """
+        Test that a message whose ciphertext doesn't fit into the frame header closes the connection
+        and fails its request instead of breaking the send pass
+        """
+        header = StreamFramer.header
+
+        def small_header(size: int, header_size: int | None = None) -> bytes:
+            if size > 10000:
+                raise MessageToLongError(f"With a size of {size} the frame is to long!")
+            return header(size, header_size)
+
+        _, handler_sock, client_sock = get_socket_pair()
+        server = BaseConnectionModified(handler_sock, lambda request: request, lambda a: a, timeout=1)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1)
+
+        try:
+            client.protocol.data.request_start()
+            small: Future = client.protocol.data.request_add(dumps({"test": 1}))
+            client.send(client.protocol.data.request_get())
+            self.assertEqual(small.result(timeout=5)["test"], 1)
+
+            with patch.object(StreamFramer, "header", staticmethod(small_header)):
+                client.protocol.data.request_start()
+                large: Future = client.protocol.data.request_add(dumps({"test": 2, "pad": "x" * 20000}))
+                client.send(client.protocol.data.request_get())
+
+                self.assertRaises(ConnectionError, lambda: large.result(timeout=5))
+                self.assertTrue(client.wait_for_state("closed", timeout=5))
+                self.assertTrue(server.wait_for_state("closed", timeout=5))
+        finally:
+            client.close()
+            server.close()
+
+    def test_streaming_deadline(self) -> None:
+        """
+        Test streamed responses and per-request deadlines
+        """
+        def handle(request: str) -> str:
+            sleep(loads(request)["test"])
+            return request
+
+        _, handler_sock, client_sock = get_socket_pair()
+        server = BaseConnectionModified(handler_sock, handle, lambda a: a, timeout=1, stream_responses=True)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1)
+
+        try:
+            client.protocol.data.request_start()
+            expiring: Future = client.protocol.data.request_add(dumps({"test": 1}), timeout=0.2)
+            fast: Future = client.protocol.data.request_add(dumps({"test": 0}), timeout=5)
+            client.send(client.protocol.data.request_get())
+
+            self.assertEqual(fast.result(timeout=0.5)["test"], 0)
+            self.assertRaises(DeadlineExceededError, lambda: expiring.result(timeout=0.5))
+
+            # late response of the expired request is ignored
+            sleep(1)
+            self.assertEqual(client.state, "open")
+        finally:
+            client.close()
+            server.close()
+
+    def test_cancel_and_close(self) -> None:
+        """
+        Test that cancelled requests are skipped by the other side and pending requests fail on close
+        """
+        handled: list[int] = []
+
+        def handle(request: str) -> str:
+            handled.append(loads(request)["test"])
+            sleep(0.5)
+            return request
+
+        _, handler_sock, client_sock = get_socket_pair()
+        executor: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1)
+        server = BaseConnectionModified(handler_sock, handle, lambda a: a, timeout=1, request_executor=executor)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1)
+
+        try:
+            client.protocol.data.request_start()
+            first: Future = client.protocol.data.request_add(dumps({"test": 1}))
+            cancelled: Future = client.protocol.data.request_add(dumps({"test": 2}))
+            client.send(client.protocol.data.request_get())
+
+            sleep(0.1)
+            self.assertTrue(cancelled.cancel())
+            self.assertEqual(first.result(timeout=2)["test"], 1)
+
+            client.protocol.data.request_start()
+            pending: Future = client.protocol.data.request_add(dumps({"test": 3}))
+            client.send(client.protocol.data.request_get())
+            sleep(0.1)
+
+            client.close()
+            self.assertRaises(ConnectionError, lambda: pending.result(timeout=0.2))
+            self.assertEqual(client.protocol.data.in_flight, 0)
+
+            sleep(0.6)
+            self.assertEqual(handled, [1, 3])
+        finally:
+            client.close()
+            server.close()
+            executor.shutdown()
+
+    def test_client_cache(self) -> None:
+        """
+        Test answering subscribed data requests from memory and server push invalidation
+        """
+        calls: list[dict] = []
+        updates: list[dict] = []
+        updated: Event = Event()
+        filled: Event = Event()
+        subscribed: Event = Event()
+
+        def handle(request: dict) -> dict:
+            calls.append(request)
+            return {"value": len(calls)}
+
+        def update(value: dict) -> None:
+            updates.append(value)
+            updated.set()
+
+        _, handler_sock, client_sock = get_socket_pair()
+        server = BaseConnectionModified(handler_sock, handle, lambda a: a, lambda *_: subscribed.set(), timeout=1)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1, client_cache=True)
+
+        cache_set = client.protocol.cache.set
+
+        def fill(key: dict, value: dict) -> None:
+            cache_set(key, value)
+            filled.set()
+
+        client.protocol.cache.set = fill
+
+        try:
+            client.send(client.protocol.subscription.add_subscription(update, {"sensor": "temp"})[1])
+            self.assertTrue(filled.wait(5))
+            filled.clear()
+            self.assertEqual(len(calls), 1)
+
+            for _ in range(10):
+                cached: Future = client.protocol.data.request_add({"sensor": "temp"})
+                self.assertTrue(cached.done())
+                self.assertEqual(cached.result(), {"value": 1})
+            self.assertEqual(len(calls), 1)
+
+            # the initial fetch is sent before the subscription, it can be answered before the server knows it
+            self.assertTrue(subscribed.wait(5))
+            server.protocol.subscription.invalidate({"sensor": "temp"})
+            self.assertTrue(updated.wait(5))
+            self.assertTrue(filled.wait(5))
+            self.assertEqual(updates, [{"value": 2}])
+            self.assertEqual(client.protocol.data.request_add({"sensor": "temp"}).result(timeout=0), {"value": 2})
+            self.assertEqual(client.protocol.cache.stats()["hits"], 11)
+        finally:
+            client.close()
+            server.close()
+
+    def test_no_client_cache(self) -> None:
+        """
+        Test that without client_cache subscribed data requests are always sent to the other side
+        """
+        calls: list[dict] = []
+        pushed: Event = Event()
+
+        def handle(request: dict) -> dict:
+            calls.append(request)
+            return {"value": len(calls)}
+
+        _, handler_sock, client_sock = get_socket_pair()
+        server = BaseConnectionModified(handler_sock, handle, lambda a: a, timeout=1)
+        client = BaseConnectionModified(client_sock, lambda a: a, lambda a: a, timeout=1)
+
+        try:
+            self.assertIsNone(client.protocol.cache)
+            client.send(client.protocol.subscription.add_subscription(lambda _: pushed.set(), {"sensor": "temp"})[1])
+
+            # the subscription is only known to the server once it's received
+            for _ in range(50):
+                server.protocol.subscription.provide_data({"sensor": "temp"}, {"value": 0})
+                if pushed.wait(0.1):
+                    break
+            self.assertTrue(pushed.is_set())
+
+            for i in range(1, 4):
+                client.protocol.data.request_start()
+                future: Future = client.protocol.data.request_add({"sensor": "temp"})
+                client.send(client.protocol.data.request_get())
+                self.assertEqual(future.result(timeout=5), {"value": i})
+        finally:
+            client.close()
+            server.close()
+
     def tearDown(self) -> None:
         """
         Clearup after each test
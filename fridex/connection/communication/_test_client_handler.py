@@ -0,0 +1,156 @@
+"""
+fridex/connection/communication/_test_client_handler.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from threading import enumerate as enumerate_threads
+from time import sleep, time
+import unittest
+import socket
+
+from ._client_connection import ClientConnection
+from ._client_handler import ClientHandler
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class ClientHandlerTest(unittest.TestCase):
+    """
+    Test admission control and client registry of the server
+    """
+    handler: ClientHandler
+
+    def wait_for(self, key: str, value: int, timeout: float = 10) -> None:
+        """
+        Wait until a value of the admission stats is reached
+        :param key: Key in the stats
+        :param value: Expected value
+        :param timeout: Maximum seconds to wait
+        """
+        deadline: float = time() + timeout
+        while self.handler.stats()[key] != value and time() < deadline:
+            sleep(0.05)
+        self.assertEqual(self.handler.stats()[key], value)
+
+    def test_reject(self) -> None:
+        """
+        Test that clients over the handshake limit are rejected right away and the slot is freed again
+        """
+        self.handler = ClientHandler(lambda a: a, lambda a: a, None, None, port=12362, max_handshakes=1)
+
+        silent: socket.socket = socket.create_connection(("127.0.0.1", 12362))
+        self.wait_for("handshaking", 1)
+
+        rejected: socket.socket = socket.create_connection(("127.0.0.1", 12362))
+        rejected.settimeout(5)
+        try:
+            self.assertEqual(rejected.recv(1), b"")
+        except ConnectionResetError:
+            pass
+        finally:
+            rejected.close()
+        self.assertEqual(self.handler.stats()["rejected"], 1)
+
+        silent.close()
+        self.wait_for("handshaking", 0)
+
+        client: ClientConnection = ClientConnection("127.0.0.1", 12362, lambda a: a, lambda a: a)
+        try:
+            self.wait_for("accepted", 2)
+            self.wait_for("handshaking", 0)
+            self.assertEqual(self.handler.stats()["clients"], 1)
+        finally:
+            client.close()
+
+    def test_handshake_timeout(self) -> None:
+        """
+        Test that a client that never finishes its key exchange is disconnected and its handshake slot is freed
+        """
+        self.handler = ClientHandler(lambda a: a, lambda a: a, None, None, port=12367, max_handshakes=1,
+                                     handshake_timeout=0.5)
+
+        silent: socket.socket = socket.create_connection(("127.0.0.1", 12367))
+        silent.settimeout(5)
+        try:
+            self.wait_for("handshaking", 1)
+
+            start: float = time()
+            try:
+                while silent.recv(65536):  # heartbeats until the handshake timeout
+                    ...
+            except ConnectionResetError:
+                pass
+            self.assertLess(time() - start, 3)
+            self.wait_for("handshaking", 0)
+            self.wait_for("clients", 0)
+        finally:
+            silent.close()
+
+        # the freed slot admits the next client
+        admitted: socket.socket = socket.create_connection(("127.0.0.1", 12367))
+        try:
+            self.wait_for("accepted", 2)
+            self.assertEqual(self.handler.stats()["rejected"], 0)
+        finally:
+            admitted.close()
+
+    def test_remove_closed(self) -> None:
+        """
+        Test that closed clients are removed from the registry
+        """
+        self.handler = ClientHandler(lambda a: a, lambda a: a, None, None, port=12363, max_handshakes=None)
+
+        clients: list[socket.socket] = [socket.create_connection(("127.0.0.1", 12363)) for _ in range(3)]
+        addresses: list[tuple[str, int]] = [client.getsockname() for client in clients]
+        self.wait_for("clients", 3)
+
+        self.assertIsNotNone(self.handler.get_client_by_peer(addresses[1]))
+        self.assertEqual(sorted(self.handler.clients), [0, 1, 2])
+
+        clients[1].close()
+        self.wait_for("clients", 2)
+        self.assertIsNone(self.handler.get_client_by_peer(addresses[1]))
+        self.assertIsNotNone(self.handler.get_client_by_peer(addresses[2]))
+
+        for client in clients:
+            client.close()
+        self.wait_for("clients", 0)
+        self.assertEqual(self.handler.client_count, 0)
+
+    def test_close_executor(self) -> None:
+        """
+        Test that closing the handler stops its own handshake threads and connected clients keep working
+        """
+        self.handler = ClientHandler(lambda a: a, lambda a: a, None, None, port=12366)
+        client: ClientConnection = ClientConnection("127.0.0.1", 12366, lambda a: a, lambda a: a)
+
+        try:
+            self.wait_for("clients", 1)
+            self.wait_for("handshaking", 0)
+            self.handler.close()
+
+            deadline: float = time() + 5
+            while any(thread.name.startswith("fridex-handshake") for thread in enumerate_threads()) \
+                    and time() < deadline:
+                sleep(0.05)
+            self.assertFalse(any(thread.name.startswith("fridex-handshake") for thread in enumerate_threads()))
+
+            client.send_key_exchange()
+            self.assertEqual(client.request({"value": 1}).result(timeout=10), {"value": 1})
+        finally:
+            client.close()
+
+    def tearDown(self) -> None:
+        """
+        Stop server
+        """
+        self.handler.close()
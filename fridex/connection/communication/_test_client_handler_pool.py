@@ -0,0 +1,108 @@
+"""
+fridex/connection/communication/_test_client_handler_pool.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from time import sleep, time
+from typing import Any
+import unittest
+import socket
+import os
+
+from ._client_handler_pool import ClientHandlerPool
+from ._client_connection import ClientConnection
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+def echo(request: Any) -> Any:
+    """
+    Request and rework callback of the workers (module level to be picklable)
+    :param request: Request
+    :return: Same request, process id of the worker for {"pid": ...}
+    """
+    if isinstance(request, dict) and "pid" in request:
+        return {"pid": os.getpid()}
+    return request
+
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT"), "SO_REUSEPORT is not supported")
+class ClientHandlerPoolTest(unittest.TestCase):
+    """
+    Test multi-process server
+    """
+    pool: ClientHandlerPool
+
+    def setUp(self) -> None:
+        """
+        Start pool with two workers
+        """
+        self.pool = ClientHandlerPool(echo, echo, None, None, port=12360, workers=2)
+
+    def test_relay(self) -> None:
+        """
+        Test that provided data reaches the subscribers of every worker
+        """
+        self.assertEqual(self.pool.workers, 2)
+
+        received: list[list[Any]] = [[], [], []]
+        clients: list[ClientConnection] = [ClientConnection("127.0.0.1", 12360, echo, echo) for _ in received]
+
+        try:
+            for client, values in zip(clients, received):
+                client.add_subscription(values.append, {"room": 1})
+
+            # subscriptions are only active in the workers after the key exchange
+            deadline: float = time() + 20
+            while not all(received) and time() < deadline:
+                self.pool.provide_data({"room": 1}, {"value": 1})
+                sleep(0.2)
+
+            self.assertTrue(all(values and values[-1] == {"value": 1} for values in received))
+        finally:
+            for client in clients:
+                client.close()
+
+    def test_spread(self) -> None:
+        """
+        Test that the connections are spread over more than one worker process
+        """
+        clients: list[ClientConnection] = [ClientConnection("127.0.0.1", 12360, echo, lambda a: a) for _ in range(12)]
+
+        try:
+            # every client does its key exchanges first (RSA key generation), that's slow on few cores
+            pids: set[int] = {client.request({"pid": None}).result(timeout=60)["pid"] for client in clients}
+            self.assertGreater(len(pids), 1)
+            self.assertNotIn(os.getpid(), pids)
+        finally:
+            for client in clients:
+                client.close()
+
+    def test_port_in_use(self) -> None:
+        """
+        Test that a worker failing to listen raises in the pool
+        """
+        blocker: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        blocker.bind(("0.0.0.0", 12361))
+        blocker.listen()
+
+        try:
+            self.assertRaises(OSError, ClientHandlerPool, echo, echo, None, None, port=12361, workers=1)
+        finally:
+            blocker.close()
+
+    def tearDown(self) -> None:
+        """
+        Stop pool
+        """
+        self.pool.close()
+        self.assertEqual(self.pool.workers, 0)
@@ -10,16 +10,34 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
+from concurrent.futures import Future
+from threading import Thread
+from time import sleep
 import unittest
+import asyncio
+import socket
 
 from ._client_connection import ClientConnection
 from ._client_handler import ClientHandler
+from ._send_queue import SendQueueFull
+from ..protocol import RequestError, InFlightLimitError
 
 
 ##################################################
 #                     Code                       #
 ##################################################
 
+def handle(request: dict) -> dict:
+    """
+    Request callback of the server
+    :param request: Request
+    :return: Doubled value of the request
+    """
+    if request["value"] == "fail":
+        raise ValueError("failed")
+    return {"value": request["value"] * 2}
+
+
 class CommunicationTest(unittest.TestCase):
     """
     Basic client - server communication test
@@ -27,12 +45,116 @@ class CommunicationTest(unittest.TestCase):
     __client: ClientConnection
     __server: ClientHandler
 
+    @classmethod
+    def setUpClass(cls) -> None:
+        """
+        Setup server (shared, the port can't be reused right away)
+        """
+        cls.__server = ClientHandler(handle, lambda a: a, None, None, port=12364)
+
     def setUp(self) -> None:
         """
-        Setup client and server
+        Setup client
+        """
+        self.__client = ClientConnection("127.0.0.1", 12364, lambda a: a, lambda a: a)
+
+    def test_request(self) -> None:
+        """
+        Test single requests and errors
         """
+        self.assertEqual(self.__client.request({"value": 2}).result(timeout=10), {"value": 4})
+        self.assertRaises(RequestError, self.__client.request({"value": "fail"}).result, timeout=10)
+
+    def test_request_many(self) -> None:
+        """
+        Test many requests in flight at the same time
+        """
+        futures: list[Future] = self.__client.request_many({"value": i} for i in range(100))
+        futures += [self.__client.request({"value": i}) for i in range(100, 200)]
+
+        self.assertEqual([future.result(timeout=10)["value"] for future in futures], [i * 2 for i in range(200)])
+
+    def test_arequest(self) -> None:
+        """
+        Test awaiting requests
+        """
+        async def run() -> list[dict]:
+            return await asyncio.gather(*(self.__client.arequest({"value": i}) for i in range(10)))
+
+        self.assertEqual([result["value"] for result in asyncio.run(run())], [i * 2 for i in range(10)])
+
+    def test_in_flight_batch(self) -> None:
+        """
+        Test that a batch that doesn't fit into max_in_flight isn't sent at all
+        """
+        client: ClientConnection = ClientConnection("127.0.0.1", 12364, lambda a: a, lambda a: a, max_in_flight=5)
+
+        try:
+            self.assertRaises(InFlightLimitError, client.request_many, [{"value": i} for i in range(6)])
+            self.assertEqual(client.in_flight, 0)
+
+            futures: list[Future] = client.request_many({"value": i} for i in range(5))
+            self.assertEqual([future.result(timeout=10)["value"] for future in futures], [i * 2 for i in range(5)])
+        finally:
+            client.close()
+
+    def test_backpressure(self) -> None:
+        """
+        Test that requests wait while the send queue is full (the server never answers the key exchange)
+        """
+        listener: socket.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 12365))
+        listener.listen()
+
+        client: ClientConnection = ClientConnection("127.0.0.1", 12365, lambda a: a, lambda a: a,
+                                                    send_high_watermark=10000)
+        try:
+            client.request({"value": "x" * 20000})
+
+            # the bulk is moved into the send queue by the event loop
+            for _ in range(100):
+                if client._send_data.full:
+                    break
+                sleep(0.01)
+
+            self.assertRaises(SendQueueFull, client.request, {"value": 1}, block=False)
+            self.assertRaises(SendQueueFull, client.request, {"value": 1}, block_timeout=0.1)
+            self.assertEqual(client.in_flight, 1)
+
+            async def waiting() -> None:
+                with self.assertRaises(asyncio.TimeoutError):
+                    await asyncio.wait_for(client.arequest({"value": 1}), 0.1)
+
+            asyncio.run(waiting())
+
+            blocked: Thread = Thread(target=lambda: self.assertRaises(ConnectionError, client.request, {"value": 1}))
+            blocked.start()
+            sleep(0.1)
+            self.assertTrue(blocked.is_alive())
+
+            client.close()
+            blocked.join(1)
+            self.assertFalse(blocked.is_alive())
+        finally:
+            client.close()
+            listener.close()
+
+    def test_closed(self) -> None:
+        """
+        Test that requests on a closed connection fail
+        """
+        self.__client.close()
+        self.assertRaises(ConnectionError, self.__client.request, {"value": 1})
 
     def tearDown(self) -> None:
         """
-        Delete client and server
+        Delete client
+        """
+        self.__client.close()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        """
+        Delete server
         """
+        cls.__server.close()
@@ -0,0 +1,98 @@
+"""
+fridex/connection/communication/_test_send_queue.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from threading import Thread
+from time import sleep
+import unittest
+import asyncio
+
+from ._send_queue import SendQueue, SendQueueFull
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class SendQueueTest(unittest.TestCase):
+    """
+    Test bounded send queue with watermarks
+    """
+    queue: SendQueue
+
+    def setUp(self) -> None:
+        """
+        Create queue that is full at 10 bytes and released at 4 bytes
+        """
+        self.queue = SendQueue(10, 4)
+
+    def test_watermarks(self) -> None:
+        """
+        Test that the queue stays full until the low watermark is reached
+        """
+        for _ in range(4):
+            self.queue.put("abc")
+        self.assertTrue(self.queue.full)
+        self.assertEqual(self.queue.size, 12)
+
+        self.assertRaises(SendQueueFull, self.queue.put, "abc", block=False)
+        self.assertRaises(SendQueueFull, self.queue.put, "abc", timeout=0.05)
+        self.queue.put("abc", force=True)
+
+        for _ in range(3):
+            self.queue.popleft()
+        self.assertTrue(self.queue.full)
+
+        self.queue.popleft()
+        self.assertFalse(self.queue.full)
+        self.assertEqual(self.queue.popleft(), "abc")
+        self.assertEqual(len(self.queue), 0)
+
+    def test_blocking(self) -> None:
+        """
+        Test that a blocked producer continues once the queue is drained
+        """
+        self.queue.put("a" * 10)
+        producer: Thread = Thread(target=self.queue.put, args=("b",))
+        producer.start()
+
+        sleep(0.1)
+        self.assertTrue(producer.is_alive())
+
+        self.assertEqual(self.queue.popleft(), "a" * 10)
+        producer.join(1)
+        self.assertFalse(producer.is_alive())
+        self.assertEqual(self.queue.popleft(), "b")
+
+    def test_aput(self) -> None:
+        """
+        Test awaiting a full queue and closing it
+        """
+        async def produce() -> None:
+            self.queue.put("a" * 10)
+            waiting: asyncio.Task = asyncio.ensure_future(self.queue.aput("b"))
+
+            await asyncio.sleep(0.05)
+            self.assertFalse(waiting.done())
+
+            self.queue.popleft()
+            await asyncio.wait_for(waiting, 1)
+            self.assertEqual(len(self.queue), 1)
+
+            self.queue.put("c" * 10)
+            waiting = asyncio.ensure_future(self.queue.aput("d"))
+            await asyncio.sleep(0.05)
+            self.queue.close()
+
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(waiting, 1)
+
+        asyncio.run(produce())
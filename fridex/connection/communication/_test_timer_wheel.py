@@ -0,0 +1,74 @@
+"""
+fridex/connection/communication/_test_timer_wheel.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+import unittest
+import asyncio
+
+from ._timer_wheel import TimerWheel, WheelTimer
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class TimerWheelTest(unittest.TestCase):
+    """
+    Test shared timer wheel
+    """
+    def test_order_and_cancel(self) -> None:
+        """
+        Test that timers fire in order, not early and cancelled ones never
+        """
+        async def run() -> list[tuple[str, float]]:
+            loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+            wheel: TimerWheel = TimerWheel(loop, resolution=0.01, slots=16)
+            fired: list[tuple[str, float]] = []
+            start: float = loop.time()
+
+            # 0.3 seconds is further than one rotation (0.16 seconds)
+            for name, delay in (("c", 0.3), ("a", 0.05), ("b", 0.1)):
+                wheel.schedule(start + delay, lambda n=name: fired.append((n, loop.time() - start)))
+            cancelled: WheelTimer = wheel.schedule(start + 0.08, lambda: fired.append(("x", 0)))
+            cancelled.cancel()
+            self.assertEqual(len(wheel), 3)
+
+            await asyncio.sleep(0.5)
+            self.assertEqual(len(wheel), 0)
+            return fired
+
+        fired: list[tuple[str, float]] = asyncio.run(run())
+        self.assertEqual([name for name, _ in fired], ["a", "b", "c"])
+        for (_, delay), expected in zip(fired, (0.05, 0.1, 0.3)):
+            self.assertGreaterEqual(delay, expected - 0.001)
+
+    def test_reschedule(self) -> None:
+        """
+        Test that callbacks can schedule again and an idle wheel doesn't wake the loop
+        """
+        async def run() -> int:
+            loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+            wheel: TimerWheel = TimerWheel(loop, resolution=0.01)
+            calls: list[float] = []
+
+            def beat() -> None:
+                calls.append(loop.time())
+                if len(calls) < 5:
+                    wheel.schedule(loop.time() + 0.02, beat)
+
+            wheel.schedule(loop.time() + 0.02, beat)
+            await asyncio.sleep(0.3)
+
+            self.assertEqual(len(wheel), 0)
+            self.assertFalse([handle for handle in getattr(loop, "_scheduled", []) if not handle.cancelled()])
+            return len(calls)
+
+        self.assertEqual(asyncio.run(run()), 5)
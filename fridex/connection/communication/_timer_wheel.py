@@ -0,0 +1,182 @@
+"""
+fridex/connection/communication/_timer_wheel.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from typing import Callable, Any
+from math import ceil, floor
+import asyncio
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class WheelTimer:
+    """
+    Timer scheduled on a TimerWheel
+    """
+    __wheel: "TimerWheel"
+    tick: int
+    callback: Callable[[], Any]
+    cancelled: bool
+
+    def __init__(self, wheel: "TimerWheel", tick: int, callback: Callable[[], Any]) -> None:
+        """
+        Create timer (use TimerWheel.schedule)
+        :param wheel: Wheel the timer is scheduled on
+        :param tick: Tick of the wheel the timer fires at
+        :param callback: Function to call
+        """
+        self.__wheel = wheel
+        self.tick = tick
+        self.callback = callback
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        """
+        Don't fire the timer (it's dropped from the wheel when its slot is passed)
+        """
+        if not self.cancelled:
+            self.cancelled = True
+            self.__wheel._discard()
+
+
+class TimerWheel:
+    """
+    Hashed timer wheel for many long, coarse timers (heartbeats, leases) on the shared event loop
+    Scheduling and cancelling are O(1) and all timers share one loop timer that is only armed
+    for the next tick with a due timer, so connections cost nothing until their deadline.
+    Timers fire up to one resolution late. Must only be used inside the event loop thread.
+    """
+    __loop: asyncio.AbstractEventLoop
+    __resolution: float
+    __slots: list[list[WheelTimer]]
+    __count: int
+
+    __current_tick: int
+    __armed_tick: int | None
+    __handle: asyncio.TimerHandle | None
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, resolution: float = 0.1, slots: int = 512) -> None:
+        """
+        Create empty wheel
+        :param loop: Event loop to run the timers in
+        :param resolution: Seconds per tick
+        :param slots: Number of ticks per rotation (timers further away wait for several rotations)
+        """
+        self.__loop = loop
+        self.__resolution = resolution
+        self.__slots = [[] for _ in range(slots)]
+        self.__count = 0
+
+        self.__current_tick = floor(loop.time() / resolution)
+        self.__armed_tick = None
+        self.__handle = None
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """
+        :return: Event loop the timers run in
+        """
+        return self.__loop
+
+    def __len__(self) -> int:
+        """
+        :return: Number of scheduled timers
+        """
+        return self.__count
+
+    def schedule(self, when: float, callback: Callable[[], Any]) -> WheelTimer:
+        """
+        Call a function at a certain time
+        :param when: Time of the event loop clock (loop.time())
+        :param callback: Function to call
+        :return: Timer to cancel
+        """
+        tick: int = max(ceil(when / self.__resolution), self.__current_tick + 1)
+        timer: WheelTimer = WheelTimer(self, tick, callback)
+
+        self.__slots[tick % len(self.__slots)].append(timer)
+        self.__count += 1
+
+        if self.__armed_tick is None or tick < self.__armed_tick:
+            self.__arm(tick)
+
+        return timer
+
+    def _discard(self) -> None:
+        """
+        A timer was cancelled, stop ticking if it was the last one
+        """
+        self.__count -= 1
+        if not self.__count and self.__handle is not None:
+            self.__handle.cancel()
+            self.__handle = None
+            self.__armed_tick = None
+
+    def __arm(self, tick: int) -> None:
+        """
+        Wake up at a certain tick
+        :param tick: Tick to wake up at
+        """
+        if self.__handle is not None:
+            self.__handle.cancel()
+
+        self.__armed_tick = tick
+        self.__handle = self.__loop.call_at(tick * self.__resolution, self.__tick)
+
+    def __tick(self) -> None:
+        """
+        Fire all due timers, drop cancelled ones of the passed slots and wake up again at the next due timer
+        """
+        self.__handle = None
+        self.__armed_tick = None
+
+        last_tick: int = max(floor(self.__loop.time() / self.__resolution), self.__current_tick + 1)
+        passed: range = range(self.__current_tick + 1, last_tick + 1)
+        if len(passed) > len(self.__slots):
+            passed = range(last_tick - len(self.__slots) + 1, last_tick + 1)
+        self.__current_tick = last_tick
+
+        due: list[WheelTimer] = []
+        for tick in passed:
+            index: int = tick % len(self.__slots)
+            slot: list[WheelTimer] = self.__slots[index]
+            if not slot:
+                continue
+
+            due += [timer for timer in slot if not timer.cancelled and timer.tick <= last_tick]
+            self.__slots[index] = [timer for timer in slot if not timer.cancelled and timer.tick > last_tick]
+
+        self.__count -= len(due)
+        due.sort(key=lambda timer: timer.tick)
+
+        for timer in due:
+            timer.cancelled = True
+            try:
+                timer.callback()
+            except Exception as exc:
+                self.__loop.call_exception_handler({"message": "Exception in timer callback", "exception": exc})
+
+        if self.__count:
+            next_tick: int = self.__next_tick()
+            if self.__armed_tick is None or next_tick < self.__armed_tick:
+                self.__arm(next_tick)
+
+    def __next_tick(self) -> int:
+        """
+        :return: Tick of the next due timer (or the end of this rotation if all timers are further away)
+        """
+        for tick in range(self.__current_tick + 1, self.__current_tick + len(self.__slots) + 1):
+            if any(timer.tick == tick and not timer.cancelled for timer in self.__slots[tick % len(self.__slots)]):
+                return tick
+
+        return self.__current_tick + len(self.__slots)
@@ -10,3 +10,5 @@ from ._cryption import CryptionService, CRYPTION_METHODS
 from ._private_public import PrivatePublicCryption
 from ._cryption_method import CryptionMethod
 from ._fernet import FernetCryption
+from ._hybrid import HybridCryption
+from ._key_pool import KeyPool, KeyPoolStats
@@ -15,12 +15,13 @@ from typing import Literal
 from ._private_public import PrivatePublicCryption
 from ._cryption_method import CryptionMethod
 from ._fernet import FernetCryption
+from ._hybrid import HybridCryption
 
 ##################################################
 #                     Code                       #
 ##################################################
 
-CRYPTION_METHODS = Literal["private_public", "fernet"]
+CRYPTION_METHODS = Literal["private_public", "fernet", "hybrid"]
 
 
 class CryptionService:
@@ -29,9 +30,11 @@ class CryptionService:
     """
 
     @staticmethod
-    def new_cryption(method: CRYPTION_METHODS = "private_public") -> CryptionMethod:
+    def new_cryption(method: CRYPTION_METHODS = "hybrid") -> CryptionMethod:
         match method:
             case "private_public":
                 return PrivatePublicCryption()
             case "fernet":
                 return FernetCryption()
+            case "hybrid":
+                return HybridCryption()
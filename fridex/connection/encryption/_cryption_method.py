@@ -27,12 +27,14 @@ class CryptionMethod:
         """
         ...
 
-    def decrypt(self, message: bytes) -> bytes:
+    def decrypt(self, message: bytes | memoryview) -> bytes | memoryview:
         """
         Decrypte messages
+        Every call gets exactly one message as it was returned by encrypt
         :param message: Encrypted message
         :return: Raw message
         """
+        ...
 
     def get_key(self) -> str:
         """
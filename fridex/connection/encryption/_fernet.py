@@ -43,9 +43,9 @@ class FernetCryption(CryptionMethod):
             return self.__foreign_cryption.encrypt(message)
         return message
 
-    def decrypt(self, message: bytes) -> bytes:
-        if self.__own_cryption and message != b'':
-            return self.__own_cryption.decrypt(message)
+    def decrypt(self, message: bytes | memoryview) -> bytes | memoryview:
+        if self.__own_cryption and message:
+            return self.__own_cryption.decrypt(bytes(message))
 
         return message
 
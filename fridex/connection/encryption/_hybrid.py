@@ -0,0 +1,112 @@
+"""
+fridex/connection/encryption/_hybrid.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+import os
+
+from ._private_public import PrivatePublicCryption
+from ._cryption_method import CryptionMethod
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class HybridCryption(CryptionMethod):
+    """
+    RSA keys are only used to wrap AES-GCM session keys, all messages are encrypted symmetrically
+
+    Every side chooses the session key for its sending direction as soon as it gets the foreign public key.
+    The first message after that carries the RSA wrapped session key:
+        [1][length of wrapped key (2 bytes)][wrapped key][nonce (12 bytes)][AES-GCM ciphertext]
+    All following messages only carry:
+        [0][nonce (12 bytes)][AES-GCM ciphertext]
+    """
+    __rsa: PrivatePublicCryption
+    __has_own_key: bool
+
+    __send_cipher: AESGCM | None
+    __send_wrapped_key: bytes | None
+    __nonce_prefix: bytes
+    __nonce_count: int
+
+    __recv_cipher: AESGCM | None
+
+    def __init__(self) -> None:
+        """
+        Create hybrid cryption
+        """
+        self.__rsa = PrivatePublicCryption()
+        self.__has_own_key = False
+
+        self.__send_cipher = None
+        self.__send_wrapped_key = None
+        self.__nonce_prefix = b''
+        self.__nonce_count = 0
+
+        self.__recv_cipher = None
+
+    def __next_nonce(self) -> bytes:
+        """
+        :return: Unique nonce for the current session key (random prefix + counter)
+        """
+        self.__nonce_count += 1
+        return self.__nonce_prefix + self.__nonce_count.to_bytes(length=8, byteorder="big")
+
+    def encrypt(self, message: bytes) -> bytes:
+        if self.__send_cipher is None:
+            return message
+
+        nonce: bytes = self.__next_nonce()
+        encrypted: bytes = self.__send_cipher.encrypt(nonce, message, None)
+
+        if self.__send_wrapped_key is not None:
+            wrapped_key: bytes = self.__send_wrapped_key
+            self.__send_wrapped_key = None
+            return b'\x01' + len(wrapped_key).to_bytes(length=2, byteorder="big") + wrapped_key + nonce + encrypted
+
+        return b'\x00' + nonce + encrypted
+
+    def decrypt(self, message: bytes | memoryview) -> bytes | memoryview:
+        if not self.__has_own_key or not message:
+            return message
+
+        message = memoryview(message)
+        offset: int = 1
+
+        if message[0] == 1:
+            size: int = int.from_bytes(message[1:3], byteorder="big")
+            self.__recv_cipher = AESGCM(self.__rsa.decrypt(message[3:3 + size]))
+            offset = 3 + size
+
+        if self.__recv_cipher is None:
+            raise ValueError("Received encrypted message before the session key")
+
+        return self.__recv_cipher.decrypt(message[offset:offset + 12], message[offset + 12:], None)
+
+    def get_key(self) -> str:
+        if not self.__has_own_key:
+            return self.new_key()
+        return self.__rsa.get_key()
+
+    def set_key(self, key: str) -> None:
+        self.__rsa.set_key(key)
+
+        session_key: bytes = AESGCM.generate_key(bit_length=256)
+        self.__send_cipher = AESGCM(session_key)
+        self.__send_wrapped_key = self.__rsa.encrypt(session_key)
+        self.__nonce_prefix = os.urandom(4)
+        self.__nonce_count = 0
+
+    def new_key(self) -> str:
+        self.__has_own_key = True
+        return self.__rsa.new_key()
@@ -0,0 +1,152 @@
+"""
+fridex/connection/encryption/_key_pool.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor, Future
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives import serialization
+from typing import TypedDict
+from collections import deque
+from threading import Lock
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class KeyPoolStats(TypedDict):
+    hits: int
+    misses: int
+    available: int
+    pending: int
+
+
+def _generate_key(key_size: int) -> rsa.RSAPrivateKey:
+    """
+    Generate a new private key
+    :param key_size: Size of the key in bits
+    :return: Private key
+    """
+    return rsa.generate_private_key(public_exponent=65537, key_size=key_size)
+
+
+def _generate_key_der(key_size: int) -> bytes:
+    """
+    Generate a new private key in a worker process
+    :param key_size: Size of the key in bits
+    :return: DER encoded private key (keys themselves can't be pickled)
+    """
+    return _generate_key(key_size).private_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption()
+    )
+
+
+class KeyPool:
+    """
+    Process-wide bounded pool of pregenerated RSA keys
+    Keys are generated in the background so taking one doesn't block the connection
+    """
+    __keys: dict[int, deque[rsa.RSAPrivateKey]] = {}
+    __pending: dict[int, int] = {}
+    __size: int = 4
+    __executor: Executor | None = None
+
+    __hits: int = 0
+    __misses: int = 0
+    __lock: Lock = Lock()
+
+    @classmethod
+    def configure(cls, size: int = 4, executor: Executor | None = None) -> None:
+        """
+        Configure the pool (keys that are already generated stay available)
+        :param size: Number of keys to keep ready for each key size (0 disables pregeneration)
+        :param executor: Executor to generate keys on (ThreadPoolExecutor or ProcessPoolExecutor),
+                         a single background thread if None
+        """
+        with cls.__lock:
+            cls.__size = size
+            cls.__executor = executor
+
+    @classmethod
+    def get(cls, key_size: int) -> rsa.RSAPrivateKey:
+        """
+        Take a key from the pool or generate one directly if the pool is empty
+        :param key_size: Size of the key in bits
+        :return: Private key that is not used by anyone else
+        """
+        with cls.__lock:
+            keys: deque[rsa.RSAPrivateKey] = cls.__keys.setdefault(key_size, deque())
+            key: rsa.RSAPrivateKey | None = keys.popleft() if keys else None
+
+            if key is None:
+                cls.__misses += 1
+            else:
+                cls.__hits += 1
+
+        cls.prefill(key_size)
+
+        if key is None:
+            key = _generate_key(key_size)
+        return key
+
+    @classmethod
+    def prefill(cls, key_size: int) -> None:
+        """
+        Start generating keys until the pool is full
+        :param key_size: Size of the keys in bits
+        """
+        with cls.__lock:
+            missing: int = cls.__size - len(cls.__keys.setdefault(key_size, deque())) - cls.__pending.get(key_size, 0)
+            if missing <= 0:
+                return
+
+            if cls.__executor is None:
+                cls.__executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fridex-key-pool")
+
+            cls.__pending[key_size] = cls.__pending.get(key_size, 0) + missing
+            executor: Executor = cls.__executor
+
+        generate = _generate_key_der if isinstance(executor, ProcessPoolExecutor) else _generate_key
+        for _ in range(missing):
+            executor.submit(generate, key_size).add_done_callback(
+                lambda future: cls.__add(key_size, future)
+            )
+
+    @classmethod
+    def __add(cls, key_size: int, future: Future) -> None:
+        """
+        Put a generated key into the pool
+        :param key_size: Size of the key in bits
+        :param future: Finished generation
+        """
+        key: rsa.RSAPrivateKey | bytes | None = None if future.cancelled() or future.exception() else future.result()
+        if isinstance(key, bytes):
+            key = serialization.load_der_private_key(key, password=None)
+
+        with cls.__lock:
+            cls.__pending[key_size] -= 1
+            if key is not None and len(cls.__keys[key_size]) < cls.__size:
+                cls.__keys[key_size].append(key)
+
+    @classmethod
+    def stats(cls) -> KeyPoolStats:
+        """
+        :return: Pool hits and misses since start, ready and pending keys over all key sizes
+        """
+        with cls.__lock:
+            return {
+                "hits": cls.__hits,
+                "misses": cls.__misses,
+                "available": sum(len(keys) for keys in cls.__keys.values()),
+                "pending": sum(cls.__pending.values())
+            }
@@ -15,6 +15,7 @@ from cryptography.hazmat.primitives import serialization, hashes
 from cryptography.hazmat.backends import default_backend
 
 from ._cryption_method import CryptionMethod
+from ._key_pool import KeyPool
 
 
 ##################################################
@@ -43,43 +44,44 @@ class PrivatePublicCryption(CryptionMethod):
         self.__public_str = None
         self.__key_size = (256 + 66) * 8
 
+        KeyPool.prefill(self.__key_size)
+
     def encrypt(self, message: bytes) -> bytes:
         if self.__foreign_public_key is not None:
             size: int = (self.__foreign_public_key.key_size // 8) - 66
-            splits: list[bytes] = [message[i:i + size] for i in range(0, len(message), size)]
-            encrypted_result: bytes = b''
 
-            for split in splits:
-                encrypted_result += self.__foreign_public_key.encrypt(
-                    split,
+            encrypted_result: bytes = b''.join(
+                self.__foreign_public_key.encrypt(
+                    message[i:i + size],
                     padding.OAEP(
                         mgf=padding.MGF1(algorithm=hashes.SHA256()),
                         algorithm=hashes.SHA256(),
                         label=None
                     )
                 )
+                for i in range(0, len(message), size)
+            )
 
         else:
             encrypted_result = message
 
         return encrypted_result
 
-    def decrypt(self, message: bytes) -> bytes:
-        decrypted_result: bytes = b""
-
+    def decrypt(self, message: bytes | memoryview) -> bytes | memoryview:
         if self.__own_public_key is not None:
-
             size: int = (self.__own_private_key.key_size // 8)
-            splits: list[bytes] = [message[i:i+size] for i in range(0, len(message), size)]
-            for split in splits:
-                decrypted_result += self.__own_private_key.decrypt(
-                    split,
+
+            decrypted_result: bytes | memoryview = b''.join(
+                self.__own_private_key.decrypt(
+                    bytes(message[i:i + size]),
                     padding.OAEP(
                         mgf=padding.MGF1(algorithm=hashes.SHA256()),
                         algorithm=hashes.SHA256(),
                         label=None
                     )
                 )
+                for i in range(0, len(message), size)
+            )
         else:
             decrypted_result = message
 
@@ -97,7 +99,7 @@ class PrivatePublicCryption(CryptionMethod):
         )
 
     def new_key(self) -> str:
-        self.__own_private_key = rsa.generate_private_key(public_exponent=65537, key_size=self.__key_size)
+        self.__own_private_key = KeyPool.get(self.__key_size)
         self.__own_public_key = self.__own_private_key.public_key()
 
         self.__public_str = self.__own_public_key.public_bytes(
@@ -0,0 +1,44 @@
+"""
+fridex/connection/encryption/_test_hybrid.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from ._supertest_cryption import CryptionTest
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class HybridTest(CryptionTest):
+    """
+    Test Hybrid (RSA + AES-GCM) encryption
+    """
+    _cryption = "hybrid"
+
+    def test_multiple_messages(self) -> None:
+        """
+        Test that only the first message carries the wrapped session key
+        """
+        self.test_keys()
+        first_size: int = len(self._encrypted_left)
+
+        self.dual_side_exchange()
+        self.assertLess(len(self._encrypted_left), first_size)
+
+    def test_rekey(self) -> None:
+        """
+        Test a second key exchange while messages keep flowing
+        """
+        self.test_keys()
+
+        self._right.set_key(self._left.new_key())
+        self._left.set_key(self._right.new_key())
+        self.dual_side_exchange()
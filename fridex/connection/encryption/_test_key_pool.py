@@ -0,0 +1,58 @@
+"""
+fridex/connection/encryption/_test_key_pool.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from time import sleep
+import unittest
+
+from ._key_pool import KeyPool
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class KeyPoolTest(unittest.TestCase):
+    """
+    Test KeyPool
+    """
+    key_size: int = 1024
+
+    def wait_filled(self) -> None:
+        """
+        Wait until no more keys are generated
+        """
+        while KeyPool.stats()["pending"]:
+            sleep(0.05)
+
+    def test_hit(self) -> None:
+        """
+        Test taking a pregenerated key
+        """
+        KeyPool.prefill(self.key_size)
+        self.wait_filled()
+
+        before = KeyPool.stats()
+        key = KeyPool.get(self.key_size)
+
+        self.assertEqual(key.key_size, self.key_size)
+        self.assertEqual(KeyPool.stats()["hits"], before["hits"] + 1)
+        self.assertEqual(KeyPool.stats()["misses"], before["misses"])
+
+    def test_unique_keys(self) -> None:
+        """
+        Test that every key is only handed out once, also when the pool runs empty
+        """
+        keys = [KeyPool.get(self.key_size) for _ in range(8)]
+        numbers = {key.private_numbers().p for key in keys}
+
+        self.assertEqual(len(numbers), len(keys))
+        self.wait_filled()
@@ -5,11 +5,14 @@ Project: Fridrich-Connection
 Created: 25.05.2023
 Author: Lukas Krahbichler
 """
-from ._types import MessageDict, BulkDict, KINDS, DIRECTIONS, DATAUNIT
+from ._types import MessageDict, BulkDict, KINDS, DIRECTIONS, DATAUNIT, RAW_MESSAGE
+from ._codec import Codec, CodecService, JsonCodec, MsgpackCodec, CODECS
 from ._communication import CommunicationProtocol, CommunicationData
-from ._subscription import SubscriptionProtocol, SubscriptionRequest
-from ._protocol import Protocol, MessageToLongError
+from ._subscription import SubscriptionProtocol, SubscriptionRequest, SubscriptionDelta
+from ._subscription_registry import SubscriptionRegistry, BroadcastStats, canonical_key
+from ._protocol import Protocol, MessageToLongError, InFlightLimitError
 from ._protocol_interface import ProtocolInterface
 from ._control import ControlData, ControlProtocol
-from ._cache import CacheEntry, Cache
-from ._data import DataProtocol
+from ._cache import CacheEntry, CacheStats, Cache
+from ._framer import StreamFramer
+from ._data import DataProtocol, RequestError, DeadlineExceededError
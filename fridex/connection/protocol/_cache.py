@@ -11,8 +11,12 @@ Author: Lukas Krahbichler
 ##################################################
 
 from typing import TypedDict, Type
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from time import monotonic
+from threading import Lock
+import heapq
 
+from ._subscription_registry import canonical_key
 from ._types import DATAUNIT
 
 
@@ -22,37 +26,84 @@ from ._types import DATAUNIT
 
 class CacheEntry(TypedDict):
     value: Type[DATAUNIT]
-    lease_time: datetime
+    lease_time: float
+    updated: float
+
+
+class CacheStats(TypedDict):
+    hits: int
+    misses: int
+    evictions: int
+    expirations: int
+    size: int
 
 
 class Cache:
     """
     Caching for subscriptions
+    Keys are request dictonaries (stored by their canonical key), the least recently used entry
+    is evicted when the cache is full and entries expire when they weren't used for their lifetime
     """
-    __values: dict[DATAUNIT, CacheEntry]
-    __lifetime: float
-
-    def __init__(self, lifetime: float | None = 30.0) -> None:
+    __values: OrderedDict[str, CacheEntry]
+    __expiries: list[tuple[float, str]]
+    __lifetime: float | None
+    __capacity: int | None
+    __lock: Lock
+
+    __hits: int
+    __misses: int
+    __evictions: int
+    __expirations: int
+
+    def __init__(self, lifetime: float | None = 30.0, capacity: int | None = 1024) -> None:
         """
         Create empty cache
-        :param lifetime: The time after a value is dropped if it's not used
+        :param lifetime: The time after a value is dropped if it's not used (None to keep it until evicted)
+        :param capacity: Maximum number of entries (None for unbounded)
         """
         self.__lifetime = lifetime
+        self.__capacity = capacity
+        self.__lock = Lock()
+
+        self.__values = OrderedDict()
+        self.__expiries = []
+
+        self.__hits = 0
+        self.__misses = 0
+        self.__evictions = 0
+        self.__expirations = 0
+
+    def __lease(self, key: str, entry: CacheEntry) -> None:
+        """
+        Start a new leasetime for an entry (the entry has to be stored already)
+        :param key: Canonical key of the entry
+        :param entry: Entry to renew
+        """
+        if self.__lifetime is None:
+            entry["lease_time"] = float("inf")
+            return
+
+        entry["lease_time"] = monotonic() + self.__lifetime
+        heapq.heappush(self.__expiries, (entry["lease_time"], key))
 
-        self.__values = {}
+        # old leases stay in the heap until they are popped, rebuild it if they pile up
+        if len(self.__expiries) > 2 * len(self.__values) + 64:
+            self.__expiries = [(entry["lease_time"], key) for key, entry in self.__values.items()]
+            heapq.heapify(self.__expiries)
 
     def _kill_dead(self) -> None:
         """
-        Check all leasetimes and drop old entries
+        Drop all entries whose leasetime is over (only looks at the due part of the heap)
         """
-        to_drop: list[DATAUNIT] = []
+        now: float = monotonic()
 
-        for key, value in self.__values.items():
-            if datetime.now() > value["lease_time"]:
-                to_drop.append(key)
+        while self.__expiries and self.__expiries[0][0] <= now:
+            lease_time, key = heapq.heappop(self.__expiries)
+            entry: CacheEntry | None = self.__values.get(key)
 
-        for drop in to_drop:
-            self.__values.pop(drop)
+            if entry is not None and entry["lease_time"] == lease_time:
+                self.__values.pop(key)
+                self.__expirations += 1
 
     def set(
         self,
@@ -64,9 +115,19 @@ class Cache:
         :param key: Key to associate the value
         :param value: Data to save
         """
-        self.__values[key] = {"value": value, "lease_time": datetime.now() + timedelta(seconds=self.__lifetime)}
+        key: str = canonical_key(key)
+
+        with self.__lock:
+            self._kill_dead()
+
+            entry: CacheEntry = {"value": value, "lease_time": float("inf"), "updated": monotonic()}
+            self.__values[key] = entry
+            self.__values.move_to_end(key)
+            self.__lease(key, entry)
 
-        self._kill_dead()
+            while self.__capacity is not None and len(self.__values) > self.__capacity:
+                self.__values.popitem(last=False)
+                self.__evictions += 1
 
     def get(
         self,
@@ -77,8 +138,63 @@ class Cache:
         :param key: The key to look for
         :return: Value if entry with key exists
         """
-        if key in self.__values:
-            self.__values[key]["lease_time"] = datetime.now() + timedelta(seconds=self.__lifetime)
+        key: str = canonical_key(key)
+
+        with self.__lock:
+            self._kill_dead()
+
+            entry: CacheEntry | None = self.__values.get(key)
+            if entry is None:
+                self.__misses += 1
+                return None
+
+            self.__hits += 1
+            self.__lease(key, entry)
+            self.__values.move_to_end(key)
+
+            return entry["value"]
+
+    def age(self, key: DATAUNIT) -> float | None:
+        """
+        Get the time since an entry was last set (doesn't count as use)
+        :param key: Key of the entry
+        :return: Age in seconds, None if the entry doesn't exist
+        """
+        with self.__lock:
+            entry: CacheEntry | None = self.__values.get(canonical_key(key))
+            return None if entry is None else monotonic() - entry["updated"]
+
+    def delete(self, key: DATAUNIT) -> None:
+        """
+        Drop an entry if it exists
+        :param key: Key of the entry
+        """
+        with self.__lock:
+            self.__values.pop(canonical_key(key), None)
 
-            return self.__values[key]
-        return None
+    def clear(self) -> None:
+        """
+        Drop all entries
+        """
+        with self.__lock:
+            self.__values.clear()
+            self.__expiries = []
+
+    def stats(self) -> CacheStats:
+        """
+        :return: Hits, misses, evictions (capacity) and expirations (lifetime) since start and current size
+        """
+        with self.__lock:
+            return {
+                "hits": self.__hits,
+                "misses": self.__misses,
+                "evictions": self.__evictions,
+                "expirations": self.__expirations,
+                "size": len(self.__values)
+            }
+
+    def __len__(self) -> int:
+        """
+        :return: Number of entries (including expired ones that weren't dropped yet)
+        """
+        return len(self.__values)
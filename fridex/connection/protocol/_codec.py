@@ -0,0 +1,172 @@
+"""
+fridex/connection/protocol/_codec.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from typing import Literal, get_args
+from json import dumps, loads
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+from ._types import BulkDict, DATAUNIT, RAW_MESSAGE
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+CODECS = Literal["json", "msgpack"]
+
+
+class Codec:
+    """
+    Every codec should inherit from this and overwrite all functions
+    Encoded messages have to be distinguishable by their first byte (see CodecService.detect)
+    """
+    name: CODECS
+
+    def encode(self, message: BulkDict) -> RAW_MESSAGE:
+        """
+        Serialize a message
+        :param message: Message dictonary
+        :return: Encoded message
+        """
+        ...
+
+    def decode(self, message: bytes | memoryview) -> BulkDict:
+        """
+        Deserialize a message
+        :param message: Encoded message
+        :return: Message dictonary
+        """
+        ...
+
+    def encode_value(self, value: DATAUNIT) -> RAW_MESSAGE:
+        """
+        Serialize a single value to splice it into messages later (see encode_prepared)
+        :param value: Value to serialize
+        :return: Encoded value
+        """
+        ...
+
+    def encode_prepared(self, message: BulkDict, prepared: RAW_MESSAGE) -> RAW_MESSAGE:
+        """
+        Serialize a message whose submessages all carry the same already encoded value
+        Only the envelope is serialized, the value is copied in as it is
+        :param message: Message dictonary (the data of the submessages is ignored)
+        :param prepared: Value encoded by encode_value of the same codec
+        :return: Encoded message
+        """
+        ...
+
+
+class JsonCodec(Codec):
+    """
+    Default text codec
+    """
+    name = "json"
+
+    def encode(self, message: BulkDict) -> str:
+        return dumps(message)
+
+    def encode_value(self, value: DATAUNIT) -> str:
+        return dumps(value)
+
+    def encode_prepared(self, message: BulkDict, prepared: str) -> str:
+        submessages: str = ",".join(
+            dumps({key: value for key, value in sub.items() if key != "data"})[:-1] + ',"data":' + prepared + "}"
+            for sub in message["data"]
+        )
+        return dumps({key: value for key, value in message.items() if key != "data"})[:-1] + \
+            ',"data":[' + submessages + "]}"
+
+    def decode(self, message: bytes | memoryview) -> BulkDict:
+        return loads(str(message, "UTF-8"))
+
+
+class MsgpackCodec(Codec):
+    """
+    Compact binary codec (requires the optional msgpack package)
+    """
+    name = "msgpack"
+
+    def encode(self, message: BulkDict) -> bytes:
+        return msgpack.packb(message, use_bin_type=True)
+
+    def encode_value(self, value: DATAUNIT) -> bytes:
+        return msgpack.packb(value, use_bin_type=True)
+
+    def encode_prepared(self, message: BulkDict, prepared: bytes) -> bytes:
+        packer: msgpack.Packer = msgpack.Packer(use_bin_type=True)
+        parts: list[bytes] = [packer.pack_map_header(len(message))]
+
+        for key, value in message.items():
+            if key != "data":
+                parts += [packer.pack(key), packer.pack(value)]
+
+        parts += [packer.pack("data"), packer.pack_array_header(len(message["data"]))]
+        for sub in message["data"]:
+            parts.append(packer.pack_map_header(len(sub)))
+            for key, value in sub.items():
+                if key != "data":
+                    parts += [packer.pack(key), packer.pack(value)]
+            parts += [packer.pack("data"), prepared]
+
+        return b''.join(parts)
+
+    def decode(self, message: bytes | memoryview) -> BulkDict:
+        return msgpack.unpackb(message, raw=False, strict_map_key=False)
+
+
+class CodecService:
+    """
+    Create codecs and detect the codec of received messages
+    """
+    __json: JsonCodec = JsonCodec()
+    __msgpack: MsgpackCodec = MsgpackCodec()
+
+    @staticmethod
+    def available() -> list[CODECS]:
+        """
+        :return: All codecs that can be used in this environment
+        """
+        return [codec for codec in get_args(CODECS) if codec != "msgpack" or msgpack is not None]
+
+    @staticmethod
+    def new_codec(codec: CODECS = "json") -> Codec:
+        """
+        Get a codec by name
+        :param codec: Name of the codec
+        :return: Codec instance
+        :raises ValueError: If the codec is not available
+        """
+        if codec not in CodecService.available():
+            raise ValueError(f"Codec '{codec}' is not available")
+
+        match codec:
+            case "json":
+                return CodecService.__json
+            case "msgpack":
+                return CodecService.__msgpack
+
+    @staticmethod
+    def detect(message: bytes | memoryview) -> Codec:
+        """
+        Get the codec a message was encoded with
+        JSON messages always start with '{', everything else is binary
+        :param message: Encoded message
+        :return: Codec to decode the message
+        """
+        if message[:1] == b'{' or msgpack is None:
+            return CodecService.__json
+        return CodecService.__msgpack
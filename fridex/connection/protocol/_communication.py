@@ -12,8 +12,9 @@ Author: Lukas Krahbichler
 
 from typing import TypedDict, Any, Callable, Literal
 
-from ._types import BulkDict, MessageDict
+from ._types import BulkDict, MessageDict, RAW_MESSAGE
 from ._protocol import Protocol
+from ._codec import Codec
 
 from ..encryption import CRYPTION_METHODS
 
@@ -23,7 +24,7 @@ from ..encryption import CRYPTION_METHODS
 ##################################################
 
 class CommunicationData(TypedDict):
-    type: Literal["key", "max_bytes", "cryption", "state"]
+    type: Literal["key", "max_bytes", "cryption", "state", "codec"]
     value: Any
 
 
@@ -42,6 +43,8 @@ class CommunicationProtocol:
     CRYPTION_RES_CALLBACK_TYPE = Callable[[str], tuple[NEW_KEY_CALLBACK_TYPE, SET_KEY_CALLBACK_TYPE]]
     PAUSE_CONNECTION_CALLBACK_TYPE = Callable[[], Any]
     RESUME_CONNECTION_CALLBACK_TYPE = Callable[[], Any]
+    CODEC_REQ_CALLBACK_TYPE = Callable[[str], str]
+    CODEC_RES_CALLBACK_TYPE = Callable[[str], Any]
 
     __new_key_callback: NEW_KEY_CALLBACK_TYPE
     __set_key_callback: SET_KEY_CALLBACK_TYPE
@@ -51,6 +54,8 @@ class CommunicationProtocol:
     __cryption_res_callback: CRYPTION_RES_CALLBACK_TYPE
     __pause_connection_callback: PAUSE_CONNECTION_CALLBACK_TYPE
     __resume_connection_callback: RESUME_CONNECTION_CALLBACK_TYPE
+    __codec_req_callback: CODEC_REQ_CALLBACK_TYPE | None
+    __codec_res_callback: CODEC_RES_CALLBACK_TYPE | None
 
     def __init__(
             self,
@@ -62,7 +67,9 @@ class CommunicationProtocol:
             cryption_req_callback: CRYPTION_REQ_CALLBACK_TYPE,
             cryption_res_callback: CRYPTION_RES_CALLBACK_TYPE,
             pause_connection_callback: PAUSE_CONNECTION_CALLBACK_TYPE,
-            resume_connection_callback: RESUME_CONNECTION_CALLBACK_TYPE
+            resume_connection_callback: RESUME_CONNECTION_CALLBACK_TYPE,
+            codec_req_callback: CODEC_REQ_CALLBACK_TYPE | None = None,
+            codec_res_callback: CODEC_RES_CALLBACK_TYPE | None = None
     ) -> None:
         """
         Create communication protocol
@@ -75,6 +82,8 @@ class CommunicationProtocol:
         :param cryption_res_callback: Callback to confirm cryption change and set key
         :param pause_connection_callback: Callback to pause connection if requested
         :param resume_connection_callback: Callback to resume connection if requested
+        :param codec_req_callback: Callback to switch to a requested codec, returns the accepted codec
+        :param codec_res_callback: Callback to switch to the codec the other side accepted
         """
         self.__protocol = Protocol("com", id_range)
         self.__new_key_callback = new_key_callback
@@ -85,8 +94,17 @@ class CommunicationProtocol:
         self.__cryption_res_callback = cryption_res_callback
         self.__pause_connection_callback = pause_connection_callback
         self.__resume_connection_callback = resume_connection_callback
+        self.__codec_req_callback = codec_req_callback
+        self.__codec_res_callback = codec_res_callback
 
-    def __response(self, data: CommunicationData, id_: int) -> str:
+    def set_codec(self, codec: Codec) -> None:
+        """
+        Change the codec for outgoing messages
+        :param codec: New codec
+        """
+        self.__protocol.set_codec(codec)
+
+    def __response(self, data: CommunicationData, id_: int) -> RAW_MESSAGE:
         """
         General response encapsulation
         :param data: Response dictonary
@@ -96,7 +114,7 @@ class CommunicationProtocol:
         self.__protocol.response_add(data, id_)
         return self.__protocol.response_get()
 
-    def __request(self, data: CommunicationData) -> str:
+    def __request(self, data: CommunicationData) -> RAW_MESSAGE:
         """
         General request encapsulation
         :param data: Dictonary to encapsulate
@@ -105,14 +123,14 @@ class CommunicationProtocol:
         self.__protocol.request_add(data)
         return self.__protocol.request_get()
 
-    def request_key_exchange(self) -> str:
+    def request_key_exchange(self) -> RAW_MESSAGE:
         """
         Request exchanging encryption keys
         :return: Raw string to send
         """
         return self.__request({"type": "key", "value": self.__new_key_callback()})
 
-    def _response_key_exchange(self, id_: int) -> str:
+    def _response_key_exchange(self, id_: int) -> RAW_MESSAGE:
         """
         Also send back a new key
         :param id_: ID of the conversation
@@ -120,7 +138,7 @@ class CommunicationProtocol:
         """
         return self.__response({"type": "key", "value": self.__new_key_callback()}, id_)
 
-    def request_max_bytes(self, num: int) -> str:
+    def request_max_bytes(self, num: int) -> RAW_MESSAGE:
         """
         Redefine number of bytes to communicate length
         :param num: Number of bytes
@@ -129,7 +147,7 @@ class CommunicationProtocol:
         self.__protocol.set_max_bytes(num)
         return self.__request({"type": "max_bytes", "value": num})
 
-    def request_crpytion(self, new_cryption: CRYPTION_METHODS, new_key: str | None = None) -> str:
+    def request_crpytion(self, new_cryption: CRYPTION_METHODS, new_key: str | None = None) -> RAW_MESSAGE:
         """
         Request to change the encryption
         :param new_cryption: New encryption to use
@@ -138,7 +156,7 @@ class CommunicationProtocol:
         """
         return self.__request({"type": "cryption", "value": {"name": new_cryption, "key": new_key}})
 
-    def _response_cryption(self, id_: int) -> str:
+    def _response_cryption(self, id_: int) -> RAW_MESSAGE:
         """
         Response to cryption change with a key
         :param id_: ID of the conversation
@@ -146,14 +164,14 @@ class CommunicationProtocol:
         """
         return self.__response({"type": "cryption", "value": self.__new_key_callback()}, id_)
 
-    def request_pause(self) -> str:
+    def request_pause(self) -> RAW_MESSAGE:
         """
         Request to pause connection
         :return: String to send
         """
         return self.__request({"type": "state", "value": "pause"})
 
-    def _response_pause(self, id_: int) -> str:
+    def _response_pause(self, id_: int) -> RAW_MESSAGE:
         """
         Respone to pause connection request
         :param id_: ID of the conversation
@@ -161,14 +179,14 @@ class CommunicationProtocol:
         """
         return self.__response({"type": "state", "value": "pause"}, id_)
 
-    def request_resume(self) -> str:
+    def request_resume(self) -> RAW_MESSAGE:
         """
         Request to resume connection
         :return: String to send
         """
         return self.__request({"type": "state", "value": "resume"})
 
-    def _response_resume(self, id_: int) -> str:
+    def _response_resume(self, id_: int) -> RAW_MESSAGE:
         """
         Respone to resume connection request
         :param id_: ID of the conversation
@@ -176,6 +194,24 @@ class CommunicationProtocol:
         """
         return self.__response({"type": "state", "value": "resume"}, id_)
 
+    def request_codec(self, codec: str) -> RAW_MESSAGE:
+        """
+        Request to encode messages with another codec
+        Messages are self-describing, so this doesn't need to pause the connection
+        :param codec: Name of the codec
+        :return: String to send
+        """
+        return self.__request({"type": "codec", "value": codec})
+
+    def _response_codec(self, id_: int, codec: str) -> RAW_MESSAGE:
+        """
+        Response to codec change with the codec that is used from now on
+        :param id_: ID of the conversation
+        :param codec: Accepted codec
+        :return: String to send
+        """
+        return self.__response({"type": "codec", "value": codec}, id_)
+
     def process_response(self, message: BulkDict) -> None:
         """
         Process incoming communication responses
@@ -192,8 +228,11 @@ class CommunicationProtocol:
                 self.__control_callback()
             case "state":
                 self.__control_callback()
+            case "codec":
+                if self.__codec_res_callback is not None:
+                    self.__codec_res_callback(submessage["data"]["value"])
 
-    def process_request(self, message: BulkDict) -> str | None:
+    def process_request(self, message: BulkDict) -> RAW_MESSAGE | None:
         """
         Process incoming communication requests
         :param message: Request message
@@ -216,6 +255,12 @@ class CommunicationProtocol:
                                                  submessage["data"]["value"]["key"])
                 return self._response_cryption(id_)
 
+            case "codec":
+                accepted: str = "json"
+                if self.__codec_req_callback is not None:
+                    accepted = self.__codec_req_callback(submessage["data"]["value"])
+                return self._response_codec(id_, accepted)
+
             case "state":
                 match submessage["data"]["value"]:
                     case "pause":
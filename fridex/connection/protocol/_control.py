@@ -12,8 +12,9 @@ Author: Lukas Krahbichler
 
 from typing import TypedDict, Literal, Callable, Any
 
-from ._types import BulkDict, MessageDict
+from ._types import BulkDict, MessageDict, RAW_MESSAGE
 from ._protocol import Protocol
+from ._codec import Codec
 
 
 ##################################################
@@ -47,7 +48,14 @@ class ControlProtocol:
         self.__protocol = Protocol("con", id_range)
         self.__ping_callback = ping_callback
 
-    def __response(self, data: ControlData, id_: int) -> str:
+    def set_codec(self, codec: Codec) -> None:
+        """
+        Change the codec for outgoing messages
+        :param codec: New codec
+        """
+        self.__protocol.set_codec(codec)
+
+    def __response(self, data: ControlData, id_: int) -> RAW_MESSAGE:
         """
         General response encapsulation
         :param data: Response dictonary
@@ -57,7 +65,7 @@ class ControlProtocol:
         self.__protocol.response_add(data, id_)
         return self.__protocol.response_get()
 
-    def __request(self, data: ControlData) -> str:
+    def __request(self, data: ControlData) -> RAW_MESSAGE:
         """
         General request encapsulation
         :param data: Dictonary to encapsulate
@@ -66,14 +74,14 @@ class ControlProtocol:
         self.__protocol.request_add(data)
         return self.__protocol.request_get()
 
-    def request_ping(self) -> str:
+    def request_ping(self) -> RAW_MESSAGE:
         """
         Request ping eachother
         :return: Ping string to send
         """
         return self.__request({"type": "ping"})
 
-    def _response_ping(self, id_: int) -> str:
+    def _response_ping(self, id_: int) -> RAW_MESSAGE:
         """
         Confirm ping request
         :param id_: ID of the conversation
@@ -81,7 +89,7 @@ class ControlProtocol:
         """
         return self.__response({"type": "ping"}, id_)
 
-    def request_alive(self) -> str:
+    def request_alive(self) -> RAW_MESSAGE:
         """
         Provide alive message
         :return: String to send
@@ -98,7 +106,7 @@ class ControlProtocol:
             case "ping":
                 self.__ping_callback()
 
-    def process_request(self, message: BulkDict) -> str | None:
+    def process_request(self, message: BulkDict) -> RAW_MESSAGE | None:
         """
         Process incoming control requests
         :param message: Request message
@@ -10,12 +10,19 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
-from concurrent.futures import Future
+from concurrent.futures import Future, Executor, InvalidStateError
+from typing import Callable, Awaitable, Any
+from threading import RLock, Lock
+from itertools import count
+from time import monotonic
 from json import loads
-from typing import Callable
+import inspect
+import asyncio
+import heapq
 
-from ._types import BulkDict, DATAUNIT
-from ._protocol import Protocol
+from ._subscription_registry import canonical_key
+from ._types import BulkDict, MessageDict, DATAUNIT, RAW_MESSAGE
+from ._protocol import Protocol, InFlightLimitError
 from ._cache import Cache
 
 
@@ -23,26 +30,95 @@ from ._cache import Cache
 #                     Code                       #
 ##################################################
 
+class RequestError(Exception):
+    """
+    The other side couldn't process a data request
+    """
+    ...
+
+
+class DeadlineExceededError(RequestError, TimeoutError):
+    """
+    A data request wasn't answered before its deadline
+    """
+    ...
+
+
+def _run_request(request_callback: Callable[[DATAUNIT], DATAUNIT], data: DATAUNIT, deadline: float | None) -> DATAUNIT:
+    """
+    Run a request callback if the deadline didn't pass yet (module level so it can be sent to worker processes)
+    :param request_callback: Callback to get information for the request
+    :param data: Request data
+    :param deadline: Local monotonic deadline or None
+    :return: Result of the request callback
+    :raises DeadlineExceededError: If the deadline passed while the request was waiting or being processed
+    """
+    if deadline is not None and monotonic() > deadline:
+        raise DeadlineExceededError("Deadline passed before the request was processed")
+
+    result: DATAUNIT = request_callback(data)
+    if deadline is not None and monotonic() > deadline:
+        raise DeadlineExceededError("Deadline passed while processing the request")
+    return result
+
+
 class DataProtocol(Protocol):
     """
     Protocol for custom traffic
     """
     __cache: Cache | None
 
-    REQUEST_CALLBACK_TYPE = Callable[[DATAUNIT], DATAUNIT]
+    REQUEST_CALLBACK_TYPE = Callable[[DATAUNIT], DATAUNIT] | Callable[[DATAUNIT], Awaitable[DATAUNIT]]
     REWORK_CALLBACK_TYPE = Callable[[DATAUNIT], DATAUNIT]
+    BATCH_CALLBACK_TYPE = Callable[[bool], Any]
+    SEND_CALLBACK_TYPE = Callable[[RAW_MESSAGE], Any]
+    SCHEDULE_CALLBACK_TYPE = Callable[[float, Callable[[], Any]], Any]
+
+    # Requests are failed up to this many seconds after their deadline so close deadlines share one check
+    DEADLINE_RESOLUTION: float = 0.01
 
     __request_callback: REQUEST_CALLBACK_TYPE
     __rework_callback: REWORK_CALLBACK_TYPE
+    __batch_callback: BATCH_CALLBACK_TYPE | None
+    __send_callback: SEND_CALLBACK_TYPE | None
+    __schedule_callback: SCHEDULE_CALLBACK_TYPE | None
+
+    __request_executor: Executor | None
+    __async_callback: bool
+    __streaming: bool
+    __response_lock: Lock
 
     __send_futures: dict[int, Future]
+    __raw_ids: set[int]
+    __running: dict[int, asyncio.Future | Future]
+    __deadlines: list[tuple[float, int, int, Future]]
+    __deadline_order: count
+    __next_check: float | None
+    __refetching: dict[str, Future]
+    __cache_refresh: float | None
+    __max_in_flight: int
+
+    __batch_max_count: int | None
+    __batch_max_bytes: int | None
+    __batch_count: int
+    __batch_bytes: int
+    __lock: RLock
 
     def __init__(
             self,
             id_range: range,
             request_callback: REQUEST_CALLBACK_TYPE,
             rework_callback: REWORK_CALLBACK_TYPE,
-            cache: Cache | None = None
+            cache: Cache | None = None,
+            batch_callback: BATCH_CALLBACK_TYPE | None = None,
+            batch_max_count: int | None = None,
+            batch_max_bytes: int | None = None,
+            request_executor: Executor | None = None,
+            send_callback: SEND_CALLBACK_TYPE | None = None,
+            stream_responses: bool = False,
+            schedule_callback: SCHEDULE_CALLBACK_TYPE | None = None,
+            cache_refresh: float | None = None,
+            max_in_flight: int | None = None
     ) -> None:
         """
         Create data protocol
@@ -50,52 +126,433 @@ class DataProtocol(Protocol):
         :param request_callback: Callback to get information for requests
         :param rework_callback: Callback to rework result before setting to future
         :param cache: Optional cache
+        :param batch_callback: Automatic batching, called after every added request (with True if the batch is full)
+        :param batch_max_count: Number of requests after which a batch is full
+        :param batch_max_bytes: Approximate encoded size after which a batch is full
+        :param request_executor: Executor to run request callbacks on (ThreadPool or ProcessPool)
+        :param send_callback: Callback to send responses that are finished outside of process_request
+        :param stream_responses: Answer every request on its own as soon as it's ready instead of one response bulk
+                                 (implied by request_executor and coroutine callbacks)
+        :param schedule_callback: Callback to call a function after a delay in seconds (required for request timeouts)
+        :param cache_refresh: Seconds after which a cached value is still served but refetched in the background
+        :param max_in_flight: Maximum number of requests waiting for their response (size of the id range if None)
         """
-        super().__init__("data", id_range)
+        super().__init__("data", id_range, in_use_callback=lambda id_: id_ in self.__send_futures)
         self.__request_callback = request_callback
         self.__rework_callback = rework_callback
         self.__cache = cache
+        self.__batch_callback = batch_callback
+        self.__send_callback = send_callback
+        self.__schedule_callback = schedule_callback
+
+        self.__request_executor = request_executor
+        self.__async_callback = inspect.iscoroutinefunction(request_callback)
+        self.__streaming = stream_responses or request_executor is not None or self.__async_callback
+        self.__response_lock = Lock()
+
+        self.__batch_max_count = batch_max_count
+        self.__batch_max_bytes = batch_max_bytes
+        self.__batch_count = 0
+        self.__batch_bytes = 0
+        self.__lock = RLock()
 
         self.__send_futures = {}
+        self.__raw_ids = set()
+        self.__running = {}
+        self.__deadlines = []
+        self.__deadline_order = count()
+        self.__next_check = None
+        self.__refetching = {}
+        self.__cache_refresh = cache_refresh
+        self.__max_in_flight = len(id_range) if max_in_flight is None else min(max_in_flight, len(id_range))
+
+    @property
+    def max_in_flight(self) -> int:
+        """
+        :return: Maximum number of requests waiting for their response at the same time
+        """
+        return self.__max_in_flight
+
+    @property
+    def in_flight(self) -> int:
+        """
+        :return: Number of requests waiting for their response
+        """
+        return len(self.__send_futures)
+
+    def request_start(self) -> None:
+        """
+        Start a bulk request message queue
+        """
+        with self.__lock:
+            super().request_start()
+            self.__batch_count = 0
+            self.__batch_bytes = 0
 
-    def request_add(self, message: DATAUNIT) -> Future:
+    def request_get(self, restart: bool = True) -> RAW_MESSAGE | None:
+        """
+        Get the whole request message queue
+        :param restart: Whether the request queue should be reseted
+        :return: String to send
+        """
+        with self.__lock:
+            return super().request_get(restart)
+
+    def request_add(self, message: DATAUNIT, timeout: float | None = None) -> Future:
         """
         Add a message to the request bulk queue
         :param message: Message to add
-        :return: Future instance to receive the result
+        :param timeout: Seconds until the request fails with DeadlineExceededError (None for no deadline).
+                        The deadline is sent along so the other side skips the request once it's expired.
+        :return: Future instance to receive the result (cancelling it tells the other side to skip the request)
+        :raises InFlightLimitError: If max_in_flight requests are already waiting for their response
         """
         future: Future = Future()
 
-        if self.__cache:
-            value = self.__cache.get(message)
-            if value:
+        if self.__cache is not None:
+            value: DATAUNIT | None = self.__cache.get(message)
+            if value is not None:
+                if self.__cache_refresh is not None and self.__cache.age(message) > self.__cache_refresh:
+                    try:
+                        self.refetch(message).add_done_callback(lambda done: self.__refreshed(message, done))
+                    except InFlightLimitError:  # the stale value is served until a later request refreshes it
+                        ...
+
                 future.set_result(self.__rework_callback(value))
                 return future
 
-        super().request_add(message)
+        with self.__lock:
+            if len(self.__send_futures) >= self.max_in_flight:
+                raise InFlightLimitError(f"{len(self.__send_futures)} requests are already in flight")
+
+            id_: int = super().request_add(message, timeout=timeout)
+            self.__send_futures[id_] = future
+
+            self.__batch_count += 1
+            if self.__batch_max_bytes is not None:
+                encoded: RAW_MESSAGE = message if isinstance(message, str | bytes) else self.codec.encode(message)
+                self.__batch_bytes += len(encoded)
+
+            full: bool = (self.__batch_max_count is not None and self.__batch_count >= self.__batch_max_count) or \
+                         (self.__batch_max_bytes is not None and self.__batch_bytes >= self.__batch_max_bytes)
+
+        if timeout is not None and self.__schedule_callback is not None:
+            self.__add_deadline(monotonic() + timeout, id_, future)
+
+        future.add_done_callback(lambda done: done.cancelled() and self.__cancel(id_, done))
+
+        if self.__batch_callback is not None:
+            self.__batch_callback(full)
 
-        self.__send_futures[self._id_count-1] = future
         return future
 
+    def request_add_many(self, messages: list[DATAUNIT], timeout: float | None = None) -> list[Future]:
+        """
+        Add several messages to the request bulk queue, either all of them or none
+        :param messages: Messages to add
+        :param timeout: Seconds until each request fails with DeadlineExceededError (None for no deadline)
+        :return: Future instances to receive the results in the same order
+        :raises InFlightLimitError: If the requests don't fit into max_in_flight anymore (none of them is added)
+        """
+        with self.__lock:
+            if len(self.__send_futures) + len(messages) > self.max_in_flight:
+                raise InFlightLimitError(f"{len(self.__send_futures)} requests are already in flight, "
+                                         f"{len(messages)} more don't fit")
+
+            return [self.request_add(message, timeout) for message in messages]
+
+    def refetch(self, message: DATAUNIT) -> Future:
+        """
+        Request a value in the background, bypassing the cache and the request queue
+        Refetches of the same request that are still running are shared
+        :param message: Message to request
+        :return: Future with the result (not reworked)
+        :raises InFlightLimitError: If max_in_flight requests are already waiting for their response
+        :raises ConnectionError: If there is no callback to send the request
+        """
+        if self.__send_callback is None:
+            raise ConnectionError("Can't send requests in the background")
+
+        key: str = canonical_key(message)
+
+        with self.__lock:
+            running: Future | None = self.__refetching.get(key)
+            if running is not None:
+                return running
+
+            if len(self.__send_futures) >= self.max_in_flight:
+                raise InFlightLimitError(f"{len(self.__send_futures)} requests are already in flight")
+
+            future: Future = Future()
+            id_, raw = self.request_single(message)
+
+            self.__send_futures[id_] = future
+            self.__raw_ids.add(id_)
+            self.__refetching[key] = future
+
+        future.add_done_callback(lambda _: self.__refetching.pop(key, None))
+        self.__send_callback(raw)
+        return future
+
+    def __refreshed(self, message: DATAUNIT, done: Future) -> None:
+        """
+        Update a stale cache entry after it was refetched (if it wasn't dropped meanwhile)
+        :param message: Requested message
+        :param done: Finished refetch
+        """
+        if not done.cancelled() and done.exception() is None and self.__cache.age(message) is not None:
+            self.__cache.set(message, done.result())
+
+    def __add_deadline(self, deadline: float, id_: int, future: Future) -> None:
+        """
+        Track the deadline of a request, all deadlines share one heap and one scheduled check
+        :param deadline: Monotonic time the request fails
+        :param id_: ID of the request
+        :param future: Future of the request
+        """
+        with self.__lock:
+            heapq.heappush(self.__deadlines, (deadline, next(self.__deadline_order), id_, future))
+
+            # answered requests stay in the heap until they are due, rebuild it if they pile up
+            if len(self.__deadlines) > 2 * len(self.__send_futures) + 64:
+                self.__deadlines = [entry for entry in self.__deadlines if not entry[3].done()]
+                heapq.heapify(self.__deadlines)
+
+            check: float = deadline + self.DEADLINE_RESOLUTION
+            schedule: bool = self.__next_check is None or check < self.__next_check - self.DEADLINE_RESOLUTION
+            if schedule:
+                self.__next_check = check
+
+        if schedule:
+            self.__schedule_callback(max(check - monotonic(), 0), lambda: self.__expire_due(check))
+
+    def __expire_due(self, check: float) -> None:
+        """
+        Fail all requests whose deadline passed and schedule the next check
+        :param check: Time this check was scheduled for (it's outdated if another check took over)
+        """
+        expired: list[tuple[int, Future]] = []
+
+        with self.__lock:
+            if check != self.__next_check:
+                return
+
+            now: float = max(monotonic(), check)
+            while self.__deadlines and self.__deadlines[0][0] <= now:
+                _, _, id_, future = heapq.heappop(self.__deadlines)
+                if self.__send_futures.get(id_) is future:
+                    self.__send_futures.pop(id_)
+                    self.__raw_ids.discard(id_)
+                    expired.append((id_, future))
+
+            self.__next_check = self.__deadlines[0][0] + self.DEADLINE_RESOLUTION if self.__deadlines else None
+            next_check: float | None = self.__next_check
+
+        if next_check is not None:
+            self.__schedule_callback(max(next_check - monotonic(), 0), lambda: self.__expire_due(next_check))
+
+        for id_, future in expired:
+            self.__resolve(future, exception=DeadlineExceededError(f"Request {id_} wasn't answered in time"))
+
+    def __cancel(self, id_: int, future: Future) -> None:
+        """
+        A request was cancelled locally, forget it and tell the other side to skip it
+        :param id_: ID of the request
+        :param future: Future of the request (the ID could already be reused)
+        """
+        with self.__lock:
+            if self.__send_futures.get(id_) is not future:
+                return
+
+            self.__send_futures.pop(id_)
+            self.__raw_ids.discard(id_)
+            raw: RAW_MESSAGE = self.request_cancel(id_)
+
+        if self.__send_callback is not None:
+            self.__send_callback(raw)
+
+    def fail_pending(self, exception: Exception) -> None:
+        """
+        Fail all requests that are still waiting for their response and cancel the requests
+        of the other side that are still running (when the connection is closed)
+        :param exception: Exception to set to every future
+        """
+        with self.__lock:
+            pending: list[Future] = list(self.__send_futures.values())
+            running: list[asyncio.Future | Future] = list(self.__running.values())
+            self.__send_futures.clear()
+            self.__raw_ids.clear()
+            self.__running.clear()
+            self.__deadlines = []
+            self.__next_check = None
+
+        for future in pending:
+            self.__resolve(future, exception=exception)
+        for future in running:
+            if isinstance(future, asyncio.Future):
+                future.get_loop().call_soon_threadsafe(future.cancel)
+            else:
+                future.cancel()
+
+    @staticmethod
+    def __resolve(future: Future, result: DATAUNIT = None, exception: Exception | None = None) -> None:
+        """
+        Set the result of a future unless it was cancelled meanwhile
+        :param future: Future of a request
+        :param result: Result to set
+        :param exception: Exception to set instead of the result
+        """
+        try:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
+        except InvalidStateError:
+            ...
+
     def process_response(self, message: BulkDict) -> None:
         """
         Supply Futures results with response data
         :param message: Response message
         """
         for submessage in message["data"]:
-            value: DATAUNIT = self.__rework_callback(loads(submessage["data"]))
-            self.__send_futures[submessage["id"]].set_result(value)
-            self.__send_futures.pop(submessage["id"])
+            with self.__lock:
+                raw: bool = submessage["id"] in self.__raw_ids
+                self.__raw_ids.discard(submessage["id"])
+
+                future: Future | None = self.__send_futures.pop(submessage["id"], None)
+            if future is None:  # expired or cancelled already
+                continue
 
-    def process_request(self, message: BulkDict) -> str:
+            if "error" in submessage:
+                self.__resolve(future, exception=RequestError(submessage["error"]))
+                continue
+
+            data: DATAUNIT | str = submessage["data"]
+            if isinstance(data, str):  # string results are sent as encoded json
+                try:
+                    data = loads(data)
+                except ValueError as exc:  # only this request failed, the connection is fine
+                    self.__resolve(future, exception=RequestError(f"Response isn't valid json: {exc}"))
+                    continue
+
+            self.__resolve(future, data if raw else self.__rework_callback(data))
+
+    def process_request(self, message: BulkDict) -> RAW_MESSAGE | None:
         """
         Process data request and get all required information
+        Without streaming all requests are answered together in one response.
+        With streaming the requests run concurrently (on the executor or as coroutines)
+        and every one is answered on its own (through send_callback) as soon as it's done.
+        Deadlines start when the message is received, requests whose deadline passed before they started
+        or while they were processed are answered with an error.
+        Cancelled requests that didn't start yet are skipped (or cancelled if they are coroutines)
+        and not answered at all.
         :param message: Request message
-        :return: Response message with all information
+        :return: Response message with all information (None if answered later)
         """
-        self.response_start()
+        received: float = monotonic()
+
+        if not self.__streaming:
+            with self.__response_lock:
+                self.response_start()
+
+                for sub_req in message["data"]:
+                    if sub_req.get("cancel"):
+                        continue  # inline requests are done before a cancellation can arrive
+
+                    try:
+                        self.response_add(_run_request(self.__request_callback, sub_req["data"],
+                                                       self.__deadline(sub_req, received)), id_=sub_req["id"])
+                    except Exception as exc:
+                        self.response_add(None, id_=sub_req["id"], error=f"{type(exc).__name__}: {exc}")
+
+                return self.response_get()
 
         for sub_req in message["data"]:
-            self.response_add(self.__request_callback(sub_req["data"]), id_=sub_req["id"])
+            if sub_req.get("cancel"):
+                with self.__lock:
+                    running: asyncio.Future | Future | None = self.__running.pop(sub_req["id"], None)
+                if running is not None:
+                    running.cancel()
+            else:
+                self.__dispatch(sub_req, received)
+
+        return None
+
+    @staticmethod
+    def __deadline(sub_req: MessageDict, received: float) -> float | None:
+        """
+        :param sub_req: Single request
+        :param received: Local monotonic time the request was received at
+        :return: Local monotonic time until the request has to be answered (None for no deadline)
+        """
+        return received + sub_req["timeout"] if "timeout" in sub_req else None
+
+    async def __run_request_async(self, data: DATAUNIT, deadline: float | None) -> DATAUNIT:
+        """
+        Await the coroutine request callback within the deadline
+        :param data: Request data
+        :param deadline: Local monotonic deadline or None
+        :return: Result of the request callback
+        :raises DeadlineExceededError: If the deadline passes before the callback is done
+        """
+        try:
+            return await asyncio.wait_for(self.__request_callback(data),
+                                          None if deadline is None else max(deadline - monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise DeadlineExceededError("Deadline passed while processing the request") from None
+
+    def __dispatch(self, sub_req: MessageDict, received: float) -> None:
+        """
+        Start a request callback concurrently and send its response when it's done
+        :param sub_req: Single request
+        :param received: Local monotonic time the request was received at
+        """
+        id_: int = sub_req["id"]
+        deadline: float | None = self.__deadline(sub_req, received)
+
+        if self.__async_callback:
+            running: asyncio.Future | Future = asyncio.ensure_future(self.__run_request_async(sub_req["data"],
+                                                                                             deadline))
+        else:
+            running = self.__request_executor.submit(_run_request, self.__request_callback,
+                                                    sub_req["data"], deadline)
+
+        with self.__lock:
+            self.__running[id_] = running
+        running.add_done_callback(lambda done: self.__finished(id_, done))
+
+    def __finished(self, id_: int, done: asyncio.Future | Future) -> None:
+        """
+        Send the response of a finished request unless the other side cancelled it
+        :param id_: ID of the request
+        :param done: Finished callback execution
+        """
+        with self.__lock:
+            answer: bool = self.__running.get(id_) is done
+            if answer:
+                self.__running.pop(id_)
+
+        if answer:
+            self.__send_callback(self.__single_response(id_, done))
+
+    def __single_response(self, id_: int, done: asyncio.Future | Future) -> RAW_MESSAGE:
+        """
+        Build the response for one finished request
+        :param id_: ID of the request
+        :param done: Finished callback execution
+        :return: Response message
+        """
+        with self.__response_lock:
+            self.response_start()
+
+            if done.cancelled():
+                self.response_add(None, id_=id_, error="Request was cancelled")
+            elif done.exception() is not None:
+                exc: BaseException = done.exception()
+                self.response_add(None, id_=id_, error=f"{type(exc).__name__}: {exc}")
+            else:
+                self.response_add(done.result(), id_=id_)
 
-        return self.response_get()
+            return self.response_get()
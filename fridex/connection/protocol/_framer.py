@@ -0,0 +1,175 @@
+"""
+fridex/connection/protocol/_framer.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from typing import Iterator
+import socket
+
+from ._protocol import Protocol, MessageToLongError
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class StreamFramer:
+    """
+    Incremental splitter for length-prefixed frames
+    Bytes are received into one preallocated buffer and complete frames are handed out as memoryviews (no copies)
+    Incomplete frames stay in the buffer until the rest arrives
+
+    Wire format of a frame: [length (Protocol.max_bytes, big endian)][payload (encrypted message)]
+    """
+    __buffer: bytearray
+    __view: memoryview
+    __start: int
+    __end: int
+    __header_size: int | None
+
+    def __init__(self, buffer_size: int = 65536, header_size: int | None = None) -> None:
+        """
+        Create framer
+        :param buffer_size: Initial size of the receive buffer (grows for bigger frames)
+        :param header_size: Bytes of the length header (None to always use Protocol.max_bytes)
+        """
+        self.__buffer = bytearray(max(buffer_size, 1))
+        self.__view = memoryview(self.__buffer)
+        self.__start = 0
+        self.__end = 0
+        self.__header_size = header_size
+
+    @property
+    def header_size(self) -> int:
+        """
+        :return: Current length of the frame header
+        """
+        return self.__header_size if self.__header_size is not None else Protocol.max_bytes
+
+    @staticmethod
+    def header(size: int, header_size: int | None = None) -> bytes:
+        """
+        Build the length header for a frame
+        :param size: Length of the frame payload
+        :param header_size: Bytes of the length header (None to use Protocol.max_bytes)
+        :return: Header bytes
+        :raises MessageToLongError: If the size can't be represented in the header
+        """
+        header_size = header_size if header_size is not None else Protocol.max_bytes
+        if size >= 2 ** (header_size * 8):
+            raise MessageToLongError(f"With a size of {size} the frame is to long!")
+
+        return size.to_bytes(length=header_size, byteorder="big")
+
+    @property
+    def pending(self) -> int:
+        """
+        :return: Number of received bytes that are not part of a complete frame yet
+        """
+        return self.__end - self.__start
+
+    def __missing(self) -> int:
+        """
+        :return: Bytes still required to complete the next frame (0 if unknown)
+        """
+        header_size: int = self.header_size
+        if self.pending < header_size:
+            return header_size - self.pending
+
+        size: int = int.from_bytes(self.__view[self.__start:self.__start + header_size], byteorder="big")
+        return max(header_size + size - self.pending, 0)
+
+    def __make_room(self, needed: int) -> None:
+        """
+        Move pending bytes to the front and grow the buffer if there is still not enough space
+        :param needed: Free bytes required after the pending data
+        """
+        pending: int = self.pending
+
+        if pending + needed > len(self.__buffer):
+            buffer: bytearray = bytearray(max(len(self.__buffer) * 2, pending + needed))
+            buffer[:pending] = self.__view[self.__start:self.__end]
+
+            self.__view.release()
+            self.__buffer = buffer
+            self.__view = memoryview(self.__buffer)
+
+        elif self.__start:
+            self.__view[:pending] = self.__view[self.__start:self.__end]
+
+        self.__start = 0
+        self.__end = pending
+
+    def get_buffer(self, size_hint: int = -1) -> memoryview:
+        """
+        Get writable space at the end of the buffer to receive into
+        :param size_hint: Minimum number of free bytes wanted
+        :return: Writable memoryview, only valid until the next call on this framer
+        """
+        needed: int = max(size_hint, self.__missing(), 1)
+        if len(self.__buffer) - self.__end < needed:
+            self.__make_room(needed)
+
+        return self.__view[self.__end:]
+
+    def buffer_updated(self, nbytes: int) -> None:
+        """
+        Mark bytes written into the buffer from get_buffer as received
+        :param nbytes: Number of bytes written
+        """
+        self.__end += nbytes
+
+    def recv_into(self, sock: socket.socket) -> int:
+        """
+        Receive directly from a socket into the buffer
+        :param sock: Socket to read from
+        :return: Number of bytes received (0 if the socket was closed)
+        """
+        received: int = sock.recv_into(self.get_buffer())
+        self.buffer_updated(received)
+        return received
+
+    def feed(self, data: bytes | bytearray | memoryview) -> None:
+        """
+        Copy already received bytes into the buffer
+        :param data: Bytes to add
+        """
+        if not data:
+            return
+
+        self.get_buffer(len(data))[:len(data)] = data
+        self.buffer_updated(len(data))
+
+    def frames(self) -> Iterator[memoryview]:
+        """
+        Pull out all complete frames
+        Every frame is released as soon as the next one is requested, copy it if it's needed longer
+        :return: Iterator over the frame payloads without header
+        """
+        while True:
+            header_size: int = self.header_size
+            if self.pending < header_size:
+                break
+
+            size: int = int.from_bytes(self.__view[self.__start:self.__start + header_size], byteorder="big")
+            frame_start: int = self.__start + header_size
+            if self.__end - frame_start < size:
+                break
+
+            self.__start = frame_start + size
+            frame: memoryview = self.__view[frame_start:self.__start]
+            try:
+                yield frame
+            finally:
+                frame.release()
+
+        if self.__start == self.__end:
+            self.__start = 0
+            self.__end = 0
@@ -10,11 +10,11 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
+from typing import Callable, get_args
 from datetime import datetime
-from typing import get_args
-from json import dumps
 
-from ._types import BulkDict, MessageDict, KINDS, DIRECTIONS, DATAUNIT
+from ._types import BulkDict, MessageDict, KINDS, DIRECTIONS, DATAUNIT, RAW_MESSAGE
+from ._codec import Codec, CodecService
 
 
 ##################################################
@@ -26,6 +26,13 @@ class MessageToLongError(Exception):
     ...
 
 
+class InFlightLimitError(Exception):
+    """
+    No message id is free or the maximum number of requests in flight is reached
+    """
+    ...
+
+
 class Protocol:
     """
     Default protocol for all kinds and directions of messages
@@ -35,24 +42,30 @@ class Protocol:
 
     __bulks: dict[DIRECTIONS, list[MessageDict]]
     __kind: KINDS
+    __codec: Codec
 
     _id_range: range
     _id_count: int
+    __in_use_callback: Callable[[int], bool] | None
 
     def __init__(
             self,
             kind: KINDS,
-            id_range: range = range(100, 999)
+            id_range: range = range(100, 999),
+            in_use_callback: Callable[[int], bool] | None = None
     ) -> None:
         """
         Configure protocol and id system
         :param kind: Specify kind of this protocol
         :param id_range: Numrange for message id (0 - 1000 is reserved)
+        :param in_use_callback: Check if an id still belongs to a request in flight (skipped when the ids wrap around)
         """
         self.__kind = kind
+        self.__codec = CodecService.new_codec()
 
         self._id_range = id_range
         self._id_count = id_range.start
+        self.__in_use_callback = in_use_callback
 
         self.__bulks = {}
         for direction in get_args(DIRECTIONS):
@@ -67,6 +80,20 @@ class Protocol:
         Protocol.max_bytes = value
         Protocol.max_size = 2 ** (value * 8)
 
+    @property
+    def codec(self) -> Codec:
+        """
+        :return: Codec used to encode outgoing messages
+        """
+        return self.__codec
+
+    def set_codec(self, codec: Codec) -> None:
+        """
+        Change the codec for outgoing messages
+        :param codec: New codec
+        """
+        self.__codec = codec
+
     @property
     def id_count(self) -> int:
         """
@@ -74,19 +101,49 @@ class Protocol:
         """
         return self._id_count
 
+    def _next_id(self) -> int:
+        """
+        Allocate the next message id that isn't in use
+        :return: ID for a new request
+        :raises InFlightLimitError: If every id of the range is in use
+        """
+        for _ in range(len(self._id_range)):
+            id_: int = self._id_count
+
+            self._id_count += 1
+            if self._id_count >= self._id_range.stop:
+                self._id_count = self._id_range.start
+
+            if self.__in_use_callback is None or not self.__in_use_callback(id_):
+                return id_
+
+        raise InFlightLimitError(f"All {len(self._id_range)} ids are in use")
+
     def _encapsulate(
             self,
             message: DATAUNIT | list[MessageDict],
             direction: DIRECTIONS,
             single: bool = True,
-            id_: int | None = None
-    ) -> None | str:
+            id_: int | None = None,
+            error: str | None = None,
+            timeout: float | None = None,
+            prepared: RAW_MESSAGE | None = None,
+            invalid: bool = False,
+            delta: bool = False,
+            cancel: bool = False
+    ) -> None | RAW_MESSAGE:
         """
         Encapsulate message
         :param message: The message itself
         :param direction: Specify the message direction
         :param single: Whether it's a single message that should be added to the queue or the whole queue request
-        :param id_: When no new ID should be used (when direction is response)
+        :param id_: When no new ID should be allocated (when direction is response)
+        :param error: Error description if the message couldn't be processed (only single)
+        :param timeout: Seconds the other side has to answer the request (only single)
+        :param prepared: Encoded value to use as data of all queued messages (only whole queue)
+        :param invalid: Mark the message as invalidation (only single)
+        :param delta: Mark the message as delta to the previous value (only single)
+        :param cancel: Mark the message as cancellation of the request with the same id (only single)
         :return: Depends on single
         :raises MessageToLongError: If message is too long to communicate length
         """
@@ -99,28 +156,35 @@ class Protocol:
         # Additional encapsulation
         if single:
             additional_information: MessageDict
-            additional_information["id"] = id_ if id_ is not None else self._id_count
+            additional_information["id"] = id_ if id_ is not None else self._next_id()
+            if error is not None:
+                additional_information["error"] = error
+            if timeout is not None:
+                additional_information["timeout"] = timeout
+            if invalid:
+                additional_information["invalid"] = True
+            if delta:
+                additional_information["delta"] = True
+            if cancel:
+                additional_information["cancel"] = True
         else:
             additional_information: BulkDict
             additional_information["direction"] = direction
             additional_information["kind"] = self.__kind
 
-        # Increase id
-        if not id_ and single:
-            self._id_count += 1
-            if self._id_count >= self._id_range.stop:
-                self._id_count = self._id_range.start
-
         # Return | Save in bulk
         if single:
             self.__bulks[direction].append(additional_information)
         else:
-            message_str: str = dumps(additional_information)
+            if prepared is None:
+                message_raw: RAW_MESSAGE = self.__codec.encode(additional_information)
+            else:
+                message_raw = self.__codec.encode_prepared(additional_information, prepared)
 
-            if len(message_str) > self.__class__.max_size:
-                raise MessageToLongError(f"With a size of {len(message_str)} the message is to long!")
+            if len(message_raw) > self.__class__.max_size:
+                raise MessageToLongError(f"With a size of {len(message_raw)} the message is to long!")
 
-            return message_str
+            return message_raw
         return None
 
     def request_start(self) -> None:
@@ -129,14 +193,18 @@ class Protocol:
         """
         self.__bulks["request"] = []
 
-    def request_add(self, message: DATAUNIT) -> None:
+    def request_add(self, message: DATAUNIT, timeout: float | None = None) -> int:
         """
         Add a message to the request bulk queue
         :param message: Message to add
+        :param timeout: Seconds the other side has to answer (None for no deadline)
+        :return: ID of the request
         """
-        self._encapsulate(message, direction="request")
+        id_: int = self._next_id()
+        self._encapsulate(message, direction="request", id_=id_, timeout=timeout)
+        return id_
 
-    def request_get(self, restart: bool = True) -> str | None:
+    def request_get(self, restart: bool = True) -> RAW_MESSAGE | None:
         """
         Get the whole request message queue
         :param restart: Whether the request queue should be reseted
@@ -150,29 +218,74 @@ class Protocol:
             if restart:
                 self.request_start()
 
+    def request_single(self, message: DATAUNIT, timeout: float | None = None) -> tuple[int, RAW_MESSAGE]:
+        """
+        Get a request bulk with only one message without touching the request queue
+        :param message: Message to send
+        :param timeout: Seconds the other side has to answer (None for no deadline)
+        :return: ID of the request and string to send
+        """
+        queued: list[MessageDict] = self.__bulks["request"]
+        self.__bulks["request"] = []
+
+        try:
+            id_: int = self._next_id()
+            self._encapsulate(message, direction="request", id_=id_, timeout=timeout)
+            return id_, self._encapsulate(self.__bulks["request"], direction="request", single=False)
+        finally:
+            self.__bulks["request"] = queued
+
+    def request_cancel(self, id_: int) -> RAW_MESSAGE:
+        """
+        Get a request bulk that tells the other side to skip a request, without touching the request queue
+        :param id_: ID of the request
+        :return: String to send
+        """
+        queued: list[MessageDict] = self.__bulks["request"]
+        self.__bulks["request"] = []
+
+        try:
+            self._encapsulate(None, direction="request", id_=id_, cancel=True)
+            return self._encapsulate(self.__bulks["request"], direction="request", single=False)
+        finally:
+            self.__bulks["request"] = queued
+
     def response_start(self) -> None:
         """
         Start a bulk response message queue
         """
         self.__bulks["response"] = []
 
-    def response_add(self, message: DATAUNIT, id_: int) -> None:
+    def response_add(
+            self,
+            message: DATAUNIT,
+            id_: int,
+            error: str | None = None,
+            invalid: bool = False,
+            delta: bool = False
+    ) -> None:
         """
         Add a message to the response bulk queue
         :param message: Message to add
         :param id_: ID the response is marked with
+        :param error: Error description instead of a result
+        :param invalid: Mark the response as invalidation of the value (instead of a new value)
+        :param delta: Mark the response as delta to the previous value (instead of a new value)
         """
-        self._encapsulate(message, direction="response", id_=id_)
+        self._encapsulate(message, direction="response", id_=id_, error=error, invalid=invalid, delta=delta)
 
-    def response_get(self, restart: bool = True) -> str | None:
+    def response_get(self, restart: bool = True, prepared: RAW_MESSAGE | None = None) -> RAW_MESSAGE | None:
         """
         Get the whole response message queue
         :param restart: Whether the response queue should be reseted
+        :param prepared: Value encoded with the current codec to send in all queued responses
+                         (the queued data is ignored then)
         :return: String to send
         """
         try:
             if self.__bulks["response"]:
-                return self._encapsulate(self.__bulks["response"], direction="response", single=False)
+                return self._encapsulate(self.__bulks["response"], direction="response", single=False,
+                                         prepared=prepared)
             return None
         finally:
             if restart:
@@ -184,7 +297,7 @@ class Protocol:
         """
         ...
 
-    def process_request(self, message: BulkDict) -> str | None:
+    def process_request(self, message: BulkDict) -> RAW_MESSAGE | None:
         """
         Every protocol should overwrite this function to process incomming requests
         """
@@ -10,9 +10,10 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
-from concurrent.futures import ThreadPoolExecutor
-from json import loads
+from concurrent.futures import ThreadPoolExecutor, Executor
 
+from ._codec import Codec, CodecService, CODECS
+from ._subscription_registry import SubscriptionRegistry
 from ._subscription import SubscriptionProtocol
 from ._communication import CommunicationProtocol
 from ._control import ControlProtocol
@@ -30,7 +31,7 @@ class ProtocolInterface:
     """
     Interface to access all protocols
     """
-    __cache: Cache
+    __cache: Cache | None
     __data: DataProtocol
     __control: ControlProtocol
     __communication: CommunicationProtocol
@@ -58,7 +59,19 @@ class ProtocolInterface:
             add_related_sub_callback: SubscriptionProtocol.ADD_RELATED_SUB_CALLBACK_TYPE | None = None,
             delete_related_sub_callback: SubscriptionProtocol.DELETE_RELATED_SUB_CALLBACK_TYPE | None = None,
             send_sub_callback: SubscriptionProtocol.SEND_SUB_CALLBACK_TYPE | None = None,
-            max_bytes: int = 4
+            max_bytes: int = 4,
+            batch_callback: DataProtocol.BATCH_CALLBACK_TYPE | None = None,
+            batch_max_count: int | None = None,
+            batch_max_bytes: int | None = None,
+            request_executor: Executor | None = None,
+            send_data_callback: DataProtocol.SEND_CALLBACK_TYPE | None = None,
+            stream_responses: bool = False,
+            schedule_callback: DataProtocol.SCHEDULE_CALLBACK_TYPE | None = None,
+            subscription_registry: SubscriptionRegistry | None = None,
+            client_cache: bool = False,
+            cache_refresh: float | None = None,
+            delta_updates: int | None = None,
+            max_in_flight: int | None = None
     ) -> None:
         """
         Create all protocols
@@ -78,29 +91,98 @@ class ProtocolInterface:
         :param delete_related_sub_callback: Callback when a delete subscription request comes in
         :param send_sub_callback: Callback to send subscription data
         :param max_bytes: Number of bytes to communicate length
+        :param batch_callback: Callback after every added data request for automatic batching
+        :param batch_max_count: Number of data requests after which a batch is full
+        :param batch_max_bytes: Approximate size of data requests after which a batch is full
+        :param request_executor: Executor to run data request callbacks concurrently
+        :param send_data_callback: Callback to send data responses that finish asynchronously
+        :param stream_responses: Answer every data request as soon as it's ready (runs on thread_pool without executor)
+        :param schedule_callback: Callback to call a function after a delay (for data request timeouts)
+        :param subscription_registry: Server-wide registry to index subscriptions of the other side in
+        :param client_cache: Fetch values of new subscriptions into the cache and refetch them after invalidations,
+                             so data requests for subscribed request dictonaries are answered from memory
+        :param cache_refresh: Seconds after which cached subscription values are refetched in the background
+        :param delta_updates: Send subscription updates as deltas with a full snapshot every delta_updates-th update
+        :param max_in_flight: Maximum number of data requests waiting for their response (2 ** 32 if None)
         """
         DataProtocol.set_max_bytes(max_bytes)
 
-        self.__cache = Cache()
+        self.__cache = Cache() if client_cache else None
 
-        self.__data = DataProtocol(range(0, 999), request_callback=data_callback,
-                                   rework_callback=rework_callback, cache=self.__cache)
+        if stream_responses and request_executor is None:
+            request_executor = thread_pool
+
+        self.__data = DataProtocol(range(0, 2 ** 32), request_callback=data_callback,
+                                   rework_callback=rework_callback, cache=self.__cache,
+                                   batch_callback=batch_callback, batch_max_count=batch_max_count,
+                                   batch_max_bytes=batch_max_bytes, request_executor=request_executor,
+                                   send_callback=send_data_callback, stream_responses=stream_responses,
+                                   schedule_callback=schedule_callback, cache_refresh=cache_refresh,
+                                   max_in_flight=max_in_flight)
         self.__control = ControlProtocol(range(1000, 1999), ping_callback)
         self.__communication = CommunicationProtocol(range(2000, 2999), new_key_callback, set_key_callback,
                                                      control_callback, max_bytes_callback,
                                                      cryption_req_callback, cryption_res_callback,
-                                                     pause_connection_callback, resume_connection_callback)
-        self.__subscription = SubscriptionProtocol(range(3000, 3999), thread_pool,
+                                                     pause_connection_callback, resume_connection_callback,
+                                                     codec_req_callback=self.__codec_request,
+                                                     codec_res_callback=self.__codec_confirm)
+        self.__subscription = SubscriptionProtocol(range(3000, 2 ** 32), thread_pool,
                                                    add_related_sub_callback, delete_related_sub_callback,
-                                                   send_sub_callback, cache=self.__cache)
+                                                   send_sub_callback, cache=self.__cache,
+                                                   registry=subscription_registry,
+                                                   fetch_callback=self.__data.refetch if client_cache else None,
+                                                   delta_updates=delta_updates, schedule_callback=schedule_callback)
 
-    def decapsulate(self, messages: bytes) -> BulkDict:  # noqa
+    def decapsulate(self, messages: bytes | memoryview) -> BulkDict:  # noqa
         """
         Decode and convert to dict
         :param messages: Raw bytes without length header
         :return: Dictonary with data
         """
-        return loads(messages.decode("UTF-8"))
+        return CodecService.detect(messages).decode(messages)
+
+    @property
+    def codec(self) -> Codec:
+        """
+        :return: Codec used to encode outgoing messages
+        """
+        return self.__data.codec
+
+    def set_codec(self, codec: CODECS) -> None:
+        """
+        Encode all outgoing messages with another codec
+        :param codec: Name of the codec
+        """
+        new_codec: Codec = CodecService.new_codec(codec)
+
+        self.__data.set_codec(new_codec)
+        self.__control.set_codec(new_codec)
+        self.__communication.set_codec(new_codec)
+        self.__subscription.set_codec(new_codec)
+
+    def __codec_request(self, codec: str) -> str:
+        """
+        The other side asks to use another codec
+        :param codec: Requested codec
+        :return: Codec that is used from now on (json if the requested one is not available)
+        """
+        accepted: str = codec if codec in CodecService.available() else "json"
+        self.set_codec(accepted)
+        return accepted
+
+    def __codec_confirm(self, codec: str) -> None:
+        """
+        The other side accepted a codec
+        :param codec: Accepted codec
+        """
+        self.set_codec(codec)
+
+    @property
+    def cache(self) -> Cache | None:
+        """
+        :return: Cache shared by the data and subscription protocol (None if client_cache is disabled)
+        """
+        return self.__cache
 
     @property
     def data(self) -> DataProtocol:
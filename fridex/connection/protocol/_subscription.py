@@ -10,12 +10,17 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
-from typing import Callable, Any, TypedDict, Literal, Type
-from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Any, TypedDict, Literal, Type, Iterable, NotRequired
+from concurrent.futures import ThreadPoolExecutor, Future
+from collections import deque
+from threading import Lock
+from time import monotonic
+from copy import deepcopy
 
-
-from ._types import BulkDict, DATAUNIT
-from ._protocol import Protocol
+from ._types import BulkDict, DATAUNIT, RAW_MESSAGE
+from ._protocol import Protocol, InFlightLimitError
+from ._subscription_registry import SubscriptionRegistry, canonical_key
+from ._codec import Codec
 from ._cache import Cache
 
 
@@ -26,6 +31,8 @@ from ._cache import Cache
 class SubscriptionRequest(TypedDict):
     action: Literal["add", "delete"]
     value: Type[DATAUNIT] | int
+    max_rate: NotRequired[float]
+    window: NotRequired[float]
 
 
 CALLBACK_TYPE = Callable[[DATAUNIT], Any]
@@ -34,6 +41,46 @@ CALLBACK_TYPE = Callable[[DATAUNIT], Any]
 class SubscriptionSave(TypedDict):
     callback: CALLBACK_TYPE
     req_dict: Type[DATAUNIT]
+    conflated: bool
+
+
+class SubscriptionDelta(TypedDict):
+    set: DATAUNIT
+    delete: list[str]
+
+
+def _delta(old: DATAUNIT, new: DATAUNIT) -> SubscriptionDelta | None:
+    """
+    Get the changed, added and removed keys between two values
+    :param old: Previous value
+    :param new: New value
+    :return: Delta or None if it's not worth it (no dictonaries or most keys changed)
+             or can't be applied (keys that aren't strings)
+    """
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return None
+
+    # the other side patches the decoded value, codecs like json turn other keys into strings
+    if not all(isinstance(key, str) for key in old) or not all(isinstance(key, str) for key in new):
+        return None
+
+    changed: DATAUNIT = {key: value for key, value in new.items() if key not in old or old[key] != value}
+    removed: list = [key for key in old if key not in new]
+
+    if len(changed) + len(removed) >= len(new):
+        return None
+    return {"set": changed, "delete": removed}
+
+
+def _patch(old: DATAUNIT, delta: SubscriptionDelta) -> DATAUNIT:
+    """
+    Apply a delta to the previous value
+    :param old: Previous value
+    :param delta: Delta from _delta
+    :return: New value
+    """
+    removed: set = set(delta["delete"])
+    return {key: value for key, value in old.items() if key not in removed} | delta["set"]
 
 
 class SubscriptionProtocol:
@@ -45,14 +92,33 @@ class SubscriptionProtocol:
 
     __thread_pool: ThreadPoolExecutor
     __subscriptions: dict[int, SubscriptionSave]
+    __live_keys: dict[str, set[int]]
+    __received: dict[str, DATAUNIT]
+
+    __registry: SubscriptionRegistry | None
+    __served: dict[int, str]
+    __served_keys: dict[str, set[int]]
+    __lock: Lock
+
+    __delta_updates: int | None
+    __sent: dict[str, tuple[DATAUNIT, int, int | None]]
+
+    __conflation: dict[int, tuple[Literal["rate", "window"], float]]
+    __conflated: dict[int, DATAUNIT]
+    __conflated_sent: dict[int, float]
+    __callback_values: dict[int, deque[DATAUNIT]]
 
     ADD_RELATED_SUB_CALLBACK_TYPE = Callable[[int, DATAUNIT], Any]
     DELETE_RELATED_SUB_CALLBACK_TYPE = Callable[[int], Any]
-    SEND_SUB_CALLBACK_TYPE = Callable[[str], Any]
+    SEND_SUB_CALLBACK_TYPE = Callable[[RAW_MESSAGE], Any]
+    FETCH_CALLBACK_TYPE = Callable[[DATAUNIT], Future]
+    SCHEDULE_CALLBACK_TYPE = Callable[[float, Callable[[], Any]], Any]
 
     __add_related_sub_callback: ADD_RELATED_SUB_CALLBACK_TYPE | None
     __delete_related_sub_callback: DELETE_RELATED_SUB_CALLBACK_TYPE | None
     __send_sub_callback: SEND_SUB_CALLBACK_TYPE | None
+    __fetch_callback: FETCH_CALLBACK_TYPE | None
+    __schedule_callback: SCHEDULE_CALLBACK_TYPE | None
 
     def __init__(
             self,
@@ -61,7 +127,11 @@ class SubscriptionProtocol:
             add_related_sub_callback: ADD_RELATED_SUB_CALLBACK_TYPE | None,
             delete_related_sub_callback: DELETE_RELATED_SUB_CALLBACK_TYPE | None,
             send_sub_callback: SEND_SUB_CALLBACK_TYPE | None,
-            cache: Cache | None = None
+            cache: Cache | None = None,
+            registry: SubscriptionRegistry | None = None,
+            fetch_callback: FETCH_CALLBACK_TYPE | None = None,
+            delta_updates: int | None = None,
+            schedule_callback: SCHEDULE_CALLBACK_TYPE | None = None
     ) -> None:
         """
         Create subscription protocol
@@ -71,70 +141,215 @@ class SubscriptionProtocol:
         :param delete_related_sub_callback: Callback when a delete subscription request comes in
         :param send_sub_callback: Callback to send subscription data
         :param cache: Optional cache
+        :param registry: Server-wide registry to index the subscriptions of the other side in
+        :param fetch_callback: Callback to request a value with a data request in the background
+                               (fills the cache for new subscriptions and after invalidations)
+        :param delta_updates: Only send the changed keys of dictonary values to the other side,
+                              every delta_updates-th update is a full snapshot (None to always send full values)
+        :param schedule_callback: Callback to call a function after a delay in seconds
+                                  (required to send conflated subscriptions, they are sent immediately without)
         """
-        self.__protocol = Protocol("sub", id_range)
+        self.__protocol = Protocol("sub", id_range, in_use_callback=lambda id_: id_ in self.__subscriptions)
 
         self.__thread_pool = thread_pool
         self.__add_related_sub_callback = add_related_sub_callback
         self.__delete_related_sub_callback = delete_related_sub_callback
         self.__send_sub_callback = send_sub_callback
+        self.__fetch_callback = fetch_callback
+        self.__schedule_callback = schedule_callback
         self.__cache = cache
 
+        self.__subscriptions = {}
+        self.__live_keys = {}
+        self.__received = {}
+
+        self.__registry = registry
+        self.__served = {}
+        self.__served_keys = {}
+        self.__lock = Lock()
+
+        self.__delta_updates = delta_updates
+        self.__sent = {}
+
+        self.__conflation = {}
+        self.__conflated = {}
+        self.__conflated_sent = {}
+        self.__callback_values = {}
+
+    def set_codec(self, codec: Codec) -> None:
+        """
+        Change the codec for outgoing messages
+        :param codec: New codec
+        """
+        self.__protocol.set_codec(codec)
+
     def __response(
             self,
             data: DATAUNIT,
             id_: int
-    ) -> str:
+    ) -> RAW_MESSAGE:
         """
         General response encapsulation
         :param data: Response dictonary
         :param id_: ID of the conversation
         :return: Raw string to send
         """
-        self.__protocol.response_add(data, id_)
-        return self.__protocol.response_get()
+        with self.__lock:
+            self.__protocol.response_add(data, id_)
+            return self.__protocol.response_get()
 
-    def __request(self, data: SubscriptionRequest) -> str:
+    def __request(self, data: SubscriptionRequest) -> tuple[int, RAW_MESSAGE]:
         """
         General request encapsulation
         :param data: Subscription request
-        :return: Request string to send
+        :return: ID of the request and request string to send
         """
-        self.__protocol.request_add(data)
-        return self.__protocol.request_get()
+        with self.__lock:
+            id_: int = self.__protocol.request_add(data)
+            return id_, self.__protocol.request_get()
 
     def add_subscription(
             self,
             callback: CALLBACK_TYPE,
-            request_dict: DATAUNIT
-    ) -> tuple[int, str]:
+            request_dict: DATAUNIT,
+            max_rate: float | None = None,
+            window: float | None = None
+    ) -> tuple[int, RAW_MESSAGE]:
         """
         Add a new subscription
+        Conflated subscriptions only get the newest value, intermediate values are dropped
+        (by the other side and if the callback can't keep up)
         :param callback: Callback when value is updated
         :param request_dict: Same dictonary as a normal request to use
+        :param max_rate: Maximum number of updates per second (conflated)
+        :param window: Only send the newest value at the end of a window of this many seconds (conflated)
         :return: Subscription ID and String to send
         """
-        message: str = self.__request({"action": "add", "value": request_dict})
-        self.__subscriptions[self.__protocol.id_count] = {"callback": callback, "req_dict": request_dict}
+        request: SubscriptionRequest = {"action": "add", "value": request_dict}
+        if max_rate is not None:
+            request["max_rate"] = max_rate
+        if window is not None:
+            request["window"] = window
+
+        sub_id, message = self.__request(request)
+
+        key: str = canonical_key(request_dict)
+        with self.__lock:
+            self.__subscriptions[sub_id] = {"callback": callback, "req_dict": request_dict,
+                                            "conflated": max_rate is not None or window is not None}
+            first: bool = key not in self.__live_keys
+            self.__live_keys.setdefault(key, set()).add(sub_id)
+
+        if first:
+            # only fetch once subscribed, the response may arrive before this returns
+            self.__fetch(request_dict, notify=False)
 
-        return self.__protocol.id_count, message
+        return sub_id, message
 
     def remove_subscription(
             self,
             subscription_id: int
-    ) -> str:
+    ) -> RAW_MESSAGE:
         """
         Remove a subscription
         :param subscription_id: ID of the subscription
         """
-        self.__subscriptions.pop(subscription_id)
-        return self.__request({"action": "delete", "value": subscription_id})
+        with self.__lock:
+            subscription: SubscriptionSave = self.__subscriptions.pop(subscription_id)
+
+            key: str = canonical_key(subscription["req_dict"])
+            self.__live_keys[key].discard(subscription_id)
+            last: bool = not self.__live_keys[key]
+            if last:
+                # without subscription nobody tells us when the value changes
+                self.__live_keys.pop(key)
+                self.__received.pop(key, None)
+
+        if last and self.__cache is not None:
+            self.__cache.delete(subscription["req_dict"])
+
+        return self.__request({"action": "delete", "value": subscription_id})[1]
+
+    def __fetch(self, req_dict: DATAUNIT, notify: bool) -> None:
+        """
+        Fetch the current value of a subscribed request dictonary into the cache
+        :param req_dict: Same dictonary as a normal request to use
+        :param notify: Whether the subscription callbacks should get the value
+        """
+        if self.__fetch_callback is None or self.__cache is None:
+            return
+
+        try:
+            future: Future = self.__fetch_callback(req_dict)
+        except (ConnectionError, InFlightLimitError):  # not cached, requests go to the other side meanwhile
+            return
+        future.add_done_callback(lambda done: self.__fetched(req_dict, done, notify))
+
+    def __fetched(self, req_dict: DATAUNIT, done: Future, notify: bool) -> None:
+        """
+        A background fetch is done, cache the value if the request dictonary is still subscribed
+        :param req_dict: Same dictonary as a normal request to use
+        :param done: Finished fetch
+        :param notify: Whether the subscription callbacks should get the value
+        """
+        if done.cancelled() or done.exception() is not None:
+            return
+
+        with self.__lock:
+            subscriptions: dict[int, SubscriptionSave] = {
+                sub_id: self.__subscriptions[sub_id] for sub_id in self.__live_keys.get(canonical_key(req_dict), ())
+            }
+        if not subscriptions:
+            return
+
+        self.__cache.set(req_dict, done.result())
+        if notify:
+            for sub_id, subscription in subscriptions.items():
+                self.__notify(sub_id, subscription, done.result())
+
+    def __notify(self, sub_id: int, subscription: SubscriptionSave, value: DATAUNIT) -> None:
+        """
+        Call the callback of a subscription in the ThreadPool
+        The values of a subscription are passed one after another in order of arrival (one task per subscription),
+        conflated subscriptions only keep the newest queued value
+        :param sub_id: ID of the subscription
+        :param subscription: Saved subscription
+        :param value: New value
+        """
+        with self.__lock:
+            running: bool = sub_id in self.__callback_values
+            values: deque[DATAUNIT] = self.__callback_values.setdefault(sub_id, deque())
+            if subscription["conflated"]:
+                values.clear()
+            values.append(value)
+
+        if not running:
+            self.__thread_pool.submit(self.__run_callback, sub_id, subscription["callback"])
+
+    def __run_callback(self, sub_id: int, callback: CALLBACK_TYPE) -> None:
+        """
+        Call the callback of a subscription with its queued values until none are left
+        :param sub_id: ID of the subscription
+        :param callback: Callback of the subscription
+        """
+        while True:
+            with self.__lock:
+                values: deque[DATAUNIT] = self.__callback_values[sub_id]
+                if not values:
+                    self.__callback_values.pop(sub_id)
+                    return
+                value: DATAUNIT = values.popleft()
+
+            try:
+                callback(value)
+            except Exception:  # a failing call doesn't hold back the following values
+                ...
 
     def _response_subscription(
             self,
             id_: int,
             value: dict[str | int | float | bool | None, any]
-    ) -> str:
+    ) -> RAW_MESSAGE:
         """
         Respone to a subscription (update value)
         :param id_: ID of the subscription
@@ -149,19 +364,249 @@ class SubscriptionProtocol:
         :param req_dict: Same dictonary as a normal request to use
         :param value: New value
         """
-        for sub in self.__subscriptions:
-            if self.__subscriptions[sub]["req_dict"] == req_dict:
-                self.__send_sub_callback(self._response_subscription(sub, value))
+        with self.__lock:
+            sub_ids: frozenset[int] = frozenset(self.__served_keys.get(canonical_key(req_dict), ()))
+        if sub_ids:
+            self.send_subscriptions(sub_ids, value)
+
+    @property
+    def codec(self) -> Codec:
+        """
+        :return: Codec used to encode outgoing messages
+        """
+        return self.__protocol.codec
+
+    def invalidate(self, req_dict: DATAUNIT) -> None:
+        """
+        Tell the other side that its cached value of a subscription is outdated (it fetches the value again)
+        :param req_dict: Same dictonary as a normal request to use
+        """
+        with self.__lock:
+            sub_ids: frozenset[int] = frozenset(self.__served_keys.get(canonical_key(req_dict), ()))
+        if sub_ids:
+            self.send_subscriptions(sub_ids, None, invalid=True)
+
+    def send_subscriptions(
+            self,
+            sub_ids: Iterable[int],
+            value: DATAUNIT,
+            prepared: dict[str, RAW_MESSAGE] | None = None,
+            invalid: bool = False,
+            version: int | None = None
+    ) -> None:
+        """
+        Send a new value to subscriptions of the other side (all in one message)
+        :param sub_ids: IDs of the subscriptions
+        :param value: New value
+        :param prepared: Value already encoded by codec name, shared between connections
+                         (the value is encoded and added if the current codec is missing)
+        :param invalid: Only invalidate the value instead of sending a new one
+        :param version: Sequence number of the value for its request dictonary (from the SubscriptionRegistry),
+                        deltas are only shared between connections that last got the same version
+        """
+        sub_ids = [sub_id for sub_id in sub_ids if invalid or not self.__conflate(sub_id, value)]
+        if not sub_ids:
+            return
+
+        with self.__lock:
+            data: DATAUNIT | SubscriptionDelta = value
+            delta: bool = False
+            tag: str | None = None
+            if self.__delta_updates is not None and not invalid:
+                data, delta, base = self.__next_delta(self.__served.get(sub_ids[0]), value, version)
+                if delta:
+                    tag = f"delta/{base}" if base is not None and version is not None else None
+
+            codec: Codec = self.__protocol.codec
+            encoded: RAW_MESSAGE | None = None
+            if prepared is not None and (not delta or tag is not None):
+                prepared_key: str = codec.name if tag is None else f"{codec.name}/{tag}"
+                if prepared_key not in prepared:
+                    prepared[prepared_key] = codec.encode_value(data)
+                encoded = prepared[prepared_key]
+
+            self.__protocol.response_start()
+            for sub_id in sub_ids:
+                self.__protocol.response_add(None if encoded is not None else data, sub_id,
+                                             invalid=invalid, delta=delta)
+            message: RAW_MESSAGE | None = self.__protocol.response_get(prepared=encoded)
+
+        if message is not None:
+            self.__send_sub_callback(message)
+
+    def __conflate(self, sub_id: int, value: DATAUNIT) -> bool:
+        """
+        Hold back the value of a conflated subscription until it may be sent
+        :param sub_id: ID of the subscription
+        :param value: New value
+        :return: Whether the subscription is conflated (and the value is taken care of)
+        """
+        if sub_id not in self.__conflation or self.__schedule_callback is None:
+            return False
+
+        with self.__lock:
+            mode, interval = self.__conflation[sub_id]
+            scheduled: bool = sub_id in self.__conflated
+            self.__conflated[sub_id] = value
+            if scheduled:
+                return True
+
+            delay: float = interval
+            if mode == "rate":
+                delay = max(self.__conflated_sent.get(sub_id, float("-inf")) + interval - monotonic(), 0)
+
+        if delay:
+            self.__schedule_callback(delay, lambda: self.__send_conflated(sub_id))
+        else:
+            self.__send_conflated(sub_id)
+        return True
+
+    def __send_conflated(self, sub_id: int) -> None:
+        """
+        Send the newest held back value of a conflated subscription (always the full value)
+        :param sub_id: ID of the subscription
+        """
+        with self.__lock:
+            if sub_id not in self.__conflated or sub_id not in self.__served:
+                return
+
+            self.__conflated_sent[sub_id] = monotonic()
+            self.__protocol.response_start()
+            self.__protocol.response_add(self.__conflated.pop(sub_id), sub_id)
+            message: RAW_MESSAGE | None = self.__protocol.response_get()
+
+        if message is not None:
+            self.__send_sub_callback(message)
+
+    def __next_delta(
+            self,
+            key: str | None,
+            value: DATAUNIT,
+            version: int | None
+    ) -> tuple[DATAUNIT | SubscriptionDelta, bool, int | None]:
+        """
+        Get what has to be sent for a new value and remember a copy of the value
+        (publishers may change the same object and provide it again)
+        :param key: Canonical key of the subscribed request dictonary
+        :param value: New value
+        :param version: Sequence number of the value (None if it's unknown)
+        :return: Value or delta to send, whether it's a delta, version of the value the delta is based on
+        """
+        if key is None:
+            return value, False, None
+
+        last: tuple[DATAUNIT, int, int | None] | None = self.__sent.get(key)
+        if last is not None and last[1] + 1 < self.__delta_updates:
+            delta: SubscriptionDelta | None = _delta(last[0], value)
+            if delta is not None:
+                self.__sent[key] = (deepcopy(value), last[1] + 1, version)
+                return delta, True, last[2]
+
+        self.__sent[key] = (deepcopy(value) if isinstance(value, dict) else value, 0, version)
+        return value, False, None
+
+    def clear(self) -> None:
+        """
+        Drop all subscriptions of the other side (e.g. when the connection is closed)
+        """
+        with self.__lock:
+            served: dict[int, str] = self.__served
+            self.__served = {}
+            self.__served_keys = {}
+            self.__sent = {}
+            self.__conflation = {}
+            self.__conflated = {}
+            self.__conflated_sent = {}
+
+        if self.__registry is not None:
+            for sub_id, key in served.items():
+                self.__registry.remove(key, self, sub_id)
+
+    def __serve(self, sub_id: int, request: SubscriptionRequest) -> None:
+        """
+        Index a subscription of the other side
+        :param sub_id: ID of the subscription
+        :param request: Add request with the request dictonary and conflation options
+        """
+        key: str = canonical_key(request["value"])
+        with self.__lock:
+            if "window" in request:
+                self.__conflation[sub_id] = ("window", request["window"])
+            elif request.get("max_rate"):
+                self.__conflation[sub_id] = ("rate", 1 / request["max_rate"])
+
+            self.__served[sub_id] = key
+            self.__served_keys.setdefault(key, set()).add(sub_id)
+
+        if self.__registry is not None:
+            self.__registry.add(key, self, sub_id)
+
+    def __unserve(self, sub_id: int) -> None:
+        """
+        Remove a subscription of the other side from the index
+        :param sub_id: ID of the subscription
+        """
+        with self.__lock:
+            key: str | None = self.__served.pop(sub_id, None)
+            if key is None:
+                return
+
+            self.__conflation.pop(sub_id, None)
+            self.__conflated.pop(sub_id, None)
+            self.__conflated_sent.pop(sub_id, None)
+
+            self.__served_keys[key].discard(sub_id)
+            if not self.__served_keys[key]:
+                self.__served_keys.pop(key)
+                self.__sent.pop(key, None)
+
+        if self.__registry is not None:
+            self.__registry.remove(key, self, sub_id)
 
     def process_response(self, message: BulkDict) -> None:
         """
         These responses are coming without a request
+        Invalidations drop the cached value and fetch it again in the background,
+        deltas are applied to the previous value before it's used
         :param message: Response message
         """
-        submessage = message["data"][0]
-        if self.__cache:
-            self.__cache.set(self.__subscriptions[submessage["id"]]["req_dict"], submessage["data"])
-        self.__thread_pool.submit(self.__subscriptions[submessage["id"]]["callback"], submessage["data"])
+        invalidated: dict[str, DATAUNIT] = {}
+        missed: dict[str, DATAUNIT] = {}
+        updated: list[tuple[int, SubscriptionSave, DATAUNIT]] = []
+
+        with self.__lock:
+            for submessage in message["data"]:
+                subscription: SubscriptionSave | None = self.__subscriptions.get(submessage["id"])
+                if subscription is None:  # deleted meanwhile
+                    continue
+
+                key: str = canonical_key(subscription["req_dict"])
+                if submessage.get("invalid"):
+                    invalidated[key] = subscription["req_dict"]
+                    continue
+
+                value: DATAUNIT = submessage["data"]
+                if submessage.get("delta"):
+                    if key not in self.__received:  # can't patch, wait for the next snapshot
+                        missed[key] = subscription["req_dict"]
+                        continue
+                    value = _patch(self.__received[key], value)
+                self.__received[key] = value
+                updated.append((submessage["id"], subscription, value))
+
+            refetch: list[DATAUNIT] = [req_dict for key, req_dict in (invalidated | missed).items()
+                                       if key in invalidated or key not in self.__received]
+
+        for sub_id, subscription, value in updated:
+            if self.__cache is not None:
+                self.__cache.set(subscription["req_dict"], value)
+            self.__notify(sub_id, subscription, value)
+
+        for req_dict in (invalidated | missed).values():
+            if self.__cache is not None:
+                self.__cache.delete(req_dict)
+        for req_dict in refetch:
+            self.__fetch(req_dict, notify=True)
 
     def process_request(self, message: BulkDict) -> None:
         """
@@ -172,8 +617,10 @@ class SubscriptionProtocol:
         submessage = message["data"][0]
         match submessage["data"]["action"]:
             case "add":
+                self.__serve(submessage["id"], submessage["data"])
                 if self.__add_related_sub_callback is not None:
                     self.__add_related_sub_callback(submessage["id"], submessage["data"]["value"])
             case "delete":
+                self.__unserve(submessage["data"]["value"])
                 if self.__delete_related_sub_callback is not None:
                     self.__delete_related_sub_callback(submessage["data"]["value"])
@@ -0,0 +1,155 @@
+"""
+fridex/connection/protocol/_subscription_registry.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from typing import TypedDict, TYPE_CHECKING
+from time import perf_counter
+from threading import Lock
+from json import dumps
+
+from ._types import DATAUNIT, RAW_MESSAGE
+
+if TYPE_CHECKING:
+    from ._subscription import SubscriptionProtocol
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class BroadcastStats(TypedDict):
+    connections: int
+    subscriptions: int
+    encodings: int
+    duration: float
+
+
+def canonical_key(req_dict: DATAUNIT) -> str:
+    """
+    Get a hashable key that is equal for equal request dictonaries (independent of key order)
+    :param req_dict: Same dictonary as a normal request to use
+    :return: Canonical key
+    """
+    return dumps(req_dict, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class SubscriptionRegistry:
+    """
+    Server-wide index of all subscriptions of all connections
+    Subscribers are grouped by the canonical key of their request dictonary,
+    so publishing a value only touches the matching subscriptions
+    """
+    __index: dict[str, dict["SubscriptionProtocol", set[int]]]
+    __versions: dict[str, int]
+    __lock: Lock
+
+    def __init__(self) -> None:
+        """
+        Create empty registry
+        """
+        self.__index = {}
+        self.__versions = {}
+        self.__lock = Lock()
+
+    def add(self, key: str, subscriber: "SubscriptionProtocol", sub_id: int) -> None:
+        """
+        Register a subscription
+        :param key: Canonical key of the request dictonary
+        :param subscriber: Subscription protocol of the connection that subscribed
+        :param sub_id: ID of the subscription
+        """
+        with self.__lock:
+            self.__index.setdefault(key, {}).setdefault(subscriber, set()).add(sub_id)
+
+    def remove(self, key: str, subscriber: "SubscriptionProtocol", sub_id: int) -> None:
+        """
+        Unregister a subscription
+        :param key: Canonical key of the request dictonary
+        :param subscriber: Subscription protocol of the connection
+        :param sub_id: ID of the subscription
+        """
+        with self.__lock:
+            subscribers: dict["SubscriptionProtocol", set[int]] = self.__index.get(key, {})
+            subscribers.get(subscriber, set()).discard(sub_id)
+
+            if not subscribers.get(subscriber, True):
+                subscribers.pop(subscriber)
+            if not subscribers:
+                self.__index.pop(key, None)
+                self.__versions.pop(key, None)
+
+    def subscribers(self, req_dict: DATAUNIT) -> dict["SubscriptionProtocol", frozenset[int]]:
+        """
+        Get all subscriptions of a request dictonary
+        :param req_dict: Same dictonary as a normal request to use
+        :return: Subscription IDs for every subscribed connection
+        """
+        with self.__lock:
+            return {
+                subscriber: frozenset(sub_ids)
+                for subscriber, sub_ids in self.__index.get(canonical_key(req_dict), {}).items()
+            }
+
+    def publish(self, req_dict: DATAUNIT, value: DATAUNIT) -> BroadcastStats:
+        """
+        Send a new value to all subscriptions of the request dictonary
+        The value is serialized once per codec and reused for all connections,
+        only the envelope and the encryption are done for every connection
+        :param req_dict: Same dictonary as a normal request to use
+        :param value: New value
+        :return: Number of connections and subscriptions reached, serializations of the value and fan-out time
+        """
+        return self.__broadcast(req_dict, value, invalid=False)
+
+    def invalidate(self, req_dict: DATAUNIT) -> BroadcastStats:
+        """
+        Tell all subscribers of the request dictonary that their cached value is outdated
+        :param req_dict: Same dictonary as a normal request to use
+        :return: Number of connections and subscriptions reached, serializations and fan-out time
+        """
+        return self.__broadcast(req_dict, None, invalid=True)
+
+    def __broadcast(self, req_dict: DATAUNIT, value: DATAUNIT, invalid: bool) -> BroadcastStats:
+        """
+        Send a value or an invalidation to all subscriptions of the request dictonary
+        :param req_dict: Same dictonary as a normal request to use
+        :param value: New value
+        :param invalid: Whether it's an invalidation
+        :return: Number of connections and subscriptions reached, serializations and fan-out time
+        """
+        start: float = perf_counter()
+        key: str = canonical_key(req_dict)
+        with self.__lock:
+            subscribers: dict["SubscriptionProtocol", frozenset[int]] = {
+                subscriber: frozenset(sub_ids) for subscriber, sub_ids in self.__index.get(key, {}).items()
+            }
+            # every published value of a key gets a sequence number, connections that last got the same
+            # version get the same delta and share its serialization
+            version: int = self.__versions.get(key, 0) + 1
+            if subscribers:
+                self.__versions[key] = version
+        prepared: dict[str, RAW_MESSAGE] = {}
+
+        for subscriber, sub_ids in subscribers.items():
+            subscriber.send_subscriptions(sub_ids, value, prepared, invalid=invalid, version=version)
+
+        return {
+            "connections": len(subscribers),
+            "subscriptions": sum(len(sub_ids) for sub_ids in subscribers.values()),
+            "encodings": len(prepared),
+            "duration": perf_counter() - start
+        }
+
+    def __len__(self) -> int:
+        """
+        :return: Number of different subscribed request dictonaries
+        """
+        return len(self.__index)
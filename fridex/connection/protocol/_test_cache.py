@@ -0,0 +1,85 @@
+"""
+fridex/connection/protocol/_test_cache.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from time import sleep
+import unittest
+
+from ._cache import Cache, CacheStats
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class CacheTest(unittest.TestCase):
+    """
+    Test LRU / TTL cache
+    """
+    def test_dict_keys(self) -> None:
+        """
+        Test request dictonaries as keys (independent of key order)
+        """
+        cache: Cache = Cache()
+        cache.set({"room": 1, "sensor": "temp"}, {"value": 21})
+
+        self.assertEqual(cache.get({"sensor": "temp", "room": 1}), {"value": 21})
+        self.assertIsNone(cache.get({"sensor": "temp", "room": 2}))
+
+        cache.delete({"room": 1, "sensor": "temp"})
+        self.assertIsNone(cache.get({"room": 1, "sensor": "temp"}))
+
+    def test_lru(self) -> None:
+        """
+        Test that the least recently used entry is evicted
+        """
+        cache: Cache = Cache(capacity=2)
+        cache.set({"key": 1}, 1)
+        cache.set({"key": 2}, 2)
+        cache.get({"key": 1})
+        cache.set({"key": 3}, 3)
+
+        self.assertEqual(cache.get({"key": 1}), 1)
+        self.assertIsNone(cache.get({"key": 2}))
+        self.assertEqual(cache.get({"key": 3}), 3)
+
+        stats: CacheStats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["size"]), (3, 1, 1, 2))
+
+    def test_lifetime(self) -> None:
+        """
+        Test expiry of unused entries and lease renewal on use
+        """
+        cache: Cache = Cache(lifetime=0.2)
+        cache.set({"key": 1}, 1)
+        cache.set({"key": 2}, 2)
+
+        for _ in range(3):
+            sleep(0.1)
+            self.assertEqual(cache.get({"key": 1}), 1)
+
+        self.assertIsNone(cache.get({"key": 2}))
+        self.assertEqual(cache.stats()["expirations"], 1)
+        self.assertEqual(len(cache), 1)
+
+    def test_lease_compaction(self) -> None:
+        """
+        Test that leases renewed while the expiry heap is rebuilt still expire
+        """
+        cache: Cache = Cache(lifetime=0.2)
+        cache.set({"key": 1}, 1)
+
+        for _ in range(66):
+            self.assertEqual(cache.get({"key": 1}), 1)
+
+        sleep(0.5)
+        self.assertIsNone(cache.get({"key": 1}))
+        self.assertEqual(cache.stats()["expirations"], 1)
@@ -0,0 +1,73 @@
+"""
+fridex/connection/protocol/_test_codec.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+import unittest
+
+from ._codec import CodecService, CODECS
+from ._types import BulkDict
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class CodecTest(unittest.TestCase):
+    """
+    Test all available codecs
+    """
+    message: BulkDict = {
+        "time": 1686607200.5,
+        "kind": "data",
+        "direction": "response",
+        "data": [{"time": 1686607200.5, "id": 3, "data": {"temp": 21.5, "ok": True, "none": None, "list": [1, 2]}}]
+    }
+
+    def round_trip(self, codec: CODECS) -> None:
+        """
+        Encode with a codec and decode after detecting it
+        :param codec: Codec to test
+        """
+        encoded = CodecService.new_codec(codec).encode(self.message)
+        raw: bytes = encoded.encode("UTF-8") if isinstance(encoded, str) else encoded
+
+        self.assertEqual(CodecService.detect(raw).name, codec)
+        self.assertEqual(CodecService.detect(memoryview(raw)).decode(memoryview(raw)), self.message)
+
+    def test_json(self) -> None:
+        """
+        Test default json codec
+        """
+        self.round_trip("json")
+
+    @unittest.skipUnless("msgpack" in CodecService.available(), "msgpack is not installed")
+    def test_msgpack(self) -> None:
+        """
+        Test binary msgpack codec
+        """
+        self.round_trip("msgpack")
+
+    def test_prepared(self) -> None:
+        """
+        Test splicing an already encoded value into a message
+        """
+        for codec in CodecService.available():
+            encoder = CodecService.new_codec(codec)
+            encoded = encoder.encode_prepared(self.message, encoder.encode_value(self.message["data"][0]["data"]))
+            raw: bytes = encoded.encode("UTF-8") if isinstance(encoded, str) else encoded
+
+            self.assertEqual(encoder.decode(raw), self.message)
+
+    def test_unavailable(self) -> None:
+        """
+        Test requesting an unknown codec
+        """
+        self.assertRaises(ValueError, lambda: CodecService.new_codec("xml"))  # noqa
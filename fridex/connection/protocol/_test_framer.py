@@ -0,0 +1,101 @@
+"""
+fridex/connection/protocol/_test_framer.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+import unittest
+import socket
+
+from ._framer import StreamFramer
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+def frame(payload: bytes, header_size: int = 4) -> bytes:
+    """
+    Build a length-prefixed frame
+    :param payload: Frame content
+    :param header_size: Bytes of the length header
+    :return: Header and payload
+    """
+    return len(payload).to_bytes(length=header_size, byteorder="big") + payload
+
+
+class StreamFramerTest(unittest.TestCase):
+    """
+    Test StreamFramer
+    """
+    framer: StreamFramer
+
+    def setUp(self) -> None:
+        """
+        Create a small framer so growing and compacting are used
+        """
+        self.framer = StreamFramer(buffer_size=16, header_size=4)
+
+    def collect(self) -> list[bytes]:
+        """
+        :return: All complete frames as bytes
+        """
+        return [bytes(f) for f in self.framer.frames()]
+
+    def test_multiple_frames(self) -> None:
+        """
+        Test several frames arriving in one chunk
+        """
+        self.framer.feed(frame(b"a") + frame(b"bc") + frame(b""))
+
+        self.assertEqual(self.collect(), [b"a", b"bc", b""])
+        self.assertEqual(self.framer.pending, 0)
+
+    def test_partial_frames(self) -> None:
+        """
+        Test frames split at every possible position
+        """
+        data: bytes = frame(b"hello") + frame(b"world" * 10)
+
+        for split in range(len(data)):
+            self.framer.feed(data[:split])
+            result: list[bytes] = self.collect()
+            self.framer.feed(data[split:])
+            result += self.collect()
+
+            self.assertEqual(result, [b"hello", b"world" * 10])
+            self.assertEqual(self.framer.pending, 0)
+
+    def test_large_frame(self) -> None:
+        """
+        Test a frame much bigger than the initial buffer
+        """
+        payload: bytes = bytes(range(256)) * 64
+        data: bytes = frame(payload)
+
+        for i in range(0, len(data), 1000):
+            self.framer.feed(data[i:i + 1000])
+
+        self.assertEqual(self.collect(), [payload])
+
+    def test_recv_into(self) -> None:
+        """
+        Test receiving directly from a socket
+        """
+        left, right = socket.socketpair()
+        try:
+            left.sendall(frame(b"x" * 100) + frame(b"y"))
+            left.close()
+
+            while self.framer.recv_into(right):
+                ...
+
+            self.assertEqual(self.collect(), [b"x" * 100, b"y"])
+        finally:
+            right.close()
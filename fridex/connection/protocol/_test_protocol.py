@@ -0,0 +1,146 @@
+"""
+fridex/connection/protocol/_test_protocol.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from concurrent.futures import Future, wait
+from typing import Callable, Any
+from threading import Timer
+from time import sleep
+import unittest
+
+from ._protocol import Protocol, InFlightLimitError
+from ._types import BulkDict, RAW_MESSAGE
+from ._codec import CodecService
+from ._data import DataProtocol, RequestError, DeadlineExceededError
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+def decode(message: RAW_MESSAGE) -> BulkDict:
+    """
+    :param message: Encoded message
+    :return: Decoded message
+    """
+    raw: bytes = message.encode("UTF-8") if isinstance(message, str) else message
+    return CodecService.detect(raw).decode(raw)
+
+
+class ProtocolIdTest(unittest.TestCase):
+    """
+    Test allocation of message ids
+    """
+    def test_wrap_around(self) -> None:
+        """
+        Test that ids in use are skipped when the ids wrap around
+        """
+        in_use: set[int] = set()
+        protocol: Protocol = Protocol("data", range(0, 4), in_use_callback=in_use.__contains__)
+
+        in_use.update(protocol.request_add(i) for i in range(3))
+        self.assertEqual(in_use, {0, 1, 2})
+
+        in_use.discard(1)
+        self.assertEqual([protocol.request_add(i) for i in range(2)], [3, 1])
+        in_use.update({1, 3})
+        self.assertRaises(InFlightLimitError, protocol.request_add, 5)
+
+    def test_response_id_zero(self) -> None:
+        """
+        Test that responding to id 0 doesn't use up a request id
+        """
+        protocol: Protocol = Protocol("data", range(0, 100))
+
+        protocol.response_add("answer", 0)
+        self.assertEqual(decode(protocol.response_get())["data"][0]["id"], 0)
+        self.assertEqual(protocol.request_add("request"), 0)
+
+    def test_data_in_flight(self) -> None:
+        """
+        Test the in flight limit of data requests and that answered ids are free again
+        """
+        protocol: DataProtocol = DataProtocol(range(0, 2 ** 32), lambda a: a, lambda a: a, send_callback=lambda _: None,
+                                              max_in_flight=2)
+        self.assertEqual(protocol.max_in_flight, 2)
+
+        protocol.request_start()
+        futures: list[Future] = [protocol.request_add(i) for i in range(2)]
+        self.assertRaises(InFlightLimitError, protocol.request_add, 2)
+        self.assertEqual(protocol.in_flight, 2)
+
+        protocol.process_response({"time": 0, "kind": "data", "direction": "response",
+                                   "data": [{"time": 0, "id": 0, "data": {"value": 0}}]})
+        self.assertEqual(futures[0].result(timeout=1), {"value": 0})
+        self.assertEqual(protocol.in_flight, 1)
+        protocol.request_add(2)
+
+        self.assertRaises(InFlightLimitError, protocol.refetch, 3)
+        self.assertRaises(InFlightLimitError, protocol.request_add_many, [3])
+
+    def test_deadlines(self) -> None:
+        """
+        Test that deadlines share one scheduled check instead of one timer per request
+        """
+        scheduled: list[float] = []
+
+        def schedule(delay: float, callback: Callable[[], Any]) -> None:
+            scheduled.append(delay)
+            Timer(delay, callback).start()
+
+        protocol: DataProtocol = DataProtocol(range(0, 2 ** 32), lambda a: a, lambda a: a, schedule_callback=schedule)
+        protocol.request_start()
+        futures: list[Future] = [protocol.request_add(i, timeout=0.2 + i / 1000) for i in range(50)]
+        answered: Future = protocol.request_add(50, timeout=0.1)
+        answered.cancel()
+
+        wait(futures, timeout=2)
+        self.assertTrue(all(isinstance(future.exception(), DeadlineExceededError) for future in futures))
+        self.assertLess(len(scheduled), 10)
+        self.assertEqual(protocol.in_flight, 0)
+
+    def test_inline_deadline(self) -> None:
+        """
+        Test that inline requests are answered with an error once their deadline passed while processing
+        or while earlier requests of the same message were processed
+        """
+        def handle(duration: float) -> float:
+            sleep(duration)
+            return duration
+
+        protocol: DataProtocol = DataProtocol(range(0, 2 ** 32), handle, lambda a: a)
+        response: BulkDict = decode(protocol.process_request({
+            "time": 0, "kind": "data", "direction": "request",
+            "data": [{"time": 0, "id": 0, "data": 0.3, "timeout": 0.1},
+                     {"time": 0, "id": 1, "data": 0, "timeout": 0.2},
+                     {"time": 0, "id": 2, "data": 0}]
+        }))
+
+        self.assertEqual([sub.get("error", "").split(":")[0] for sub in response["data"]],
+                         ["DeadlineExceededError", "DeadlineExceededError", ""])
+        self.assertEqual(response["data"][2]["data"], 0)
+
+    def test_invalid_json_response(self) -> None:
+        """
+        Test that a string response that isn't json only fails its own request
+        """
+        protocol: DataProtocol = DataProtocol(range(0, 2 ** 32), lambda a: a, lambda a: a)
+        protocol.request_start()
+        plain: Future = protocol.request_add("x")
+        encoded: Future = protocol.request_add("y")
+        ids: list[int] = [sub["id"] for sub in decode(protocol.request_get())["data"]]
+
+        protocol.process_response({"time": 0, "kind": "data", "direction": "response",
+                                   "data": [{"time": 0, "id": ids[0], "data": "ok"},
+                                            {"time": 0, "id": ids[1], "data": '{"value": 1}'}]})
+
+        self.assertRaises(RequestError, plain.result, timeout=1)
+        self.assertEqual(encoded.result(timeout=1), {"value": 1})
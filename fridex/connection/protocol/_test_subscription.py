@@ -0,0 +1,219 @@
+"""
+fridex/connection/protocol/_test_subscription.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import Timer
+from time import sleep
+import unittest
+
+from ._subscription import SubscriptionProtocol
+from ._types import BulkDict, RAW_MESSAGE, DATAUNIT
+from ._codec import CodecService
+from ._cache import Cache
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+def decode(message: RAW_MESSAGE) -> BulkDict:
+    """
+    :param message: Encoded message
+    :return: Decoded message
+    """
+    raw: bytes = message.encode("UTF-8") if isinstance(message, str) else message
+    return CodecService.detect(raw).decode(raw)
+
+
+class SubscriptionDeltaTest(unittest.TestCase):
+    """
+    Test delta encoded subscription updates between a server and a client protocol
+    """
+    server: SubscriptionProtocol
+    client: SubscriptionProtocol
+    cache: Cache
+    sent: list[BulkDict]
+    received: list[DATAUNIT]
+
+    def setUp(self) -> None:
+        """
+        Connect a server and a client subscription protocol directly
+        """
+        self.sent = []
+        self.received = []
+        self.cache = Cache()
+
+        self.client = SubscriptionProtocol(range(3000, 3999), ThreadPoolExecutor(max_workers=1), None, None, None,
+                                           cache=self.cache)
+        self.server = SubscriptionProtocol(range(3000, 3999), ThreadPoolExecutor(max_workers=1), None, None,
+                                           self.deliver, delta_updates=3)
+
+        self.server.process_request(decode(self.client.add_subscription(self.received.append, {"room": 1})[1]))
+
+    def deliver(self, message: RAW_MESSAGE) -> None:
+        """
+        Send a message from the server to the client
+        :param message: Encoded message
+        """
+        self.sent.append(decode(message))
+        self.client.process_response(self.sent[-1])
+
+    def test_delta(self) -> None:
+        """
+        Test that only changes are sent and the client still gets full values
+        """
+        values: list[DATAUNIT] = [
+            {"temp": 20, "hum": 40, "co2": 400, "name": "kitchen"},
+            {"temp": 21, "hum": 40, "co2": 400, "name": "kitchen"},
+            {"temp": 21, "hum": 41, "name": "kitchen"},
+            {"temp": 22, "hum": 41, "name": "kitchen"}
+        ]
+        for value in values:
+            self.server.provide_data({"room": 1}, value)
+
+        self.assertEqual([bool(message["data"][0].get("delta")) for message in self.sent], [False, True, True, False])
+        self.assertEqual(self.sent[1]["data"][0]["data"], {"set": {"temp": 21}, "delete": []})
+        self.assertEqual(self.sent[2]["data"][0]["data"], {"set": {"hum": 41}, "delete": ["co2"]})
+
+        self.assertEqual(self.cache.get({"room": 1}), values[-1])
+
+    def test_mutated_value(self) -> None:
+        """
+        Test that changing the same dictonary in place and providing it again still sends the changes
+        """
+        state: DATAUNIT = {"temp": 20, "hum": 40, "co2": 400, "levels": {"a": 1, "b": 2}}
+        self.server.provide_data({"room": 1}, state)
+
+        state["temp"] = 21
+        self.server.provide_data({"room": 1}, state)
+        self.assertEqual(self.sent[1]["data"][0]["data"], {"set": {"temp": 21}, "delete": []})
+
+        state["levels"]["a"] = 3
+        self.server.provide_data({"room": 1}, state)
+        self.assertEqual(self.sent[2]["data"][0]["data"], {"set": {"levels": {"a": 3, "b": 2}}, "delete": []})
+
+        self.assertEqual(self.cache.get({"room": 1}), {"temp": 21, "hum": 40, "co2": 400, "levels": {"a": 3, "b": 2}})
+
+    def test_int_keys(self) -> None:
+        """
+        Test that values with keys that aren't strings are sent fully (the codec may change the keys)
+        """
+        self.server.provide_data({"room": 1}, {i: i for i in range(10)})
+        self.server.provide_data({"room": 1}, {i: i for i in range(1, 10)})
+
+        self.assertFalse(any(message["data"][0].get("delta") for message in self.sent))
+        self.assertEqual(len(self.cache.get({"room": 1})), 9)
+
+    def test_not_worth_it(self) -> None:
+        """
+        Test that values are sent fully if everything changed
+        """
+        self.server.provide_data({"room": 1}, {"temp": 20})
+        self.server.provide_data({"room": 1}, {"temp": 21})
+        self.server.provide_data({"room": 1}, 5)
+
+        self.assertFalse(any(message["data"][0].get("delta") for message in self.sent))
+        self.assertEqual(self.cache.get({"room": 1}), 5)
+
+
+class SubscriptionConflationTest(unittest.TestCase):
+    """
+    Test rate limited and windowed subscriptions
+    """
+    server: SubscriptionProtocol
+    client: SubscriptionProtocol
+    sent: list[BulkDict]
+
+    def setUp(self) -> None:
+        """
+        Connect a server and a client subscription protocol directly
+        """
+        self.sent = []
+        self.client = SubscriptionProtocol(range(3000, 3999), ThreadPoolExecutor(max_workers=1), None, None, None)
+        self.server = SubscriptionProtocol(range(3000, 3999), ThreadPoolExecutor(max_workers=1), None, None,
+                                           lambda message: self.sent.append(decode(message)),
+                                           schedule_callback=lambda delay, callback: Timer(delay, callback).start())
+
+    def values(self, sub_id: int) -> list[DATAUNIT]:
+        """
+        :param sub_id: ID of the subscription
+        :return: All values sent for the subscription
+        """
+        return [sub["data"] for message in self.sent for sub in message["data"] if sub["id"] == sub_id]
+
+    def test_window(self) -> None:
+        """
+        Test that only the newest value of a window is sent
+        """
+        sub_id, message = self.client.add_subscription(lambda _: None, {"room": 1}, window=0.2)
+        plain_id, plain = self.client.add_subscription(lambda _: None, {"room": 1})
+        self.server.process_request(decode(message))
+        self.server.process_request(decode(plain))
+
+        for i in range(100):
+            self.server.provide_data({"room": 1}, {"value": i})
+        sleep(0.4)
+
+        self.assertEqual(self.values(sub_id), [{"value": 99}])
+        self.assertEqual(len(self.values(plain_id)), 100)
+
+    def test_max_rate(self) -> None:
+        """
+        Test that the first value is sent immediately and the newest one after the interval
+        """
+        sub_id, message = self.client.add_subscription(lambda _: None, {"room": 1}, max_rate=5)
+        self.server.process_request(decode(message))
+
+        for i in range(100):
+            self.server.provide_data({"room": 1}, {"value": i})
+        self.assertEqual(self.values(sub_id), [{"value": 0}])
+
+        sleep(0.4)
+        self.assertEqual(self.values(sub_id), [{"value": 0}, {"value": 99}])
+
+    def test_slow_callback(self) -> None:
+        """
+        Test that a slow conflated callback only gets the newest value
+        """
+        received: list[DATAUNIT] = []
+
+        def slow(value: DATAUNIT) -> None:
+            sleep(0.1)
+            received.append(value)
+
+        sub_id, _ = self.client.add_subscription(slow, {"room": 1}, max_rate=1000)
+        for i in range(20):
+            self.client.process_response({"time": 0, "kind": "sub", "direction": "response",
+                                          "data": [{"time": 0, "id": sub_id, "data": i}]})
+        sleep(0.4)
+
+        self.assertEqual(received, [0, 19])
+
+    def test_callback_order(self) -> None:
+        """
+        Test that the values of a subscription are passed one after another in order on a ThreadPool with many workers
+        """
+        received: list[DATAUNIT] = []
+        client: SubscriptionProtocol = SubscriptionProtocol(range(3000, 3999), ThreadPoolExecutor(max_workers=8),
+                                                            None, None, None)
+
+        def record(value: DATAUNIT) -> None:
+            sleep(0.01 if value % 2 else 0)
+            received.append(value)
+
+        sub_id, _ = client.add_subscription(record, {"room": 1})
+        for i in range(40):
+            client.process_response({"time": 0, "kind": "sub", "direction": "response",
+                                     "data": [{"time": 0, "id": sub_id, "data": i}]})
+        sleep(0.6)
+
+        self.assertEqual(received, list(range(40)))
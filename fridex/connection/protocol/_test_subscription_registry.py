@@ -0,0 +1,114 @@
+"""
+fridex/connection/protocol/_test_subscription_registry.py
+
+Project: Fridrich-Connection
+Created: 17.10.2026
+Author: Lukas Krahbichler
+"""
+
+##################################################
+#                    Imports                     #
+##################################################
+
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from ._subscription_registry import SubscriptionRegistry, BroadcastStats, canonical_key
+from ._subscription import SubscriptionProtocol
+from ._types import BulkDict, RAW_MESSAGE, DATAUNIT
+from ._codec import CodecService
+
+
+##################################################
+#                     Code                       #
+##################################################
+
+class SubscriptionRegistryTest(unittest.TestCase):
+    """
+    Test server-wide subscription index
+    """
+    registry: SubscriptionRegistry
+    sent: list[list[RAW_MESSAGE]]
+    protocols: list[SubscriptionProtocol]
+
+    def setUp(self) -> None:
+        """
+        Create a registry with two connections
+        """
+        self.registry = SubscriptionRegistry()
+        self.sent = [[], []]
+        self.protocols = [
+            SubscriptionProtocol(range(3000, 3999), ThreadPoolExecutor(max_workers=1), None, None,
+                                 sent.append, registry=self.registry)
+            for sent in self.sent
+        ]
+
+    def subscribe(self, protocol: SubscriptionProtocol, sub_id: int, req_dict: DATAUNIT) -> None:
+        """
+        Simulate an add subscription request of a client
+        :param protocol: Connection the request comes in on
+        :param sub_id: ID of the subscription
+        :param req_dict: Subscribed request dictonary
+        """
+        protocol.process_request({"time": 0, "kind": "sub", "direction": "request",
+                                  "data": [{"time": 0, "id": sub_id, "data": {"action": "add", "value": req_dict}}]})
+
+    def received(self, index: int) -> list[tuple[int, DATAUNIT]]:
+        """
+        :param index: Index of the connection
+        :return: Subscription IDs and values sent to the connection
+        """
+        messages: list[BulkDict] = [CodecService.new_codec().decode(message.encode("UTF-8"))
+                                    for message in self.sent[index]]
+        return [(sub["id"], sub["data"]) for message in messages for sub in message["data"]]
+
+    def test_canonical_key(self) -> None:
+        """
+        Test key order independence
+        """
+        self.assertEqual(canonical_key({"a": 1, "b": [1, 2]}), canonical_key({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(canonical_key({"a": 1}), canonical_key({"a": 2}))
+
+    def test_publish(self) -> None:
+        """
+        Test that only matching subscriptions get the value
+        """
+        self.subscribe(self.protocols[0], 3000, {"room": 1, "sensor": "temp"})
+        self.subscribe(self.protocols[0], 3001, {"sensor": "temp", "room": 1})
+        self.subscribe(self.protocols[1], 3000, {"room": 2, "sensor": "temp"})
+
+        stats: BroadcastStats = self.registry.publish({"sensor": "temp", "room": 1}, {"value": 21})
+        self.assertEqual((stats["connections"], stats["subscriptions"], stats["encodings"]), (1, 2, 1))
+
+        self.assertEqual(len(self.sent[0]), 1)
+        self.assertEqual(sorted(self.received(0)), [(3000, {"value": 21}), (3001, {"value": 21})])
+        self.assertEqual(self.sent[1], [])
+
+    def test_serialize_once(self) -> None:
+        """
+        Test that the value is serialized once for all connections
+        """
+        for protocol in self.protocols:
+            self.subscribe(protocol, 3000, {"room": 1})
+
+        stats: BroadcastStats = self.registry.publish({"room": 1}, {"value": [1, 2, 3]})
+
+        self.assertEqual((stats["connections"], stats["encodings"]), (2, 1))
+        self.assertEqual(self.received(0), [(3000, {"value": [1, 2, 3]})])
+        self.assertEqual(self.received(1), [(3000, {"value": [1, 2, 3]})])
+
+    def test_unsubscribe(self) -> None:
+        """
+        Test delete requests and dropping a closed connection
+        """
+        self.subscribe(self.protocols[0], 3000, {"room": 1})
+        self.subscribe(self.protocols[1], 3000, {"room": 1})
+
+        self.protocols[0].process_request({"time": 0, "kind": "sub", "direction": "request",
+                                           "data": [{"time": 0, "id": 3001,
+                                                     "data": {"action": "delete", "value": 3000}}]})
+        self.assertEqual(list(self.registry.subscribers({"room": 1})), [self.protocols[1]])
+
+        self.protocols[1].clear()
+        self.assertEqual(self.registry.publish({"room": 1}, {"value": 1})["connections"], 0)
+        self.assertEqual(len(self.registry), 0)
@@ -10,7 +10,7 @@ Author: Lukas Krahbichler
 #                    Imports                     #
 ##################################################
 
-from typing import TypedDict, Literal
+from typing import TypedDict, Literal, NotRequired
 
 
 ##################################################
@@ -22,6 +22,9 @@ KINDS = Literal["data", "sub", "con", "com"]
 DIRECTIONS = Literal["request", "response"]
 DATAUNIT = dict[str | int | float | bool | None, any]
 
+# Encoded message that is ready to send (str for text codecs, bytes for binary codecs)
+RAW_MESSAGE = str | bytes
+
 
 class _Dict(TypedDict):
     """
@@ -36,6 +39,11 @@ class MessageDict(_Dict):
     """
     id: int
     data: DATAUNIT
+    error: NotRequired[str]
+    timeout: NotRequired[float]
+    invalid: NotRequired[bool]
+    delta: NotRequired[bool]
+    cancel: NotRequired[bool]
 
 
 class BulkDict(_Dict):
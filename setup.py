@@ -38,6 +38,7 @@ setup(
     ],
     keyword="dashboard, voting, connection",
     packages=find_packages(),
+    extras_require={"msgpack": ["msgpack>=1.0"]},
     namespace_packages=['fridex'],
     python_requires=">=3.11"
 )